@@ -4,7 +4,6 @@ import json
 import zipfile
 import igc_lib
 import igc2geojson
-import numpy as np
 import zipfile
 import ntpath
 
@@ -26,6 +25,13 @@ from DumpFileName import DumpFileName
 from FtpHelper import FtpHelper
 
 
+class TrackParsingConfig(igc_lib.FlightParsingConfig):
+    # Flights shorter than 45 min are not drawn: reject them while parsing
+    min_flight_duration = 45 * 60
+    # Only the track, takeoff and landing are drawn: skip thermal detection
+    analysis_profile = "flight_detection"
+
+
 class DailyCumulativeTrackBuilder:
 
     @property
@@ -54,7 +60,10 @@ class DailyCumulativeTrackBuilder:
     # --- Geo information ---41.196834, 10.328174
     FRANCE_BOUNDING_BOX = [(-6.566734, 51.722775), (10.645924,51.726922), (10.328174, 41.196834), (-7.213631, 40.847787)]
 
-    def __init__(self, ftpServerCredentials, target_date, fileList=None, isOutToLocalFiles=False):
+    # --- Reduce number of fixes, while parsing ---
+    TRACK_DECIMATION = igc_lib.DecimationPolicy(every=4)
+
+    def __init__(self, ftpServerCredentials, target_date, fileList=None, isOutToLocalFiles=False, flightCache=None):
         self.metaData = RunMetadataTracks(target_date)
         self.ftpServerCredentials = ftpServerCredentials
         self.ftpClientOut = None
@@ -64,6 +73,7 @@ class DailyCumulativeTrackBuilder:
 
         self.fileList = fileList
         self.flightsCount = None
+        self.flightCache = flightCache          # Optional igc_lib.FlightCache
 
         self.franceBoundingBox = Polygon(self.FRANCE_BOUNDING_BOX)
 
@@ -106,11 +116,19 @@ class DailyCumulativeTrackBuilder:
         # --- Process files to get flights
         if self.fileList:
             for i, filename in enumerate(self.fileList):
-                file_as_bytesio = self.storageService.GetFileAsString(filename)
-
-                flight = igc_lib.Flight.create_from_bytesio(file_as_bytesio)
-                file_as_bytesio.close
-                del file_as_bytesio
+                if self.flightCache:
+                    # The cache key is the hash of the whole file: download it
+                    file_as_bytesio = self.storageService.GetFileAsString(filename)
+                    flight = self.flightCache.create_from_bytesio(file_as_bytesio, TrackParsingConfig, decimation=self.TRACK_DECIMATION)
+                    file_as_bytesio.close()
+                    del file_as_bytesio
+                else:
+                    # Parse while downloading
+                    with self.storageService.OpenFile(filename) as igc_stream:
+                        flight = igc_lib.Flight.create_from_source(igc_stream, TrackParsingConfig, decimation=self.TRACK_DECIMATION)
+
+                if not flight.valid:
+                    self.metaData.addRejectedFlight(flight.rejected_by)
 
                 if flight.date_timestamp:
                     flight_date = datetime.fromtimestamp(flight.date_timestamp).date()
@@ -138,11 +156,8 @@ class DailyCumulativeTrackBuilder:
         # --- Inside France detection ---
         isInsindeFrance = True
         if self.IncludeFranceOnly:
-            lons = np.vectorize(lambda f: f.lon)
-            lats = np.vectorize(lambda f: f.lat)
-
-            longitudes = lons(flight.fixes)
-            latitudes = lats(flight.fixes)
+            longitudes = flight.fixes.column('lon')
+            latitudes = flight.fixes.column('lat')
             # Remove points
             longitudes = longitudes[::50]
             latitudes = latitudes[::50]
@@ -154,20 +169,11 @@ class DailyCumulativeTrackBuilder:
             flightLineString = LineString(flightPoints)
             isInsindeFrance = self.franceBoundingBox.contains(flightLineString)
 
-            del lons
-            del lats
             del longitudes
             del latitudes
             del flightPoints
             del flightLineString
 
-        # --- Reduce number of fixes ---
-        fixes = np.array(flight.fixes)
-        del flight.fixes
-
-        fixes = fixes[::4]
-        flight.fixes = fixes.tolist()
-
         # ----- Filter -----
         # Check that the flight time is > 45 min
         isDurationOk = flight.duration/60 >= 45
@@ -24,6 +24,11 @@ from DumpFileName import HeatmapDumpFileName
 from FtpHelper import FtpHelper
 
 
+class ThermalParsingConfig(igc_lib.FlightParsingConfig):
+    # Only the thermals are used: skip keeping the B record extensions
+    analysis_profile = "thermals"
+
+
 class HeatmapBuilder:
 
     @property
@@ -40,7 +45,7 @@ class HeatmapBuilder:
     HEATMAP_GEOJSON_FILE_NAME = "{0}-heatmap.geojson"
 
 
-    def __init__(self, ftpServerCredentials, target_date, fileList):
+    def __init__(self, ftpServerCredentials, target_date, fileList, flightCache=None):
         self.metaData = RunMetadata(target_date)
         self.ftpServerCredentials = ftpServerCredentials
         self.ftpClientOut = None
@@ -53,26 +58,31 @@ class HeatmapBuilder:
         self.fileList = fileList
         self.flightsCount = len(self.fileList)
         self.global_thermals = []
+        self.flightCache = flightCache          # Optional igc_lib.FlightCache
 
     def run(self):
          # --- Process files to get flights
         if self.fileList:
             for i, filename in enumerate(self.fileList):
-                file_as_bytesio = self.storageService.GetFileAsString(filename)
-
-                flight = igc_lib.Flight.create_from_bytesio(file_as_bytesio)
-                file_as_bytesio.close
-                del file_as_bytesio
+                if self.flightCache:
+                    # The cache key is the hash of the whole file: download it
+                    file_as_bytesio = self.storageService.GetFileAsString(filename)
+                    flight = self.flightCache.create_from_bytesio(file_as_bytesio, ThermalParsingConfig)
+                    file_as_bytesio.close()
+                    del file_as_bytesio
+                else:
+                    # Parse while downloading
+                    with self.storageService.OpenFile(filename) as igc_stream:
+                        flight = igc_lib.Flight.create_from_source(igc_stream, ThermalParsingConfig)
 
                 if flight.valid:
                     self.flightsCount += 1
-                    for t in flight.thermals:
-                        t.exit_fix.flight = None
-                        t.enter_fix.flight = None
-                    self.global_thermals.extend(flight.thermals)
+                    self.global_thermals.extend(
+                        t.detach() for t in flight.thermals)
                     print(f"{i+1}/{len(self.fileList)} :{filename} -> Thermals#={len(flight.thermals)}")
                 else:
-                    print(f"{i+1}/{len(self.fileList)} :{filename} -> Discarded ! valid={flight.valid} date={self.str_target_date}")
+                    self.metaData.addRejectedFlight(flight.rejected_by)
+                    print(f"{i+1}/{len(self.fileList)} :{filename} -> Discarded ! valid={flight.valid} rejected_by={flight.rejected_by} date={self.str_target_date}")
                 del flight
 
             # Metadata
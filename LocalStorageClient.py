@@ -0,0 +1,107 @@
+import os
+import shutil
+
+
+class LocalStorageClient(object):
+    """
+    Stand-in for google.cloud.storage.Client, backed by a local directory
+
+    Buckets are sub-directories of the root directory, blobs are files.
+    Implements the part of the client API used by StorageService, so that
+    it can run without GCP credentials:
+        storageService = StorageService(target_date, storage_client=LocalStorageClient(root))
+    """
+
+    def __init__(self, root_directory, read_delay=None):
+        '''
+        Keyword arguments:
+        root_directory -- the directory holding one directory per bucket
+        read_delay -- a function called before each blob read, optional (e.g. to simulate network latency)
+        '''
+        self.root_directory = root_directory
+        self.read_delay = read_delay
+
+    def bucket(self, bucket_name):
+        return LocalBucket(self, bucket_name)
+
+    def list_blobs(self, bucket_name, prefix=None, fields=None):
+        bucket = self.bucket(bucket_name)
+        names = []
+        for directory, _, filenames in os.walk(bucket.directory):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                names.append(os.path.relpath(path, bucket.directory).replace(os.sep, "/"))
+        names.sort()
+        return [bucket.blob(name) for name in names if prefix is None or name.startswith(prefix)]
+
+
+class LocalBucket(object):
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.directory = os.path.join(client.root_directory, name)
+
+    def blob(self, blob_name):
+        return LocalBlob(self, blob_name)
+
+    def delete_blobs(self, blobs):
+        for blob in blobs:
+            name = blob if isinstance(blob, str) else blob.name
+            os.remove(self.blob(name).path)
+
+
+class LocalBlob(object):
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.path = os.path.join(bucket.directory, *name.split("/"))
+
+    def open(self, mode="rb", chunk_size=None):
+        '''
+        Opens the blob for reading, as Blob.open() does (mode 'rb' only)
+        '''
+        if mode != "rb":
+            raise ValueError(f"Unsupported mode: {mode}")
+        return _LocalBlobReader(open(self.path, "rb"), self.bucket.client.read_delay)
+
+    def download_to_file(self, file_obj):
+        with self.open() as blob_file:
+            shutil.copyfileobj(blob_file, file_obj)
+
+    def upload_from_file(self, file_obj, rewind=False):
+        if rewind:
+            file_obj.seek(0)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "wb") as blob_file:
+            shutil.copyfileobj(file_obj, blob_file)
+
+    def upload_from_string(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "wb") as blob_file:
+            blob_file.write(data)
+
+
+class _LocalBlobReader(object):
+    """Reads a local blob file, calling read_delay before each read"""
+
+    def __init__(self, blob_file, read_delay):
+        self._file = blob_file
+        self._read_delay = read_delay
+
+    def read(self, size=-1):
+        if self._read_delay is not None:
+            self._read_delay()
+        return self._file.read(size)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
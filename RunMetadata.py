@@ -34,6 +34,7 @@ class RunMetadata(object):
         self.script_end_time = None
         self.flightsCount = 0
         self.processedFlightsCount = 0
+        self.rejectedFlightsCount = {}      # Validation stage -> count
         self.thermalsCount = 0
 
     def setEndTime(self, script_end_time):
@@ -41,6 +42,10 @@ class RunMetadata(object):
             self.endDate = str(script_end_time)
             self.duration = str(script_end_time - self.script_start_time)
 
+    def addRejectedFlight(self, stage):
+        """Counts a flight rejected at a validation stage (Flight.rejected_by)"""
+        self.rejectedFlightsCount[stage] = self.rejectedFlightsCount.get(stage, 0) + 1
+
     def toJSON(self):
         self.script_start_time = str(self.script_start_time)
         self.script_end_time = str(self.endDate)
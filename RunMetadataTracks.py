@@ -15,8 +15,13 @@ class RunMetadataTracks(object):
         
         self.flightsCount = 0
         self.processedFlightsCount = 0
+        self.rejectedFlightsCount = {}      # Validation stage -> count
 
 
+    def addRejectedFlight(self, stage):
+        """Counts a flight rejected at a validation stage (Flight.rejected_by)"""
+        self.rejectedFlightsCount[stage] = self.rejectedFlightsCount.get(stage, 0) + 1
+
     def toJSON(self):
         self.script_start_time = str(self.script_start_time)
         self.script_end_time = str(self.script_end_time)
@@ -3,6 +3,7 @@ from google.cloud import storage
 from io import BytesIO
 
 from HashHelper import HashHelper
+from lib.prefetch import PrefetchingReader
 
 class StorageService(object):
     """description of class"""
@@ -11,14 +12,20 @@ class StorageService(object):
     Trace_aggregator_backlog_folder_name = "backlog" 
     Trace_aggregator_alternative_source_bucket_name = "netcoupe-igc-source"
 
+    Stream_chunk_size = 256 * 1024      # Size of the ranged reads when streaming a blob
+    Stream_read_ahead_chunks = 4        # Chunks downloaded ahead of the parser
 
-    def __init__(self, target_date, bucket_name=None):
+    def __init__(self, target_date, bucket_name=None, storage_client=None):
+        '''
+        Keyword arguments:
+        storage_client -- a google.cloud.storage.Client, or a stand-in such as LocalStorageClient (default: a new Client)
+        '''
         if target_date:
             self.target_date = target_date = target_date.strftime('%Y_%m_%d') if not isinstance(target_date, str) else target_date
         else:
             self.target_date = None
         current_year = datetime.datetime.now().year
-        self.storage_client = storage.Client()
+        self.storage_client = storage_client if storage_client is not None else storage.Client()
         if bucket_name is None:
             self.bucket_name = f"netcoupe-igc-{current_year}"
         else:
@@ -81,6 +88,23 @@ class StorageService(object):
     def GetFileAsString(self, filename):
         return self.GetFileAsStringFromBucket(self.bucket_name, filename)
 
+    def OpenFileFromBucket(self, bucket_name, filename):
+        '''
+        Open a file of the GCP storage bucket for streaming
+
+        The file is downloaded in chunks of Stream_chunk_size, read ahead in a background thread
+        while the previous chunks are consumed (e.g. by igc_lib.Flight.create_from_source):
+        the file is never held whole in memory.
+        Returns a binary file-like object, to be closed
+        '''
+        bucket = self.storage_client.bucket(bucket_name)
+        blob = bucket.blob(filename)
+        return PrefetchingReader(blob.open("rb", chunk_size=self.Stream_chunk_size),
+                                 self.Stream_chunk_size, self.Stream_read_ahead_chunks)
+
+    def OpenFile(self, filename):
+        return self.OpenFileFromBucket(self.bucket_name, filename)
+
     def GetFileFullpathFromName(self, filename, filename_last_year = None):
         '''
         Get the file fullpath for a given filename
@@ -2,7 +2,8 @@
 
 Main abstraction defined in this file is the Flight class, which
 represents a parsed IGC file. A Flight is a collection of:
-    - GNNSFix objects, one per B record in the original file,
+    - GNNSFix objects, one per B record in the original file, stored
+      as columns of a FixStore (see lib/fixstore.py),
     - IGC metadata, extracted from A/I/H records
     - a list of detected Thermals,
     - a list of detected Glides.
@@ -15,6 +16,12 @@ If there's more than one actual flight in the IGC file then
 the `which_flight_to_pick` option in FlightParsingConfig
 will determine behavior.
 
+Live tracks, whose B records arrive over time, are analysed by the
+IncrementalFlight class, at a constant cost per new fix.
+
+Batches of files are parsed in worker processes by parse_in_processes(),
+flights come back through shared memory (see lib/sharedmem.py).
+
 For example usage see the attached igc_lib_demo.py file. Please note
 that after creating a Flight instance you should always check for its
 validity via the `Flight.valid` attribute prior to using it, as many
@@ -25,20 +32,39 @@ was considered broken.
 from __future__ import print_function
 
 import collections
+import collections.abc as collections_abc
+import copy
 import datetime
+import itertools
+import json
 import math
+import multiprocessing
+import os
+import pprint
 import re
 import xml.dom.minidom
+import numpy as np
+from multiprocessing import resource_tracker
 from pathlib2 import Path
 
 from collections import defaultdict
 
-from lib import viterbi, geo
+from lib import viterbi, geo, records, extensions, archives, cache, sharedmem
+from lib import baum_welch, segments
+from lib.decimation import DecimationPolicy
+from lib.fixstore import DERIVED_FIELDS, FixStore
+from lib.intervals import IntervalIndex
 
 from datetime import date, time, timedelta
 
 
 
+# Printable ASCII characters, from ' ' to '~'.
+_PRINTABLE_CHARS = frozenset(
+    "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKL"
+    "MNOPQRSTUVWXYZ!\"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~ ")
+
+
 def _strip_non_printable_chars(string):
     """Filters a string removing non-printable characters.
 
@@ -48,11 +74,10 @@ def _strip_non_printable_chars(string):
     Returns:
         A string, where non-printable characters are removed.
     """
-    printable = set("0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKL"
-                    "MNOPQRSTUVWXYZ!\"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~ ")
-
-    printable_string = [x for x in string if x in printable]
-    return ''.join(printable_string)
+    if string.isascii() and string.isprintable():
+        # The common case, nothing to remove.
+        return string
+    return ''.join([x for x in string if x in _PRINTABLE_CHARS])
 
 
 def _rawtime_float_to_hms(timef):
@@ -70,6 +95,46 @@ def _rawtime_float_to_hms(timef):
     return hms((time/3600), (time % 3600)/60, time % 60)
 
 
+# Seconds in a day.
+_DAY = 24.0 * 60.0 * 60.0
+
+
+def _days_crossed(rawtime, previous_rawtime=None):
+    """Returns the number of 0:00 UTC crossings up to each fix.
+
+    A crossing is a fix whose time went back by more than a day minus
+    200 seconds since the previous fix.
+
+    Args:
+        rawtime: a NumPy float array, the rawtime of consecutive fixes
+        previous_rawtime: a float, the rawtime of the fix before them,
+        optional
+
+    Returns:
+        A NumPy integer array, the days to add to the rawtime of each fix.
+    """
+    if previous_rawtime is None:
+        previous_rawtime = rawtime[:1]
+    previous = np.concatenate((np.atleast_1d(previous_rawtime),
+                               rawtime[:-1]))
+    crossings = (previous > rawtime) & (rawtime + _DAY < previous + 200.0)
+    return np.cumsum(crossings)
+
+
+def _time_span(first_rawtime, last_rawtime):
+    """Returns the seconds between two rawtimes, less than 24 hours apart."""
+    time_span = last_rawtime - first_rawtime
+    if time_span < 0.0:
+        time_span += 86400.0
+    return time_span
+
+
+def _date_of_timestamp(timestamp):
+    """Returns the datetime.date of a UTC timestamp."""
+    epoch = datetime.datetime(year=1970, month=1, day=1)
+    return (epoch + datetime.timedelta(seconds=timestamp)).date()
+
+
 class Turnpoint:
     """A single turnpoint in a Task.
 
@@ -247,9 +312,25 @@ class Task:
         return reached_turnpoints
 
 
+def _fix_field(name):
+    """Creates a GNSSFix property backed by a FixStore column."""
+    def getter(self):
+        return self._store.get(name, self._row)
+
+    def setter(self, value):
+        self._store.set(name, self._row, value)
+
+    return property(getter, setter)
+
+
 class GNSSFix:
     """Stores single GNSS flight recorder fix (a B-record).
 
+    A GNSSFix is a lightweight view of a single row of a FixStore, the
+    columnar storage of all fixes of a flight. Reading or writing an
+    attribute reads or writes the underlying column. Fixes hold no
+    reference to their Flight, so that they create no reference cycles.
+
     Raw attributes (i.e. attributes read directly from the B record):
         rawtime: a float, time since last midnight, UTC, seconds
         lat: a float, latitude in degrees
@@ -270,6 +351,55 @@ class GNSSFix:
         circling: a bool, whether this fix is inside a thermal
     """
 
+    __slots__ = ('_store', '_row', 'index')
+
+    rawtime = _fix_field('rawtime')
+    lat = _fix_field('lat')
+    lon = _fix_field('lon')
+    validity = _fix_field('validity')
+    press_alt = _fix_field('press_alt')
+    gnss_alt = _fix_field('gnss_alt')
+    timestamp = _fix_field('timestamp')
+    alt = _fix_field('alt')
+    gsp = _fix_field('gsp')
+    bearing = _fix_field('bearing')
+    bearing_change_rate = _fix_field('bearing_change_rate')
+    flying = _fix_field('flying')
+    circling = _fix_field('circling')
+
+    @property
+    def extras(self):
+        return self._store.get_extras(self._row)
+
+    @extras.setter
+    def extras(self, value):
+        self._store.set_extras(self._row, value)
+
+    def extension(self, code):
+        """Returns the value of a B record extension of this fix.
+
+        Args:
+            code: a string, the three-letter code of the extension, as
+            declared in the I record, e.g. 'ENL'
+
+        Returns:
+            A float, or None if the extension is missing or not numeric.
+        """
+        return self._store.get_extension(code, self._row)
+
+    @staticmethod
+    def parse_B_record(B_record_line):
+        """Decodes the raw fields of an IGC B-record line.
+
+        Args:
+            B_record_line: a string, B record line from an IGC file
+
+        Returns:
+            A (rawtime, lat, lon, validity, press_alt, gnss_alt, extras)
+            tuple, or None if the line is not a valid B record.
+        """
+        return records.parse_B_record(B_record_line)
+
     @staticmethod
     def build_from_B_record(B_record_line, index):
         """Creates GNSSFix object from IGC B-record line.
@@ -281,63 +411,58 @@ class GNSSFix:
         Returns:
             The created GNSSFix object
         """
-        match = re.match(
-            '^B' + '(\d\d)(\d\d)(\d\d)'
-            + '(\d\d)(\d\d)(\d\d\d)([NS])'
-            + '(\d\d\d)(\d\d)(\d\d\d)([EW])'
-            + '([AV])' + '([-\d]\d\d\d\d)' + '([-\d]\d\d\d\d)'
-            + '([0-9a-zA-Z\-]*).*$', B_record_line)
-        if match is None:
+        fields = GNSSFix.parse_B_record(B_record_line)
+        if fields is None:
             return None
-        (hours, minutes, seconds,
-         lat_deg, lat_min, lat_min_dec, lat_sign,
-         lon_deg, lon_min, lon_min_dec, lon_sign,
-         validity, press_alt, gnss_alt,
-         extras) = match.groups()
-
-        rawtime = (float(hours)*60.0 + float(minutes))*60.0 + float(seconds)
-
-        lat = float(lat_deg)
-        lat += float(lat_min) / 60.0
-        lat += float(lat_min_dec) / 1000.0 / 60.0
-        if lat_sign == 'S':
-            lat = -lat
-
-        lon = float(lon_deg)
-        lon += float(lon_min) / 60.0
-        lon += float(lon_min_dec) / 1000.0 / 60.0
-        if lon_sign == 'W':
-            lon = -lon
-
-        press_alt = float(press_alt)
-        gnss_alt = float(gnss_alt)
-
+        (rawtime, lat, lon, validity, press_alt, gnss_alt, extras) = fields
         return GNSSFix(rawtime, lat, lon, validity, press_alt, gnss_alt,
                        index, extras)
 
+    @staticmethod
+    def view(store, index):
+        """Returns a GNSSFix reading row `index` of a FixStore."""
+        fix = GNSSFix.__new__(GNSSFix)
+        fix._store = store
+        fix._row = index
+        fix.index = index
+        return fix
+
     def __init__(self, rawtime, lat, lon, validity, press_alt, gnss_alt,
                  index, extras):
-        """Initializer of GNSSFix. Not meant to be used directly."""
-        self.rawtime = rawtime
-        self.lat = lat
-        self.lon = lon
-        self.validity = validity
-        self.press_alt = press_alt
-        self.gnss_alt = gnss_alt
+        """Initializer of GNSSFix. Not meant to be used directly.
+
+        Creates a standalone fix, backed by its own single-row FixStore.
+        """
+        self._store = FixStore.from_columns(
+            [rawtime], [lat], [lon], [validity], [press_alt], [gnss_alt],
+            [extras])
+        self._row = 0
         self.index = index
-        self.extras = extras
-        self.flight = None
-
-    def set_flight(self, flight):
-        """Sets parent Flight object."""
-        self.flight = flight
-        if self.flight.alt_source == "PRESS":
-            self.alt = self.press_alt
-        elif self.flight.alt_source == "GNSS":
-            self.alt = self.gnss_alt
-        else:
-            assert(False)
-        self.timestamp = int(self.rawtime + flight.date_timestamp)
+
+    def detach(self):
+        """Returns a standalone copy of this fix.
+
+        A fix keeps the columns of all the fixes of its flight alive.
+        Detached copies are meant for keeping a few fixes of many flights,
+        they only hold the fields computed so far.
+        """
+        fix = GNSSFix.view(self._store.take([self._row]), 0)
+        fix.index = self.index
+        return fix
+
+    def __eq__(self, other):
+        if not isinstance(other, GNSSFix):
+            return NotImplemented
+        return self._store is other._store and self._row == other._row
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash((id(self._store), self._row))
 
     def __repr__(self):
         return self.__str__()
@@ -358,7 +483,8 @@ class GNSSFix:
 
     def to_B_record(self):
         """Reconstructs an IGC B-record."""
-        rawtime = int(self.rawtime)
+        # B records hold the time of day, see Flight._check_fix_rawtime().
+        rawtime = int(self.rawtime) % int(_DAY)
         hours = rawtime / 3600
         minutes = (rawtime % 3600) / 60
         seconds = rawtime % 60
@@ -416,16 +542,96 @@ class GNSSFix:
 
 
 
-class Thermal:
+class FixList(collections_abc.Sequence):
+    """A read-only list of GNSSFix views over the rows of a FixStore.
+
+    The list covers all the rows of the store, or the range of rows
+    returned by slice(). Views are created as the fixes are accessed.
+    """
+
+    def __init__(self, store, start=0, stop=None):
+        self._store = store
+        self._start = start
+        self._stop = stop
+
+    def slice(self, start, stop):
+        """Returns a FixList of the fixes start to stop (exclusive)."""
+        return FixList(self._store, self._start + start, self._start + stop)
+
+    def column(self, name):
+        """Returns field `name` of the fixes, a view of the FixStore column."""
+        return self._store.column(name)[self._start:self._start + len(self)]
+
+    def __len__(self):
+        if self._stop is None:
+            return len(self._store) - self._start
+        return self._stop - self._start
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [GNSSFix.view(self._store, self._start + i)
+                    for i in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("fix index out of range")
+        return GNSSFix.view(self._store, self._start + key)
+
+    def __iter__(self):
+        for i in range(self._start, self._start + len(self)):
+            yield GNSSFix.view(self._store, i)
+
+
+class _Segment(object):
+    """Statistics of the fixes of a thermal or a glide.
+
+    Read from the IntervalIndex of the flight in constant time, only for
+    segments of a Flight.
+    """
+
+    def _interval(self, statistic):
+        if self.intervals is None:
+            raise ValueError("%s has no interval index" % type(self).__name__)
+        return float(getattr(self.intervals, statistic)(
+            self.enter_fix.index, self.exit_fix.index))
+
+    def alt_gain(self):
+        """Returns the sum of the altitude gains, meters."""
+        return self._interval('alt_gain')
+
+    def alt_loss(self):
+        """Returns the sum of the altitude losses, meters."""
+        return self._interval('alt_loss')
+
+    def circling_time(self):
+        """Returns the time spent circling, seconds."""
+        return self._interval('circling_time')
+
+
+class Thermal(_Segment):
     """Represents a single thermal detected in a flight.
 
     Attributes:
         enter_fix: a GNSSFix, entry point of the thermal
         exit_fix: a GNSSFix, exit point of the thermal
+        intervals: an IntervalIndex of the flight fixes, None if the
+        thermal is not part of a Flight
     """
-    def __init__(self, enter_fix, exit_fix):
+    def __init__(self, enter_fix, exit_fix, intervals=None):
         self.enter_fix = enter_fix
         self.exit_fix = exit_fix
+        self.intervals = intervals
+
+    def detach(self):
+        """Returns a copy of the thermal not holding the flight fixes.
+
+        See GNSSFix.detach().
+        """
+        return Thermal(self.enter_fix.detach(), self.exit_fix.detach())
+
+    def track_length(self):
+        """Returns the length of the track in the thermal, kilometers."""
+        return self._interval('distance')
 
     def time_change(self):
         """Returns the time spent in the thermal, seconds."""
@@ -448,7 +654,7 @@ class Thermal:
         return 'Thermal: vertical_velocity={:.2f} m/s \t enter_fix={}'.format(self.vertical_velocity(), self.enter_fix)
 
 
-class Glide:
+class Glide(_Segment):
     """Represents a single glide detected in a flight.
 
     Glides are portions of the recorded track between thermals.
@@ -459,13 +665,18 @@ class Glide:
         track_length: a float, the total length, in kilometers, of the recorded
         track, between the entry point and the exit point; note that this is
         not the same as the distance between these points
+        fixes: a sequence of GNSSFix, the fixes after the entry point, up to
+        the exit of the following thermal; a FixList range in flights
+        intervals: an IntervalIndex of the flight fixes, None if the glide
+        is not part of a Flight
     """
 
-    def __init__(self, enter_fix, exit_fix, track_length):
+    def __init__(self, enter_fix, exit_fix, track_length, intervals=None):
         self.enter_fix = enter_fix
         self.exit_fix = exit_fix
         self.track_length = track_length
         self.fixes = []
+        self.intervals = intervals
 
     def time_change(self):
         """Returns the time spent in the glide, seconds."""
@@ -501,6 +712,197 @@ class Glide:
                 hms.minutes, hms.seconds, self.alt_change())
         )
 
+
+def _h_text(match):
+    return _strip_non_printable_chars(match.group(1))
+
+
+def _h_date_timestamp(match):
+    dd, mm, yy = match.groups()
+    year = int(2000 + int(yy))
+    month = int(mm)
+    day = int(dd)
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        return None
+    epoch = datetime.datetime(year=1970, month=1, day=1)
+    date = datetime.datetime(year=year, month=month, day=day)
+    return (date - epoch).total_seconds()
+
+
+def _h_float(match):
+    return float(match.group(1))
+
+
+def _h_int(match):
+    return int(match.group(1))
+
+
+def _h_field(pattern):
+    """Compiles the pattern of an H record value, after the subtype."""
+    return re.compile(pattern, flags=re.IGNORECASE)
+
+
+_H_FIRMWARE = _h_field(r'[ ]*FIRMWARE[ ]*VERSION[ ]*:[ ]*(.*)')
+_H_HARDWARE = _h_field(r'[ ]*HARDWARE[ ]*VERSION[ ]*:[ ]*(.*)')
+
+# H record subtype (the three letters after H and the data source) ->
+# list of (FlightHeader attribute, compiled pattern of the rest of the
+# record, converter of the match into the attribute value, or None).
+_H_RECORD_FIELDS = {
+    'DTE': [('date_timestamp',
+             _h_field(r'(?:DATE:[ ]*)?(\d\d)(\d\d)(\d\d)'),
+             _h_date_timestamp)],
+    'GTY': [('glider_type',
+             _h_field(r'[ ]*GLIDER[ ]*TYPE[ ]*:[ ]*(.*)'), _h_text)],
+    'GID': [('glider_id',
+             _h_field(r'[ ]*GLIDERID[ ]*:[ ]*(.*)'), _h_text)],
+    'RFW': [('fr_firmware_version', _H_FIRMWARE, _h_text),
+            ('fr_hardware_version', _H_HARDWARE, _h_text)],
+    'RHW': [('fr_firmware_version', _H_FIRMWARE, _h_text),
+            ('fr_hardware_version', _H_HARDWARE, _h_text)],
+    'FTY': [('fr_recorder_type',
+             _h_field(r'[ ]*FR[ ]*TYPE[ ]*:[ ]*(.*)'), _h_text)],
+    'GPS': [('fr_gps_receiver',
+             _h_field(r'(?:[: ]|(?:GPS))*(.*)'), _h_text)],
+    'PRS': [('fr_pressure_sensor',
+             _h_field(r'[ ]*PRESS[ ]*ALT[ ]*SENSOR[ ]*:[ ]*(.*)'), _h_text)],
+    'CCL': [('competition_class',
+             _h_field(r'[ ]*COMPETITION[ ]*CLASS[ ]*:[ ]*(.*)'), _h_text)],
+    'CID': [('competition_id',
+             _h_field(r'[ ]*COMPETITION[ ]*ID[ ]*:[ ]*(.*)'), _h_text)],
+    'PLT': [('pilot_name',
+             _h_field(r'[ ]*PILOT.*:[ ]*(.*)'), _h_text)],
+    'CM2': [('second_crew',
+             _h_field(r'[ ]*CREW[ ]*2?[ ]*:[ ]*(.*)'), _h_text)],
+    'SIT': [('site',
+             _h_field(r'[ ]*SITE[ ]*:[ ]*(.*)'), _h_text)],
+    'DTM': [('gps_datum',
+             _h_field(r'[ ]*\d*[ ]*(?:GPS)?[ ]*DATUM[ ]*:[ ]*(.*)'),
+             _h_text)],
+    'TZN': [('timezone_offset',
+             _h_field(r'[ ]*(?:TIME[ ]*ZONE[ ]*(?:OFFSET)?)?[ ]*:?[ ]*'
+                      r'([+-]?\d+(?:\.\d*)?)'),
+             _h_float)],
+    'FXA': [('fix_accuracy', _h_field(r'[ ]*(\d+)'), _h_int)],
+    'ALG': [('gnss_alt_reference',
+             _h_field(r'[ ]*ALT[ ]*GPS[ ]*:[ ]*(.*)'), _h_text)],
+    'ALP': [('press_alt_reference',
+             _h_field(r'[ ]*ALT[ ]*PRESSURE[ ]*:[ ]*(.*)'), _h_text)],
+}
+
+
+class FlightHeader(object):
+    """IGC metadata, extracted from the A/I/H records of a file.
+
+    Attributes are only set if the file defines them, see the Flight
+    class for their description. `date_timestamp` is the timestamp of
+    0:00 UTC on the day of the flight (the HFDTE record).
+
+    Attributes set by peek_header() only:
+        first_fix_rawtime: a float, time of the first valid B record,
+        UTC seconds since midnight, None if there are no valid B records
+        last_fix_rawtime: a float, time of the last valid B record
+    """
+
+    def __init__(self):
+        self.date_timestamp = None
+
+    def time_span(self):
+        """Returns the time between the first and last fixes, seconds.
+
+        Only available on headers returned by peek_header(). A recording
+        is assumed to last less than 24 hours, so that recordings passing
+        midnight UTC get a positive time span.
+        """
+        if self.first_fix_rawtime is None:
+            return 0.0
+        return _time_span(self.first_fix_rawtime, self.last_fix_rawtime)
+
+    @staticmethod
+    def create_from_records(a_records, h_records, i_records):
+        """Creates a FlightHeader from lists of A/H/I record lines."""
+        header = FlightHeader()
+        if a_records:
+            header.parse_a_records(a_records)
+        if i_records:
+            header.parse_i_records(i_records)
+        if h_records:
+            header.parse_h_records(h_records)
+        return header
+
+    def parse_a_records(self, a_records):
+        """Parses the IGC A record.
+
+        A record contains the flight recorder manufacturer ID and
+        device unique ID.
+        """
+        self.fr_manuf_code = _strip_non_printable_chars(a_records[0][1:4])
+        self.fr_uniq_id = _strip_non_printable_chars(a_records[0][4:7])
+
+    def parse_i_records(self, i_records):
+        """Parses the IGC I records.
+
+        I records contain a description of extensions used in B records.
+        """
+        self.i_record = _strip_non_printable_chars(" ".join(i_records))
+
+    def parse_h_records(self, h_records):
+        """Parses the IGC H records.
+
+        H records (header records) contain a lot of interesting metadata
+        about the file, such as the date of the flight, name of the pilot,
+        glider type, competition class, recorder accuracy and more.
+        Consult the IGC manual for details.
+        """
+        for record in h_records:
+            self.parse_h_record(record)
+
+    def parse_h_record(self, record):
+        """Parses one H record, see _H_RECORD_FIELDS.
+
+        Records from the flight recorder (H F) take precedence over the
+        ones entered by the pilot (H P) or an official observer (H O).
+        """
+        source = record[1:2]
+        if record[0:1] != 'H' or source not in 'FOP':
+            return
+        fields = _H_RECORD_FIELDS.get(record[2:5])
+        if fields is None:
+            return
+        for attribute, pattern, convert in fields:
+            if (source != 'F' and
+                    getattr(self, attribute, None) is not None):
+                continue
+            match = pattern.match(record, 5)
+            if match:
+                value = convert(match)
+                if value is not None:
+                    setattr(self, attribute, value)
+
+
+def peek_header(source):
+    """Reads the metadata of an IGC file, without building a Flight.
+
+    Only the A/H/I records and the first and last B records are decoded.
+    File names, buffers and seekable binary files are only read at their
+    head and tail, which makes scanning large archives of files for their
+    date, pilot, glider or recorder cheap.
+
+    Args:
+        source: a file name, a bytes-like object, a file-like object
+        or an iterable of lines, see records.iter_chunks()
+
+    Returns:
+        A FlightHeader, with first_fix_rawtime and last_fix_rawtime set.
+    """
+    (a_records, h_records, i_records,
+     first_fix, last_fix) = records.peek_records(source)
+    header = FlightHeader.create_from_records(a_records, h_records, i_records)
+    header.first_fix_rawtime = first_fix.rawtime if first_fix else None
+    header.last_fix_rawtime = last_fix.rawtime if last_fix else None
+    return header
+
+
 class FlightParsingConfig(object):
     """Configuration for parsing an IGC file.
 
@@ -523,8 +925,14 @@ class FlightParsingConfig(object):
     # Soft limit, some fixes are allowed to exceed.
     min_seconds_between_fixes = 1.0
 
-    # Maximum number of fixes exceeding time between fix constraints.
-    max_time_violations = 10
+    # Maximum number of fixes exceeding time between fix constraints;
+    # None for no limit. Gliding logs often exceed them (e.g. recording
+    # at a lower rate on the ground), hence no limit by default.
+    # Behavior change: this used to default to 10, but the check was
+    # disabled and the limit never applied. The check now runs again, to
+    # repair 0:00 UTC crossings; set a number, e.g. the former 10, to
+    # also reject files on the time between fixes.
+    max_time_violations = None
 
     # Maximum number of times a file can cross the 0:00 UTC time.
     max_new_days_in_flight = 2
@@ -584,6 +992,112 @@ class FlightParsingConfig(object):
     # Minimum time to consider circling a thermal, seconds.
     min_time_for_thermal = 60.0
 
+    #
+    # Filters, pushed down into the parsing: files failing them are
+    # rejected at the earliest validation stage able to tell, see
+    # Flight.rejected_by.
+    #
+
+    # Minimum flight duration (takeoff to landing), seconds; None for
+    # no limit. Files recording for less time are rejected before the
+    # altitude checks and the flight detection run.
+    min_flight_duration = None
+
+    # First and last accepted dates of the flight (datetime.date, HFDTE
+    # record), inclusive; None for no limit.
+    min_date = None
+    max_date = None
+
+    #
+    # Analysis profile of a Flight, one of Flight.ANALYSIS_PROFILES; each
+    # profile runs the stages of the previous ones:
+    #   - "track_only": the validation of the fixes, their timestamps and
+    #     altitudes; no flight detection, i.e. no takeoff_fix,
+    #     landing_fix nor duration check.
+    #   - "flight_detection": ground speed, bearing, takeoff and landing.
+    #   - "thermals": circling, thermals and glides.
+    #   - "full": keeps the B record extensions of the fixes, dropped by
+    #     the other profiles.
+    #
+    analysis_profile = "full"
+
+    #
+    # Hidden Markov models of the flight detection and of the thermal
+    # detection, see viterbi.SimpleViterbiDecoder. Fitted to a corpus of
+    # flights by train_config().
+    #
+
+    # Flying (1) vs standing (0).
+    flying_model = dict(
+        # More likely to start the log standing, i.e. not in flight
+        init_probs=[0.80, 0.20],
+        transition_probs=[
+            [0.9995, 0.0005],  # transitions from standing
+            [0.0005, 0.9995],  # transitions from flying
+        ],
+        emission_probs=[
+            [0.8, 0.2],  # emissions from standing
+            [0.2, 0.8],  # emissions from flying
+        ])
+
+    # Circling (1) vs straight flight (0).
+    circling_model = dict(
+        # More likely to start in straight flight than in circling
+        init_probs=[0.80, 0.20],
+        transition_probs=[
+            [0.982, 0.018],  # transitions from straight flight
+            [0.030, 0.970],  # transitions from circling
+        ],
+        emission_probs=[
+            [0.942, 0.058],  # emissions from straight flight
+            [0.093, 0.907],  # emissions from circling
+        ])
+
+    #
+    # Live tracking parameters, see IncrementalFlight.
+    #
+
+    # Maximum number of fixes by which the decision of the flying and
+    # circling states of a fix can lag behind the fix.
+    max_decision_lag = 120
+
+    def has_filters(self):
+        """Returns whether any filter is set, see min_flight_duration."""
+        return (self.min_flight_duration is not None or
+                self.min_date is not None or self.max_date is not None)
+
+    @classmethod
+    def fingerprint(cls):
+        """Returns a string identifying the values of all the parameters.
+
+        Used in the keys of FlightCache, so that changing a parameter, in
+        the class or in a subclass, invalidates the cached flights.
+        """
+        parameters = sorted(
+            (name, repr(getattr(cls, name))) for name in dir(cls)
+            if not name.startswith('_') and
+            not callable(getattr(cls, name)))
+        return cache.content_hash(repr(parameters).encode('utf-8'))
+
+    @classmethod
+    def to_source(cls):
+        """Returns the Python source code defining the class.
+
+        Lists the parameters set in the class itself, e.g. to deploy a
+        class returned by train_config() in a module.
+        """
+        lines = ["class %s(%s):" % (cls.__name__, cls.__bases__[0].__name__)]
+        for name, value in sorted(vars(cls).items()):
+            if (name.startswith('_') or callable(value) or
+                    isinstance(value, (classmethod, staticmethod))):
+                continue
+            source = pprint.pformat(value, width=70, sort_dicts=False)
+            lines.append("    %s = %s" % (
+                name, source.replace("\n", "\n" + " " * (len(name) + 7))))
+        if len(lines) == 1:
+            lines.append("    pass")
+        return "\n".join(lines) + "\n"
+
 
 class Flight:
     """Parses IGC file, detects thermals and checks for record anomalies.
@@ -592,15 +1106,31 @@ class Flight:
     invalid Flight instance is not usable. For an explaination why is
     a Flight invalid see the `notes` attribute.
 
+    Only the stages needed to validate the flight run on creation. Bearing
+    change rates, circling detection and thermals/glides are computed on
+    first access to `thermals`, `glides` or to the matching GNSSFix
+    attributes.
+    The analysis profile of the config leaves out the stages, and the
+    fix data, a consumer does not need, see
+    FlightParsingConfig.analysis_profile.
+
     General attributes:
         valid: a bool, whether the supplied record is considered valid
         notes: a list of strings, warnings and errors encountered while
         parsing/validating the file
-        fixes: a list of GNSSFix objects, one per each valid B record
+        rejected_by: a string, the validation stage at which an invalid
+        flight was rejected (see VALIDATION_STAGES), None if valid
+        fixes: a sequence of GNSSFix objects, one per each valid B record;
+        the fixes are views of the columnar FixStore kept by the Flight
+        extensions: a dict of NumPy float arrays, one value per fix for each
+        B record extension declared by the I record, keyed on its code
+        (e.g. 'ENL', 'FXA'); NaN where a fix has no numeric value
         thermals: a list of Thermal objects, the detected thermals
         glides: a list of Glide objects, the glides between thermals
         takeoff_fix: a GNSSFix object, the fix at which takeoff was detected
         landing_fix: a GNSSFix object, the fix at which landing was detected
+        intervals: an IntervalIndex of the fixes, the distance, duration,
+        climb, speed and L/D of any range of fixes in constant time
 
     IGC metadata attributes (some might be missing if the flight does not
     define them):
@@ -614,6 +1144,18 @@ class Flight:
         fr_recorder_type: a string, the type of the recorder
         fr_gps_receiver: a string, the used GPS receiver
         fr_pressure_sensor: a string, the used pressure sensor
+        pilot_name: a string, the pilot in charge
+        second_crew: a string, the second crew member
+        glider_id: a string, the glider registration
+        competition_id: a string, the competition number
+        site: a string, the take-off site
+        gps_datum: a string, the GPS datum, e.g. "WGS-1984"
+        timezone_offset: a float, the declared offset of the local time
+        from UTC, hours
+        fix_accuracy: an integer, the declared accuracy of the fixes, meters
+        gnss_alt_reference: a string, the GNSS altitude reference, e.g. "GEO"
+        press_alt_reference: a string, the pressure altitude reference,
+        e.g. "ISA"
 
     Other attributes:
         alt_source: a string, the chosen altitude sensor,
@@ -623,380 +1165,610 @@ class Flight:
     """
 
     @staticmethod
-    def create_from_file(filename, config_class=FlightParsingConfig):
+    def create_from_file(filename, config_class=FlightParsingConfig,
+                         decimation=None):
         """Creates an instance of Flight from a given file.
 
         Args:
             filename: a string, the name of the input IGC file
             config_class: a class that implements FlightParsingConfig
+            decimation: a DecimationPolicy, the fixes to keep, optional
 
         Returns:
             An instance of Flight built from the supplied IGC file.
         """
-        config = config_class()
-        fixes = []
-        a_records = []
-        i_records = []
-        h_records = []
         abs_filename = Path(filename).expanduser().absolute()
-        with abs_filename.open('r', encoding="ISO-8859-1") as flight_file:
-            for line in flight_file:
-                line = line.replace('\n', '').replace('\r', '')
-                if not line:
-                    continue
-                if line[0] == 'A':
-                    a_records.append(line)
-                elif line[0] == 'B':
-                    fix = GNSSFix.build_from_B_record(line, index=len(fixes))
-                    if fix is not None:
-                        if fixes and math.fabs(fix.rawtime - fixes[-1].rawtime) < 1e-5:
-                            # The time did not change since the previous fix.
-                            # Ignore this fix.
-                            pass
-                        else:
-                            fixes.append(fix)
-                elif line[0] == 'I':
-                    i_records.append(line)
-                elif line[0] == 'H':
-                    h_records.append(line)
-                else:
-                    # Do not parse any other types of IGC records
-                    pass
-        flight = Flight(fixes, a_records, h_records, i_records, config)
-        return flight
+        return Flight.create_from_source(abs_filename, config_class,
+                                         decimation)
 
     @staticmethod
-    def create_from_bytesio(flight_file, config_class=FlightParsingConfig):
+    def create_from_path(path, config_class=FlightParsingConfig, mmap=True,
+                         decimation=None):
+        """Creates an instance of Flight from a local IGC file.
+
+        Meant for bulk ingestion of local archives: by default the file is
+        memory-mapped and its pages are decoded directly, without text I/O
+        nor a copy of the whole file. Compressed files (.igc.gz, .igc.xz,
+        .igc.bz2) are decompressed on the fly.
+
+        Args:
+            path: a string or a path-like object, the name of the IGC file
+            config_class: a class that implements FlightParsingConfig
+            mmap: a bool, whether to memory-map the file; if False, the
+            file is read in chunks
+            decimation: a DecimationPolicy, the fixes to keep, optional
+
+        Returns:
+            An instance of Flight built from the supplied IGC file.
+        """
+        abs_filename = Path(path).expanduser().absolute()
+        if archives.is_compressed_name(abs_filename.name):
+            with archives.open_compressed(abs_filename) as flight_file:
+                return Flight.create_from_source(flight_file, config_class,
+                                                 decimation)
+        if not mmap:
+            return Flight.create_from_source(abs_filename, config_class,
+                                             decimation)
+        with records.map_file(abs_filename) as buffer:
+            return Flight.create_from_source(buffer, config_class, decimation)
+
+    @staticmethod
+    def create_from_bytesio(flight_file, config_class=FlightParsingConfig,
+                            decimation=None):
         """Creates an instance of Flight from a given file.
 
         Args:
             file: the BytesIO igc file
             config_class: a class that implements FlightParsingConfig
+            decimation: a DecimationPolicy, the fixes to keep, optional
 
         Returns:
             An instance of Flight built from the supplied IGC file.
         """
-        config = config_class()
-        fixes = []
-        a_records = []
-        i_records = []
-        h_records = []
-
-        for binary_line in flight_file:
-                line = binary_line.decode("ISO-8859-1")
-                line = line.replace('\n', '').replace('\r', '')
-                if not line:
-                    continue
-                if line[0] == 'A':
-                    a_records.append(line)
-                elif line[0] == 'B':
-                    fix = GNSSFix.build_from_B_record(line, index=len(fixes))
-                    if fix is not None:
-                        if fixes and math.fabs(fix.rawtime - fixes[-1].rawtime) < 1e-5:
-                            # The time did not change since the previous fix.
-                            # Ignore this fix.
-                            pass
-                        else:
-                            fixes.append(fix)
-                elif line[0] == 'I':
-                    i_records.append(line)
-                elif line[0] == 'H':
-                    h_records.append(line)
-                else:
-                    # Do not parse any other types of IGC records
-                    pass
-        flight = Flight(fixes, a_records, h_records, i_records, config)
-        return flight
+        return Flight.create_from_source(flight_file, config_class,
+                                         decimation)
 
     @staticmethod
-    def create_from_zipfile(zip_file, config_class=FlightParsingConfig):
+    def create_from_zipfile(zip_file, config_class=FlightParsingConfig,
+                            decimation=None):
         '''
-        Args:
-            target_date: files with a date != target_date will be discarded
+        Create Flight from the first file of a zip archive
+
+        See iter_from_archive() for reading all the files of an archive.
         '''
-        config = config_class()
-        fixes = []
-        a_records = []
-        i_records = []
-        h_records = []
-        
         # Take the first file in the archive
         target_file_in_archive = zip_file.filelist[0].filename if zip_file.filelist else None
-       
-        # Open the file and parse it
         with zip_file.open(target_file_in_archive) as flight_file:
-            for binary_line in flight_file:
-                line = binary_line.decode("ISO-8859-1")
-                line = line.replace('\n', '').replace('\r', '')
-                if not line:
-                    continue
-                if line[0] == 'A':
-                    a_records.append(line)
-                elif line[0] == 'B':
-                    fix = GNSSFix.build_from_B_record(line, index=len(fixes))
-                    if fix is not None:
-                        if fixes and math.fabs(fix.rawtime - fixes[-1].rawtime) < 1e-5:
-                            # The time did not change since the previous fix.
-                            # Ignore this fix.
-                            pass
-                        else:
-                            fixes.append(fix)
-                elif line[0] == 'I':
-                    i_records.append(line)
-                elif line[0] == 'H':
-                    h_records.append(line)
-                else:
-                    # Do not parse any other types of IGC records
-                    pass
-        flight = Flight(fixes, a_records, h_records, i_records, config)
-        return flight
+            return Flight.create_from_source(flight_file, config_class,
+                                             decimation)
+
+    @staticmethod
+    def iter_from_archive(archive, config_class=FlightParsingConfig,
+                          decimation=None):
+        """Creates a Flight from every IGC file of an archive.
+
+        Members are decompressed and parsed one at a time, in chunks, see
+        lib/archives.py.
+
+        Args:
+            archive: a file name, a binary file-like object or a
+            zipfile.ZipFile; a zip or tar archive (possibly compressed)
+            of IGC files, or a single compressed (.igc.gz, .igc.xz,
+            .igc.bz2) or plain IGC file
+            config_class: a class that implements FlightParsingConfig
+            decimation: a DecimationPolicy, the fixes to keep, optional
+
+        Returns:
+            A generator of (name, flight) tuples, one per IGC file, name is
+            the name of the file in the archive (None if unknown).
+        """
+        for name, member in archives.iter_members(archive):
+            with member:
+                yield name, Flight.create_from_source(
+                    member, config_class, decimation)
 
     @staticmethod
-    def create_from_lines(lines, config_class=FlightParsingConfig):
+    def create_from_lines(lines, config_class=FlightParsingConfig,
+                          decimation=None):
         '''
         Create Flight from list of lines
         '''
+        return Flight.create_from_source(lines, config_class, decimation)
+
+    @staticmethod
+    def create_from_buffer(buffer, config_class=FlightParsingConfig,
+                           decimation=None):
+        """Creates an instance of Flight from the content of an IGC file.
+
+        Args:
+            buffer: a bytes-like object, the content of an IGC file
+            config_class: a class that implements FlightParsingConfig
+            decimation: a DecimationPolicy, the fixes to keep, optional
+
+        Returns:
+            An instance of Flight built from the supplied IGC file.
+        """
+        return Flight.create_from_source(buffer, config_class, decimation)
+
+    @staticmethod
+    def create_from_source(source, config_class=FlightParsingConfig,
+                           decimation=None):
+        """Creates an instance of Flight from any IGC source.
+
+        The source is read in a single pass, see lib/records.py. When the
+        config sets filters (see FlightParsingConfig.min_flight_duration),
+        the header of random access sources is peeked first, so that files
+        out of the date range or too short are not parsed at all.
+
+        Args:
+            source: a file name, a bytes-like object, a file-like object
+            or an iterable of lines, see records.iter_chunks()
+            config_class: a class that implements FlightParsingConfig
+            decimation: a DecimationPolicy, the fixes to keep, optional;
+            see Flight.__init__()
+
+        Returns:
+            An instance of Flight built from the supplied IGC file.
+        """
         config = config_class()
-        fixes = []
-        a_records = []
-        i_records = []
-        h_records = []
-         
-        # Open the file and parse it
-        for line in lines:
-            line = line.replace('\n', '').replace('\r', '')
-            if not line:
-                continue
-            if line[0] == 'A':
-                a_records.append(line)
-            elif line[0] == 'B':
-                fix = GNSSFix.build_from_B_record(line, index=len(fixes))
-                if fix is not None:
-                    if fixes and math.fabs(fix.rawtime - fixes[-1].rawtime) < 1e-5:
-                        # The time did not change since the previous fix.
-                        # Ignore this fix.
-                        pass
-                    else:
-                        fixes.append(fix)
-            elif line[0] == 'I':
-                i_records.append(line)
-            elif line[0] == 'H':
-                h_records.append(line)
-            else:
-                # Do not parse any other types of IGC records
-                pass
-        flight = Flight(fixes, a_records, h_records, i_records, config)
-        return flight
+        if config.has_filters() and records.is_random_access(source):
+            flight = Flight._peek_filters(source, config)
+            if flight is not None:
+                return flight
+        a_records, h_records, i_records, fixes = records.read_records(source)
+        return Flight(fixes, a_records, h_records, i_records, config,
+                      decimation)
+
+    def __init__(self, fixes, a_records, h_records, i_records, config,
+                 decimation=None):
+        """Initializer of the Flight class. Do not use directly.
 
-    def __init__(self, fixes, a_records, h_records, i_records, config):
-        """Initializer of the Flight class. Do not use directly."""
+        Args:
+            fixes: a FixStore, or a list of GNSSFix objects
+            decimation: a DecimationPolicy, optional. The fix count and
+            altitude checks run on all the fixes, the remaining stages
+            only on the fixes kept by the policy.
+        """
+        if config.analysis_profile not in self.ANALYSIS_PROFILES:
+            raise ValueError("unknown analysis profile: %r" %
+                             config.analysis_profile)
         self._config = config
-        self.fixes = fixes
+        self._done_stages = set()
+        self._intervals = None
+        if not isinstance(fixes, FixStore):
+            fixes = FixStore.from_fixes(fixes)
+        self._store = fixes
+        self.fixes = FixList(fixes)
+        if not self._profile_includes('full'):
+            fixes.drop_extensions()
+        elif i_records:
+            fixes.decode_extensions(extensions.parse_I_record(i_records[0]))
+        self.extensions = fixes.extensions
         self.valid = True
         self.notes = []
+        self.rejected_by = None
         self.date_timestamp = None
         self.duration = 0
         if len(fixes) < self._config.min_fixes:
-            self.notes.append(
+            self._reject(
+                'fix_count',
                 "Error: This file has %d fixes, less than "
                 "the minimum %d." % (len(fixes), self._config.min_fixes))
-            self.valid = False
+            return
+
+        header = FlightHeader.create_from_records(
+            a_records, h_records, i_records)
+        self.__dict__.update(vars(header))
+        rawtime = fixes.data['rawtime']
+        if not self._check_filters(_time_span(rawtime[0], rawtime[-1])):
             return
 
         self._check_altitudes()
         if not self.valid:
             return
 
-        # HACK: Disabled as this does not apply in gliding and causes flights to be invalid is some cases....
-        #self._check_fix_rawtime()
-        #if not self.valid:
-        #    return
+        self._check_fix_rawtime()
+        if not self.valid:
+            return
 
         if self.press_alt_valid:
             self.alt_source = "PRESS"
         elif self.gnss_alt_valid:
             self.alt_source = "GNSS"
         else:
-            self.notes.append(
+            self._reject(
+                'altitudes',
                 "Error: neither pressure nor gnss altitude is valid.")
-            self.valid = False
             return
 
-        if a_records:
-            self._parse_a_records(a_records)
-        if i_records:
-            self._parse_i_records(i_records)
-        if h_records:
-            self._parse_h_records(h_records)
+        if decimation is not None:
+            self._decimate(decimation)
 
-        if not hasattr(self, 'date_timestamp'):
-            self.notes.append("Error: no date record (HFDTE) in the file")
-            self.valid = False
+        self._compute_timestamps()
+        if not self._profile_includes('flight_detection'):
             return
 
-        for fix in self.fixes:
-            fix.set_flight(self)
-
-        self._compute_ground_speeds()
+        self._compute_kinematics()
         self._compute_flight()
         self._compute_takeoff_landing()
         if not hasattr(self, 'takeoff_fix'):
-            self.notes.append("Error: did not detect takeoff.")
-            self.valid = False
+            self._reject('takeoff', "Error: did not detect takeoff.")
             return
 
-        self._compute_bearings()
-        self._compute_bearing_change_rates()
-        self._compute_circling()
-        self._find_thermals()
+        min_duration = self._config.min_flight_duration
+        if min_duration is not None and self.duration < min_duration:
+            self._reject(
+                'duration',
+                "Error: the flight lasted %d seconds, less than "
+                "the minimum %d." % (self.duration, min_duration))
+            return
 
-    def _parse_a_records(self, a_records):
-        """Parses the IGC A record.
+        # The remaining stages run on demand, see _ensure_stage().
+        self._store.set_provider(self._compute_field)
 
-        A record contains the flight recorder manufacturer ID and
-        device unique ID.
+    # Analysis profiles, cheapest first, see
+    # FlightParsingConfig.analysis_profile.
+    ANALYSIS_PROFILES = ('track_only', 'flight_detection', 'thermals',
+                         'full')
+
+    # Validation stages, cheapest first. A Flight failing one of them is
+    # not valid and gets its name as `rejected_by`.
+    VALIDATION_STAGES = ('fix_count', 'date_record', 'time_span',
+                         'fix_times', 'altitudes', 'takeoff', 'duration')
+
+    @staticmethod
+    def _peek_filters(source, config):
+        """Runs the filters of a config on the header of a source.
+
+        Only the head and the tail of the source are read, see
+        peek_header(); sources failing the filters are not parsed.
+
+        Returns:
+            An invalid Flight with no fixes if the source is rejected,
+            None if it passes the filters or if its header can not tell.
         """
-        self.fr_manuf_code = _strip_non_printable_chars(a_records[0][1:4])
-        self.fr_uniq_id = _strip_non_printable_chars(a_records[0][4:7])
+        header = peek_header(source)
+        if header.date_timestamp is None or header.first_fix_rawtime is None:
+            return None
+        flight = Flight.__new__(Flight)
+        flight._config = config
+        flight._done_stages = set()
+        flight._intervals = None
+        flight._store = FixStore.from_columns([], [], [], [], [], [])
+        flight.fixes = FixList(flight._store)
+        flight.extensions = flight._store.extensions
+        flight.valid = True
+        flight.notes = []
+        flight.rejected_by = None
+        flight.duration = 0
+        time_span = header.time_span()
+        del header.first_fix_rawtime, header.last_fix_rawtime
+        flight.__dict__.update(vars(header))
+        if flight._check_filters(time_span):
+            return None
+        return flight
 
-    def _parse_i_records(self, i_records):
-        """Parses the IGC I records.
+    def _reject(self, stage, note):
+        """Marks the flight as invalid at a validation stage."""
+        self.notes.append(note)
+        self.valid = False
+        self.rejected_by = stage
 
-        I records contain a description of extensions used in B records.
+    def _check_filters(self, time_span):
+        """Runs the date record and time span validation stages.
+
+        Args:
+            time_span: a float, the seconds between the first and the last
+            fixes of the file
+
+        Returns:
+            A bool, False if the flight was rejected.
         """
-        self.i_record = _strip_non_printable_chars(" ".join(i_records))
+        if self.date_timestamp is None:
+            self._reject('date_record',
+                         "Error: no date record (HFDTE) in the file")
+            return False
+        config = self._config
+        if config.min_date is not None or config.max_date is not None:
+            flight_date = _date_of_timestamp(self.date_timestamp)
+            if ((config.min_date is not None and
+                 flight_date < config.min_date) or
+                    (config.max_date is not None and
+                     flight_date > config.max_date)):
+                self._reject(
+                    'date_record',
+                    "Error: the flight date %s is out of the range "
+                    "%s to %s." % (flight_date, config.min_date,
+                                   config.max_date))
+                return False
+        min_duration = config.min_flight_duration
+        if min_duration is not None and time_span < min_duration:
+            self._reject(
+                'time_span',
+                "Error: the file records %d seconds, less than the "
+                "minimum flight duration %d." % (time_span, min_duration))
+            return False
+        return True
+
+    def _decimate(self, decimation):
+        """Drops the fixes not selected by a DecimationPolicy."""
+        store = self._store.take(decimation.select(self._store))
+        self._store = store
+        self.fixes = FixList(store)
+        self.extensions = store.extensions
+
+    # Analysis stages run on demand: stage name -> (the stages it depends
+    # on, the method computing it).
+    _STAGES = {
+        'bearing_change_rates': ((), '_compute_bearing_change_rates'),
+        'circling': (('bearing_change_rates',), '_compute_circling'),
+        'thermals': (('circling',), '_find_thermals'),
+    }
+
+    # Fix fields computed by the on-demand stages.
+    _FIELD_STAGES = {
+        'bearing_change_rate': 'bearing_change_rates',
+        'circling': 'circling',
+    }
+
+    def _profile_includes(self, profile):
+        """Returns whether the analysis profile runs the stages of another."""
+        return (self.ANALYSIS_PROFILES.index(self._config.analysis_profile) >=
+                self.ANALYSIS_PROFILES.index(profile))
+
+    def _ensure_stage(self, stage):
+        """Runs an analysis stage and its dependencies, if not done yet.
 
-    def _parse_h_records(self, h_records):
-        """Parses the IGC H records.
+        Returns:
+            A bool, False if the stage can not run on this flight, i.e.
+            the flight is not valid or its analysis profile excludes the
+            stage.
+        """
+        if stage in self._done_stages:
+            return True
+        if (not self.valid or not hasattr(self, 'takeoff_fix') or
+                not self._profile_includes('thermals')):
+            return False
+        dependencies, method = self._STAGES[stage]
+        for dependency in dependencies:
+            self._ensure_stage(dependency)
+        getattr(self, method)()
+        self._done_stages.add(stage)
+        return True
+
+    def _compute_field(self, name):
+        """Computes a fix field on its first access through a GNSSFix."""
+        if name in self._FIELD_STAGES:
+            self._ensure_stage(self._FIELD_STAGES[name])
+
+    @property
+    def intervals(self):
+        """An IntervalIndex of the fixes, built on first access."""
+        if self._intervals is None:
+            self._intervals = IntervalIndex(self._store)
+        return self._intervals
+
+    def at(self, timestamps):
+        """Returns the position of the glider at given times.
+
+        Interpolated linearly between the fixes around each time.
 
-        H records (header records) contain a lot of interesting metadata
-        about the file, such as the date of the flight, name of the pilot,
-        glider type, competition class, recorder accuracy and more.
-        Consult the IGC manual for details.
+        Args:
+            timestamps: a POSIX timestamp, or a NumPy array of them
+
+        Returns:
+            A (lat, lon, alt) tuple, floats or NumPy arrays like timestamps;
+            NaN at times out of the recording. None if the flight has no
+            timed fixes, e.g. it was rejected before they were parsed.
         """
-        for record in h_records:
-            self._parse_h_record(record)
+        if not len(self.fixes) or not self._store.has('timestamp'):
+            return None
+        return self.intervals.interpolate(timestamps)
 
-    def _parse_h_record(self, record):
-        if record[0:5] == 'HFDTE':
-            match = re.match(
-                '(?:HFDTE|HFDTEDATE:[ ]*)(\d\d)(\d\d)(\d\d)',
-                record, flags=re.IGNORECASE)
-            if match:
-                dd, mm, yy = [_strip_non_printable_chars(group) for group in match.groups()]
-                year = int(2000 + int(yy))
-                month = int(mm)
-                day = int(dd)
-                if 1 <= month <= 12 and 1 <= day <= 31:
-                    epoch = datetime.datetime(year=1970, month=1, day=1)
-                    date = datetime.datetime(year=year, month=month, day=day)
-                    self.date_timestamp = (date - epoch).total_seconds()
-        elif record[0:5] == 'HFGTY':
-            match = re.match(
-                'HFGTY[ ]*GLIDER[ ]*TYPE[ ]*:[ ]*(.*)',
-                record, flags=re.IGNORECASE)
-            if match:
-                (self.glider_type,) = map(
-                    _strip_non_printable_chars, match.groups())
-        elif record[0:5] == 'HFRFW' or record[0:5] == 'HFRHW':
-            match = re.match(
-                'HFR[FH]W[ ]*FIRMWARE[ ]*VERSION[ ]*:[ ]*(.*)',
-                record, flags=re.IGNORECASE)
-            if match:
-                (self.fr_firmware_version,) = map(
-                    _strip_non_printable_chars, match.groups())
-            match = re.match(
-                'HFR[FH]W[ ]*HARDWARE[ ]*VERSION[ ]*:[ ]*(.*)',
-                record, flags=re.IGNORECASE)
-            if match:
-                (self.fr_hardware_version,) = map(
-                    _strip_non_printable_chars, match.groups())
-        elif record[0:5] == 'HFFTY':
-            match = re.match(
-                'HFFTY[ ]*FR[ ]*TYPE[ ]*:[ ]*(.*)',
-                record, flags=re.IGNORECASE)
-            if match:
-                (self.fr_recorder_type,) = map(_strip_non_printable_chars,
-                                               match.groups())
-        elif record[0:5] == 'HFGPS':
-            match = re.match(
-                'HFGPS(?:[: ]|(?:GPS))*(.*)',
-                record, flags=re.IGNORECASE)
-            if match:
-                (self.fr_gps_receiver,) = map(_strip_non_printable_chars,
-                                              match.groups())
-        elif record[0:5] == 'HFPRS':
-            match = re.match(
-                'HFPRS[ ]*PRESS[ ]*ALT[ ]*SENSOR[ ]*:[ ]*(.*)',
-                record, flags=re.IGNORECASE)
-            if match:
-                (self.fr_pressure_sensor,) = map(_strip_non_printable_chars,
-                                                 match.groups())
-        elif record[0:5] == 'HFCCL':
-            match = re.match(
-                'HFCCL[ ]*COMPETITION[ ]*CLASS[ ]*:[ ]*(.*)',
-                record, flags=re.IGNORECASE)
-            if match:
-                (self.competition_class,) = map(_strip_non_printable_chars,
-                                                match.groups())
-        elif record[0:5] == 'HFPLT':
-            match = re.match(
-                'HFPLT[ ]*PILOT.*:[ ]*(.*)',
-                record, flags=re.IGNORECASE)
-            if match:
-                (self.pilot_name,) = map(
-                    _strip_non_printable_chars, match.groups())
+    def slice_time(self, start, end):
+        """Returns the fixes recorded between two times.
 
-        elif record[0:5] == 'HFGID':
-            match = re.match(
-                'HFGID[ ]*GLIDERID[ ]*:[ ]*(.*)',
-                record, flags=re.IGNORECASE)
-            if match:
-                (self.glider_id,) = map(
-                    _strip_non_printable_chars, match.groups())
+        Args:
+            start, end: POSIX timestamps, inclusive
+
+        Returns:
+            A FixList range of self.fixes, not copying the fixes; empty if
+            the flight has no timed fixes.
+        """
+        if not len(self.fixes) or not self._store.has('timestamp'):
+            return self.fixes.slice(0, 0)
+        first, last = self.intervals.fixes_between(start, end)
+        return self.fixes.slice(int(first), int(max(last + 1, first)))
+
+    @property
+    def thermals(self):
+        """A list of Thermal objects, the detected thermals."""
+        if not self._ensure_stage('thermals'):
+            raise AttributeError('thermals')
+        return self._thermals
+
+    @property
+    def glides(self):
+        """A list of Glide objects, the glides between thermals."""
+        if not self._ensure_stage('thermals'):
+            raise AttributeError('glides')
+        return self._glides
+
+    # Version of the layout of to_arrays(), changes invalidate caches.
+    ARRAYS_VERSION = 6
+
+    # Attributes of a Flight not stored as plain values by to_arrays().
+    _NON_VALUE_ATTRIBUTES = ('fixes', 'extensions', 'takeoff_fix',
+                             'landing_fix')
+
+    def to_arrays(self, run_stages=True):
+        """Returns the parsed and analysed flight as NumPy arrays.
+
+        Args:
+            run_stages: a bool, whether to run all the analysis stages
+            first (see FlightCache); otherwise the stages not run yet
+            are run on demand by the rebuilt flight
+
+        Returns:
+            A dict of NumPy arrays, keyed on strings, from which
+            from_arrays() rebuilds the flight.
+        """
+        if run_stages and self.valid:
+            self._ensure_stage('thermals')
+        store = self._store
+        attributes = dict(
+            (name, value) for name, value in vars(self).items()
+            if not name.startswith('_') and
+            name not in self._NON_VALUE_ATTRIBUTES)
+        state = {
+            'attributes': attributes,
+            'computed': sorted(store._computed),
+            'extension_fields': [list(field)
+                                 for field in store.extension_fields],
+            'done_stages': sorted(self._done_stages),
+        }
+        arrays = {
+            'state': np.array(json.dumps(state)),
+            'fixes': store.data,
+        }
+        if store.extras is not None:
+            arrays['extras'] = store.extras
+        for code, column in store.extensions.items():
+            arrays['extension_' + code] = column
+        if hasattr(self, 'takeoff_fix'):
+            arrays['takeoff_landing'] = np.array(
+                [self.takeoff_fix.index, self.landing_fix.index])
+        if 'thermals' in self._done_stages:
+            arrays['thermals'] = np.array(
+                [[thermal.enter_fix.index, thermal.exit_fix.index]
+                 for thermal in self._thermals], dtype=np.int64).reshape(-1, 2)
+            arrays['glides'] = np.array(
+                [[glide.enter_fix.index, glide.exit_fix.index] +
+                 ([glide.fixes[0].index, glide.fixes[-1].index + 1]
+                  if glide.fixes else [0, 0])
+                 for glide in self._glides], dtype=np.int64).reshape(-1, 4)
+            arrays['glide_lengths'] = np.array(
+                [glide.track_length for glide in self._glides],
+                dtype=np.float64)
+        return arrays
+
+    @staticmethod
+    def from_arrays(arrays, config_class=FlightParsingConfig):
+        """Rebuilds a Flight from the output of to_arrays().
+
+        Args:
+            arrays: a dict of NumPy arrays, see to_arrays()
+            config_class: a class that implements FlightParsingConfig,
+            the one the arrays were computed with
+
+        Returns:
+            The rebuilt instance of Flight.
+        """
+        flight = Flight.__new__(Flight)
+        flight._restore(arrays, config_class)
+        return flight
+
+    @staticmethod
+    def from_shared_memory(descriptor, config_class=FlightParsingConfig):
+        """Rebuilds a Flight parsed by a worker process, see
+        parse_in_processes().
+
+        The fix columns are views of the shared memory segment written by
+        the worker, they are not copied.
+
+        Args:
+            descriptor: a dict, see sharedmem.export_arrays()
+            config_class: a class that implements FlightParsingConfig
 
+        Returns:
+            The rebuilt instance of Flight.
+        """
+        return Flight.from_arrays(sharedmem.attach_arrays(descriptor),
+                                  config_class)
+
+    def __getstate__(self):
+        """Pickles the flight as its columns, see to_arrays()."""
+        return {'config_class': type(self._config),
+                'arrays': self.to_arrays(run_stages=False)}
+
+    def __setstate__(self, state):
+        self._restore(state['arrays'], state['config_class'])
+
+    def _restore(self, arrays, config_class):
+        """Sets the state of the flight from the output of to_arrays()."""
+        state = json.loads(arrays['state'].item())
+        self._config = config_class()
+        self._done_stages = set(state['done_stages'])
+        self._intervals = None
+        store = FixStore(arrays['fixes'], arrays.get('extras'))
+        if 'extras' not in arrays:
+            store.extras = None
+        store._computed = set(state['computed'])
+        store.extension_fields = [extensions.ExtensionField(*field)
+                                  for field in state['extension_fields']]
+        store.extensions = dict(
+            (field.code, arrays['extension_' + field.code])
+            for field in store.extension_fields)
+        self._store = store
+        self.fixes = FixList(store)
+        self.extensions = store.extensions
+        self.__dict__.update(state['attributes'])
+
+        if 'takeoff_landing' in arrays:
+            takeoff_index, landing_index = arrays['takeoff_landing'].tolist()
+            self.takeoff_fix = self.fixes[takeoff_index]
+            self.landing_fix = self.fixes[landing_index]
+            store.set_provider(self._compute_field)
+        if 'thermals' in arrays:
+            fixes = self.fixes
+            intervals = self.intervals
+            self._thermals = [
+                Thermal(fixes[enter], fixes[exit], intervals)
+                for enter, exit in arrays['thermals'].tolist()]
+            self._glides = []
+            for (enter, exit, first, end), track_length in zip(
+                    arrays['glides'].tolist(),
+                    arrays['glide_lengths'].tolist()):
+                glide = Glide(fixes[enter], fixes[exit], track_length,
+                              intervals)
+                glide.fixes = fixes.slice(first, end)
+                self._glides.append(glide)
 
     def __str__(self):
         descr = "Flight(valid=%s, fixes: %d" % (
             str(self.valid), len(self.fixes))
-        if hasattr(self, 'thermals'):
+        if 'thermals' in self._done_stages:
             descr += ", thermals: %d" % len(self.thermals)
         descr += ")"
         return descr
 
     def _check_altitudes(self):
-        press_alt_violations_num = 0
-        gnss_alt_violations_num = 0
-        press_huge_changes_num = 0
-        gnss_huge_changes_num = 0
-        press_chgs_sum = 0.0
-        gnss_chgs_sum = 0.0
-        for i in range(len(self.fixes) - 1):
-            press_alt_delta = math.fabs(
-                self.fixes[i+1].press_alt - self.fixes[i].press_alt)
-            gnss_alt_delta = math.fabs(
-                self.fixes[i+1].gnss_alt - self.fixes[i].gnss_alt)
-            rawtime_delta = math.fabs(
-                self.fixes[i+1].rawtime - self.fixes[i].rawtime)
-            if rawtime_delta > 0.5:
-                if (press_alt_delta / rawtime_delta >
-                        self._config.max_alt_change_rate):
-                    press_huge_changes_num += 1
-                else:
-                    press_chgs_sum += press_alt_delta
-                if (gnss_alt_delta / rawtime_delta >
-                        self._config.max_alt_change_rate):
-                    gnss_huge_changes_num += 1
-                else:
-                    gnss_chgs_sum += gnss_alt_delta
-            if (self.fixes[i].press_alt > self._config.max_alt
-                    or self.fixes[i].press_alt < self._config.min_alt):
-                press_alt_violations_num += 1
-            if (self.fixes[i].gnss_alt > self._config.max_alt or
-                    self.fixes[i].gnss_alt < self._config.min_alt):
-                gnss_alt_violations_num += 1
-        press_chgs_avg = press_chgs_sum / float(len(self.fixes) - 1)
-        gnss_chgs_avg = gnss_chgs_sum / float(len(self.fixes) - 1)
+        press_alt = self._store.column('press_alt')
+        gnss_alt = self._store.column('gnss_alt')
+        rawtime_delta = np.fabs(np.diff(self._store.column('rawtime')))
+        timed = rawtime_delta > 0.5
+        max_alt_change_rate = self._config.max_alt_change_rate
+
+        def alt_changes(alt):
+            """Returns the huge changes count and the sum of the others."""
+            alt_delta = np.fabs(np.diff(alt))[timed]
+            huge = alt_delta / rawtime_delta[timed] > max_alt_change_rate
+            # Summed in order, as a loop over the fixes would.
+            chgs = np.add.accumulate(alt_delta[~huge])
+            return int(huge.sum()), float(chgs[-1]) if len(chgs) else 0.0
+
+        def alt_violations(alt):
+            # The limits are checked on all the fixes but the last one.
+            alt = alt[:-1]
+            return int(np.count_nonzero((alt > self._config.max_alt) |
+                                        (alt < self._config.min_alt)))
+
+        press_huge_changes_num, press_chgs_sum = alt_changes(press_alt)
+        gnss_huge_changes_num, gnss_chgs_sum = alt_changes(gnss_alt)
+        press_alt_violations_num = alt_violations(press_alt)
+        gnss_alt_violations_num = alt_violations(gnss_alt)
+        press_chgs_avg = press_chgs_sum / float(len(rawtime_delta))
+        gnss_chgs_avg = gnss_chgs_sum / float(len(rawtime_delta))
 
         press_alt_ok = True
         if press_chgs_avg < self._config.min_avg_abs_alt_change:
@@ -1050,70 +1822,82 @@ class Flight:
 
         The B records do not have fully qualified timestamps (just the current
         time in UTC), therefore flights that cross 0:00 UTC need special
-        handling.
+        handling: a day is added to the rawtime of the fixes after each
+        crossing.
         """
-        DAY = 24.0 * 60.0 * 60.0
-        days_added = 0
-        rawtime_to_add = 0.0
-        rawtime_between_fix_exceeded = 0
-        for i in range(1, len(self.fixes)):
-            f0 = self.fixes[i-1]
-            f1 = self.fixes[i]
-            f1.rawtime += rawtime_to_add
-
-            if (f0.rawtime > f1.rawtime and
-                    f1.rawtime + DAY < f0.rawtime + 200.0):
-                # Day switch
-                days_added += 1
-                rawtime_to_add += DAY
-                f1.rawtime += DAY
-
-            time_change = f1.rawtime - f0.rawtime
-            if time_change < self._config.min_seconds_between_fixes - 1e-5:
-                rawtime_between_fix_exceeded += 1
-            if time_change > self._config.max_seconds_between_fixes + 1e-5:
-                rawtime_between_fix_exceeded += 1
-
-        if rawtime_between_fix_exceeded > self._config.max_time_violations:
-            self.notes.append(
-                "Error: too many fixes intervals exceed time between fixes "
-                "constraints. Allowed %d fixes, found %d fixes."
-                % (self._config.max_time_violations,
-                   rawtime_between_fix_exceeded))
-            self.valid = False
+        rawtime = self._store.column('rawtime')
+        days = _days_crossed(rawtime)
+        days_added = int(days[-1]) if len(days) else 0
+        if days_added:
+            rawtime = rawtime + days * _DAY
+            self._store.data['rawtime'] = rawtime
+
+        max_time_violations = self._config.max_time_violations
+        if max_time_violations is not None:
+            time_change = np.diff(rawtime)
+            rawtime_between_fix_exceeded = int(
+                np.count_nonzero(
+                    time_change <
+                    self._config.min_seconds_between_fixes - 1e-5) +
+                np.count_nonzero(
+                    time_change >
+                    self._config.max_seconds_between_fixes + 1e-5))
+            if rawtime_between_fix_exceeded > max_time_violations:
+                self._reject(
+                    'fix_times',
+                    "Error: too many fixes intervals exceed time between "
+                    "fixes constraints. Allowed %d fixes, found %d fixes."
+                    % (max_time_violations, rawtime_between_fix_exceeded))
         if days_added > self._config.max_new_days_in_flight:
-            self.notes.append(
+            self._reject(
+                'fix_times',
                 "Error: too many times did the flight cross the UTC 0:00 "
                 "barrier. Allowed %d times, found %d times."
                 % (self._config.max_new_days_in_flight, days_added))
-            self.valid = False
-
-    def _compute_ground_speeds(self):
-        """Adds ground speed info (km/h) to self.fixes."""
-        self.fixes[0].gsp = 0.0
-        for i in range(1, len(self.fixes)):
-            dist = self.fixes[i].distance_to(self.fixes[i-1])
-            rawtime = self.fixes[i].rawtime - self.fixes[i-1].rawtime
-            if math.fabs(rawtime) < 1e-5:
-                self.fixes[i].gsp = 0.0
-            else:
-                self.fixes[i].gsp = dist/rawtime*3600.0
+
+    def _compute_timestamps(self):
+        """Adds timestamp and alt columns to self.fixes."""
+        data = self._store.data
+        self._store.set_column('timestamp',
+                               data['rawtime'] + self.date_timestamp)
+        if self.alt_source == "PRESS":
+            self._store.set_column('alt', data['press_alt'])
+        elif self.alt_source == "GNSS":
+            self._store.set_column('alt', data['gnss_alt'])
+        else:
+            assert(False)
+
+    def _compute_kinematics(self):
+        """Adds ground speed (km/h) and bearing info to self.fixes.
+
+        Both come from a single NumPy pass over the legs between
+        consecutive fixes: the ground speed of a fix is the one of the
+        leg from the previous fix, its bearing the one of the leg to the
+        next fix.
+        """
+        data = self._store.data
+        distances, bearings = geo.track_legs(data['lat'], data['lon'])
+        time_change = np.diff(data['rawtime'])
+        gsp = np.zeros(len(data))
+        moving = np.fabs(time_change) >= 1e-5
+        gsp[1:][moving] = distances[moving] / time_change[moving] * 3600.0
+        self._store.set_column('gsp', gsp)
+
+        bearing = np.zeros(len(data))
+        if len(data) > 1:
+            bearing[:-1] = bearings
+            bearing[-1] = bearing[-2]
+        self._store.set_column('bearing', bearing)
 
     def _flying_emissions(self):
         """Generates raw flying/not flying emissions from ground speed.
 
         Standing (i.e. not flying) is encoded as 0, flying is encoded as 1.
         Exported to a separate function to be used in Baum-Welch parameters
-        learning.
+        learning, see train_config().
         """
-        emissions = []
-        for fix in self.fixes:
-            if fix.gsp > self._config.min_gsp_flight:
-                emissions.append(1)
-            else:
-                emissions.append(0)
-
-        return emissions
+        gsp = self._store.column('gsp')
+        return (gsp > self._config.min_gsp_flight).astype(int).tolist()
 
     def _compute_flight(self):
         """Adds boolean flag .flying to self.fixes.
@@ -1125,63 +1909,29 @@ class Flight:
         """
         # Step 1: the Viterbi decoder
         emissions = self._flying_emissions()
-        decoder = viterbi.SimpleViterbiDecoder(
-            # More likely to start the log standing, i.e. not in flight
-            init_probs=[0.80, 0.20],
-            transition_probs=[
-                [0.9995, 0.0005],  # transitions from standing
-                [0.0005, 0.9995],  # transitions from flying
-            ],
-            emission_probs=[
-                [0.8, 0.2],  # emissions from standing
-                [0.2, 0.8],  # emissions from flying
-            ])
+        decoder = viterbi.SimpleViterbiDecoder(**self._config.flying_model)
 
         outputs = decoder.decode(emissions)
 
         # Step 2: apply _config.min_landing_time.
-        ignore_next_downtime = False
-        apply_next_downtime = False
-        for i, (fix, output) in enumerate(zip(self.fixes, outputs)):
-            if output == 1:
-                fix.flying = True
-                # We're in flying mode, therefore reset all expectations
-                # about what's happening in the next down mode.
-                ignore_next_downtime = False
-                apply_next_downtime = False
-            else:
-                if apply_next_downtime or ignore_next_downtime:
-                    if apply_next_downtime:
-                        fix.flying = False
-                    else:
-                        fix.flying = True
-                else:
-                    # We need to determine whether to apply_next_downtime
-                    # or to ignore_next_downtime. This requires a scan into
-                    # upcoming fixes. Find the next fix on which
-                    # the Viterbi decoder said "flying".
-                    j = i + 1
-                    while j < len(self.fixes):
-                        upcoming_fix_decoded = outputs[j]
-                        if upcoming_fix_decoded == 1:
-                            break
-                        j += 1
-
-                    if j == len(self.fixes):
-                        # No such fix, end of log. Then apply.
-                        apply_next_downtime = True
-                        fix.flying = False
-                    else:
-                        # Found next flying fix.
-                        upcoming_fix = self.fixes[j]
-                        upcoming_fix_time_ahead = upcoming_fix.rawtime - fix.rawtime
-                        # If it's far enough into the future of then apply.
-                        if upcoming_fix_time_ahead >= self._config.min_landing_time:
-                            apply_next_downtime = True
-                            fix.flying = False
-                        else:
-                            ignore_next_downtime = True
-                            fix.flying = True
+        self._store.set_column('flying',
+                               self._apply_min_landing_time(outputs))
+
+    def _apply_min_landing_time(self, outputs):
+        """Returns the flying flags of the fixes from the decoder outputs.
+
+        A downtime (outputs 0) is ignored, i.e. flying, if the next flying
+        fix comes less than _config.min_landing_time after its start.
+        """
+        outputs = np.array(outputs, dtype=np.bool_)
+        rawtime = self._store.column('rawtime')
+        starts, ends = segments.runs(~outputs)
+        before_flying = ends < len(outputs)
+        starts, ends = starts[before_flying], ends[before_flying]
+        short = (rawtime[ends] - rawtime[starts] <
+                 self._config.min_landing_time)
+        return outputs | segments.fill(len(outputs), starts[short],
+                                       ends[short])
 
     def _compute_takeoff_landing(self):
         """Finds the takeoff and landing fixes in the log.
@@ -1190,37 +1940,26 @@ class Flight:
         is the next fix after the last fix in the flying mode or the
         last fix in the file.
         """
-        takeoff_fix = None
-        landing_fix = None
-        was_flying = False
-        for fix in self.fixes:
-            if fix.flying and takeoff_fix is None:
-                takeoff_fix = fix
-            if not fix.flying and was_flying:
-                landing_fix = fix
-                if self._config.which_flight_to_pick == "first":
-                    # User requested to select just the first flight in the log,
-                    # terminate now.
-                    break
-            was_flying = fix.flying
-
-        if takeoff_fix is None:
+        flying = self._store.column('flying')
+        starts, ends = segments.runs(flying)
+        if not len(starts):
             # No takeoff found.
             return
+        takeoff_index = int(starts[0])
 
-        if landing_fix is None:
+        landings = ends[ends < len(flying)]
+        if not len(landings):
             # Landing on the last fix
-            landing_fix = self.fixes[-1]
-
-        self.takeoff_fix = takeoff_fix
-        self.landing_fix = landing_fix
-        self.duration = int(landing_fix.rawtime - takeoff_fix.rawtime)
+            landing_index = len(self.fixes) - 1
+        elif self._config.which_flight_to_pick == "first":
+            # User requested to select just the first flight in the log.
+            landing_index = int(landings[0])
+        else:
+            landing_index = int(landings[-1])
 
-    def _compute_bearings(self):
-        """Adds bearing info to self.fixes."""
-        for i in range(len(self.fixes) - 1):
-            self.fixes[i].bearing = self.fixes[i].bearing_to(self.fixes[i+1])
-        self.fixes[-1].bearing = self.fixes[-2].bearing
+        self.takeoff_fix = self.fixes[takeoff_index]
+        self.landing_fix = self.fixes[landing_index]
+        self.duration = int(self.landing_fix.rawtime - self.takeoff_fix.rawtime)
 
     def _compute_bearing_change_rates(self):
         """Adds bearing change rate info to self.fixes.
@@ -1228,74 +1967,81 @@ class Flight:
         Computing bearing change rate between neighboring fixes proved
         itself to be noisy on tracks recorded with minimum interval (1 second).
         Therefore we compute rates between points that are at least
-        min_time_for_bearing_change seconds apart.
+        min_time_for_bearing_change seconds apart: the rate of a fix is
+        computed from the last fix before it that far in time, if any.
         """
-        def find_prev_fix(curr_fix):
-            """Computes the previous fix to be used in bearing rate change."""
-            prev_fix = None
-            for i in range(curr_fix - 1, 0, -1):
-                time_dist = math.fabs(self.fixes[curr_fix].timestamp -
-                                      self.fixes[i].timestamp)
-                if (time_dist >
-                        self._config.min_time_for_bearing_change - 1e-7):
-                    prev_fix = i
+        timestamp = self._store.column('timestamp')
+        # Relative to the first fix, so that the tolerance below is
+        # not lost in the precision of floats.
+        timestamp = (timestamp - timestamp[:1]).astype(np.float64)
+        bearing = self._store.column('bearing')
+        min_time = self._config.min_time_for_bearing_change - 1e-7
+
+        prev_fix = np.empty(len(timestamp), dtype=np.intp)
+        # Timestamps only go back where the logger clock did, 0:00 UTC
+        # crossings being fixed by _check_fix_rawtime(); they are sorted
+        # between these points.
+        starts = np.concatenate(
+            ([0], np.flatnonzero(np.diff(timestamp) < 0) + 1,
+             [len(timestamp)]))
+        for start, end in zip(starts[:-1], starts[1:]):
+            segment = timestamp[start:end]
+            prev_fix[start:end] = start - 1 + np.searchsorted(
+                segment, segment - min_time, side='left')
+            if start == 0:
+                continue
+            # Fixes with no such fix since the time went back.
+            for i in range(start, end):
+                if prev_fix[i] >= start:
                     break
-            return prev_fix
+                prev_fix[i] = self._find_prev_fix(timestamp, i, start - 1,
+                                                  min_time)
+
+        rate = np.zeros(len(timestamp))
+        curr = np.flatnonzero(prev_fix >= 0)
+        prev = prev_fix[curr]
+        bearing_change = bearing[prev] - bearing[curr]
+        bearing_change = np.where(
+            np.fabs(bearing_change) > 180.0,
+            np.where(bearing_change < 0.0, bearing_change + 360.0,
+                     bearing_change - 360.0),
+            bearing_change)
+        rate[curr] = bearing_change / (timestamp[prev] - timestamp[curr])
+        self._store.set_column('bearing_change_rate', rate)
 
-        for curr_fix in range(len(self.fixes)):
-            prev_fix = find_prev_fix(curr_fix)
+    @staticmethod
+    def _find_prev_fix(timestamp, curr_fix, start, min_time):
+        """Scans back from start for a fix min_time away from curr_fix.
 
-            if prev_fix is None:
-                self.fixes[curr_fix].bearing_change_rate = 0.0
-            else:
-                bearing_change = (self.fixes[prev_fix].bearing -
-                                  self.fixes[curr_fix].bearing)
-                if math.fabs(bearing_change) > 180.0:
-                    if bearing_change < 0.0:
-                        bearing_change += 360.0
-                    else:
-                        bearing_change -= 360.0
-                time_change = (self.fixes[prev_fix].timestamp -
-                               self.fixes[curr_fix].timestamp)
-                change_rate = bearing_change/time_change
-                self.fixes[curr_fix].bearing_change_rate = change_rate
+        Returns:
+            The index of the fix, -1 if there is none.
+        """
+        for i in range(start, -1, -1):
+            if math.fabs(timestamp[curr_fix] - timestamp[i]) > min_time:
+                return i
+        return -1
 
     def _circling_emissions(self):
         """Generates raw circling/straight emissions from bearing change.
 
         Staight flight is encoded as 0, circling is encoded as 1. Exported
-        to a separate function to be used in Baum-Welch parameters learning.
+        to a separate function to be used in Baum-Welch parameters learning,
+        see train_config().
         """
-        emissions = []
-        for fix in self.fixes:
-            bearing_change = math.fabs(fix.bearing_change_rate)
-            bearing_change_enough = (
-                bearing_change > self._config.min_bearing_change_circling)
-            if fix.flying and bearing_change_enough:
-                emissions.append(1)
-            else:
-                emissions.append(0)
-        return emissions
+        bearing_change = np.fabs(self._store.column('bearing_change_rate'))
+        bearing_change_enough = (
+            bearing_change > self._config.min_bearing_change_circling)
+        emissions = self._store.column('flying') & bearing_change_enough
+        return emissions.astype(int).tolist()
 
     def _compute_circling(self):
         """Adds .circling to self.fixes."""
         emissions = self._circling_emissions()
-        decoder = viterbi.SimpleViterbiDecoder(
-            # More likely to start in straight flight than in circling
-            init_probs=[0.80, 0.20],
-            transition_probs=[
-                [0.982, 0.018],  # transitions from straight flight
-                [0.030, 0.970],  # transitions from circling
-            ],
-            emission_probs=[
-                [0.942, 0.058],  # emissions from straight flight
-                [0.093, 0.907],  # emissions from circling
-            ])
+        decoder = viterbi.SimpleViterbiDecoder(**self._config.circling_model)
 
         output = decoder.decode(emissions)
 
-        for i in range(len(self.fixes)):
-            self.fixes[i].circling = (output[i] == 1)
+        self._store.set_column('circling', np.array(output) == 1)
 
     def _find_thermals(self):
         """Go through the fixes and find the thermals.
@@ -1304,54 +2050,716 @@ class Flight:
         the fixes and there is still an open glide (i.e. flight not finishing
         in a valid thermal) the glide will be closed.
         """
-        takeoff_index = self.takeoff_fix.index
-        landing_index = self.landing_fix.index
-        flight_fixes = self.fixes[takeoff_index:landing_index + 1]
+        first_index = self.takeoff_fix.index
+        last_index = self.landing_fix.index
+        fixes = self.fixes
+        rawtime = self._store.column('rawtime')
+        circling = self._store.column('circling')[first_index:last_index + 1]
+        starts, ends = segments.runs(circling)
+        starts += first_index
+        ends += first_index
+        # Circling still at the end of the flight is not a thermal.
+        exited = ends <= last_index
+        starts, ends = starts[exited], ends[exited]
+        long_enough = (rawtime[ends] - rawtime[starts] >
+                       self._config.min_time_for_thermal - 1e-5)
+        starts, ends = starts[long_enough].tolist(), ends[long_enough].tolist()
+
+        intervals = self.intervals
+        self._thermals = []
+        self._glides = []
+        glide_start = first_index
+        for start, end in zip(starts, ends):
+            thermal = Thermal(fixes[start], fixes[end], intervals)
+            if thermal.vertical_velocity() > 0.0:
+                # Make sure we're adding climbs only
+                self._thermals.append(thermal)
+            # The glide ends at the start of the thermal, its length up to
+            # the fix before.
+            glide = Glide(fixes[glide_start], fixes[start],
+                          float(intervals.distance(
+                              glide_start, max(start - 1, glide_start))),
+                          intervals)
+            glide.fixes = fixes.slice(glide_start + 1, end)
+            self._glides.append(glide)
+            glide_start = end
+        glide = Glide(fixes[glide_start], fixes[last_index],
+                      float(intervals.distance(glide_start, last_index)),
+                      intervals)
+        glide.fixes = fixes.slice(glide_start + 1, last_index + 1)
+        self._glides.append(glide)
+
+
+class _ThermalFinder(object):
+    """Splits the fixes of a flight into thermals and glides, fix by fix.
+
+    Used by IncrementalFlight, as the circling states of the fixes get
+    decided; Flight finds the same thermals and glides from the runs of
+    circling fixes, see Flight._find_thermals().
+    """
 
-        glide_fixes = []
+    def __init__(self, fixes, config, intervals):
+        self._fixes = fixes
+        self._config = config
+        self._intervals = intervals
         self.thermals = []
         self.glides = []
-        circling_now = False
-        gliding_now = False
-        first_fix = None
-        first_glide_fix = None
-        last_glide_fix = None
-        distance = 0.0
-        for fix in flight_fixes:
-            if not circling_now and fix.circling:
-                # Just started circling
-                circling_now = True
-                first_fix = fix
-                distance_start_circling = distance
-            elif circling_now and not fix.circling:
-                # Just ended circling
-                circling_now = False
-                thermal = Thermal(first_fix, fix)
-                if (thermal.time_change() >
-                        self._config.min_time_for_thermal - 1e-5):
-                    if thermal.vertical_velocity() > 0.0:                     # Make sure we're adding climbs only
-                        self.thermals.append(thermal)
-                    # glide ends at start of thermal
-                    glide = Glide(first_glide_fix, first_fix,
-                                  distance_start_circling)
-                    glide.fixes = glide_fixes
-                    glide_fixes = []
-                    self.glides.append(glide)
-                    gliding_now = False
-
-            if gliding_now:
-                distance = distance + fix.distance_to(last_glide_fix)
-                last_glide_fix = fix
-                glide_fixes.append(fix)
-            else:
-                # just started gliding
-                first_glide_fix = fix
-                last_glide_fix = fix
-                gliding_now = True
-                distance = 0.0
-
-        if gliding_now:
-            glide = Glide(first_glide_fix, last_glide_fix, distance)
-            glide.fixes = glide_fixes
-            glide_fixes = []
+        self.circling_now = False
+        self.first_fix = None
+        self.last_fix = None
+        self._gliding_now = False
+        self._first_glide_fix = None
+        self._last_glide_fix = None
+        self._last_glide_lat = None
+        self._last_glide_lon = None
+        self._distance = 0.0
+        self._distance_start_circling = None
+
+    def checkpoint(self):
+        """Returns a copy of the finder, unaffected by later steps."""
+        finder = copy.copy(self)
+        finder.thermals = list(self.thermals)
+        finder.glides = list(self.glides)
+        return finder
+
+    def step(self, i, circling, lat, lon):
+        """Processes fix i, the fix following the last processed one."""
+        fixes = self._fixes
+        self.last_fix = i
+        if not self.circling_now and circling:
+            # Just started circling
+            self.circling_now = True
+            self.first_fix = i
+            self._distance_start_circling = self._distance
+        elif self.circling_now and not circling:
+            # Just ended circling
+            self.circling_now = False
+            thermal = Thermal(fixes[self.first_fix], fixes[i],
+                              self._intervals)
+            if (thermal.time_change() >
+                    self._config.min_time_for_thermal - 1e-5):
+                if thermal.vertical_velocity() > 0.0:                     # Make sure we're adding climbs only
+                    self.thermals.append(thermal)
+                # glide ends at start of thermal
+                glide = Glide(fixes[self._first_glide_fix],
+                              fixes[self.first_fix],
+                              self._distance_start_circling,
+                              self._intervals)
+                glide.fixes = fixes.slice(self._first_glide_fix + 1, i)
+                self.glides.append(glide)
+                self._gliding_now = False
+
+        if self._gliding_now:
+            self._distance = self._distance + geo.earth_distance(
+                lat, lon, self._last_glide_lat, self._last_glide_lon)
+        else:
+            # just started gliding
+            self._first_glide_fix = i
+            self._gliding_now = True
+            self._distance = 0.0
+        self._last_glide_fix = i
+        self._last_glide_lat = lat
+        self._last_glide_lon = lon
+
+    def finish(self):
+        """Closes the open glide, after the last fix of the flight."""
+        if self._gliding_now:
+            glide = Glide(self._fixes[self._first_glide_fix],
+                          self._fixes[self._last_glide_fix],
+                          self._distance, self._intervals)
+            glide.fixes = self._fixes.slice(self._first_glide_fix + 1,
+                                            self._last_glide_fix + 1)
             self.glides.append(glide)
+            self._gliding_now = False
+
+
+class IncrementalFlight(object):
+    """A flight analysed as its B records arrive, e.g. from a live tracker.
+
+    Each new fix is processed once, in constant time: ground speed and
+    bearing are computed from the previous fix, bearing change rate from
+    the fix min_time_for_bearing_change seconds before, and the flying
+    and circling states are decided by online Viterbi decoders. Thermals
+    and glides are found as the circling states get decided.
+
+    The states of the last fixes are provisional (False) until decided:
+    by the decoders at most config.max_decision_lag fixes later, then
+    for downtimes after min_landing_time seconds. Once finish() is called,
+    the results are those of a Flight built from the same records, except
+    for the states the decoders had to decide at the lag limit. The file
+    validation checks of Flight are not run.
+
+    Attributes:
+        fixes: a sequence of GNSSFix objects, one per each valid B record
+        intervals: an IntervalIndex of the fixes so far, see Flight
+        decided_fixes: an integer, the number of leading fixes with final
+        flying and circling states
+        thermals: a list of Thermal objects, the thermals left so far
+        glides: a list of Glide objects, the glides between thermals
+        current_thermal: a Thermal object, the thermal being circled up to
+        the last decided fix, or None
+        takeoff_fix: a GNSSFix object, the first flying fix, or None
+        landing_fix: a GNSSFix object, the last detected landing, or None
+        alt_source: a string, the altitude sensor, "PRESS" or "GNSS"; the
+        pressure sensor is used unless it is found flat over the first
+        config.min_fixes fixes
+        finished: a bool, whether finish() was called
+
+    IGC metadata attributes are set from the A/H/I records, see Flight.
+    """
+
+    def __init__(self, a_records=(), h_records=(), i_records=(),
+                 config_class=FlightParsingConfig):
+        """Initializer of the IncrementalFlight class.
+
+        Args:
+            a_records, h_records, i_records: lists of strings, the header
+            records, if known before the first B record
+            config_class: a class that implements FlightParsingConfig
+        """
+        self._config = config_class()
+        self._header = FlightHeader()
+        self._a_records = []
+        self._i_records = []
+        self._store = FixStore.from_columns([], [], [], [], [], [], [])
+        for name in DERIVED_FIELDS:
+            self._store.set_column(name, [])
+        self.fixes = FixList(self._store)
+        self.intervals = IntervalIndex(self._store)
+        self.alt_source = "PRESS"
+        self.finished = False
+        self.decided_fixes = 0
+        self.takeoff_fix = None
+        self.landing_fix = None
+
+        self._flying_decoder = viterbi.OnlineViterbiDecoder(
+            max_lag=self._config.max_decision_lag,
+            **self._config.flying_model)
+        self._circling_decoder = viterbi.OnlineViterbiDecoder(
+            max_lag=self._config.max_decision_lag,
+            **self._config.circling_model)
+        # Fixes with final flying flags, and with final bearing change
+        # rates, i.e. emissions of the circling decoder.
+        self._decided_outputs = 0
+        self._flying_fixes = 0
+        self._circling_emissions = 0
+        self._pushed_circling = 0
+        # The bearing change rate of a fix is computed against the last
+        # fix min_time_for_bearing_change seconds before it.
+        self._bearing_change_fix = 0
+        # 0:00 UTC crossings so far, see Flight._check_fix_rawtime().
+        self._days_crossed = 0
+        # Start of a downtime of the flying decoder, and what to do with
+        # the downtime ("apply" or "ignore"), see Flight._compute_flight().
+        self._downtime_start = None
+        self._downtime = None
+        self._finder = _ThermalFinder(self.fixes, self._config,
+                                      self.intervals)
+        self._landing_checkpoint = None
+        # Extensions of the fixes decoded so far, in rows allocated like
+        # the ones of the FixStore.
+        self._extension_fields = []
+        self._extension_rows = {}
+        self.append_lines(list(a_records) + list(i_records) + list(h_records))
+
+    def __getattr__(self, name):
+        # IGC metadata, parsed by the header as its records arrive.
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._header, name)
+
+    @property
+    def thermals(self):
+        return self._finder.thermals
+
+    @property
+    def glides(self):
+        return self._finder.glides
+
+    @property
+    def current_thermal(self):
+        if not self._finder.circling_now:
+            return None
+        return Thermal(self.fixes[self._finder.first_fix],
+                       self.fixes[self._finder.last_fix], self.intervals)
+
+    @property
+    def extensions(self):
+        """B record extensions of the fixes so far, see Flight."""
+        count = len(self._store)
+        return dict((code, rows[:count])
+                    for code, rows in self._extension_rows.items())
+
+    def append_lines(self, lines):
+        """Appends complete IGC record lines, of any kind.
+
+        Header records are expected before the first B record, as in IGC
+        files: the date (HFDTE) of the flight is used for the timestamps
+        of the following fixes.
+
+        Args:
+            lines: a list of strings or bytes, the lines
+
+        Returns:
+            An integer, the number of fixes added.
+        """
+        added = 0
+        for kind, record in records.iter_records(lines):
+            if kind == 'B':
+                added += self.append_fixes(record)
+            elif kind == 'A':
+                self._a_records.append(record)
+                self._header.parse_a_records(self._a_records)
+            elif kind == 'I':
+                self._i_records.append(record)
+                self._header.parse_i_records(self._i_records)
+                if len(self._i_records) == 1:
+                    self._extension_fields = extensions.parse_I_record(record)
+                    self._decode_extensions(0, len(self._store))
+            else:
+                self._header.parse_h_record(record)
+        return added
+
+    def append_fixes(self, columns):
+        """Appends decoded B records.
+
+        Args:
+            columns: a records.FixColumns of the new B records, see
+            records.decode_B_records()
+
+        Returns:
+            An integer, the number of fixes added; a fix is ignored if its
+            time did not change since the previous fix.
+        """
+        if self.finished:
+            raise ValueError("append to a finished IncrementalFlight")
+        columns = [np.atleast_1d(column) for column in columns]
+        previous_rawtime = None
+        if len(self._store):
+            previous_rawtime = (self._store.data['rawtime'][-1] -
+                                self._days_crossed * _DAY)
+        days = self._days_crossed + _days_crossed(columns[0],
+                                                  previous_rawtime)
+        if len(days):
+            self._days_crossed = int(days[-1])
+            columns[0] = columns[0] + days * _DAY
+        times = np.concatenate((self._store.data['rawtime'][-1:], columns[0]))
+        keep = np.ones(len(times), dtype=np.bool_)
+        np.greater_equal(np.fabs(np.diff(times)), 1e-5, out=keep[1:])
+        keep = keep[len(times) - len(columns[0]):]
+        if not keep.all():
+            columns = [column[keep] for column in columns]
+        start = self._store.append(*columns)
+        end = len(self._store)
+        self._decode_extensions(start, end)
+
+        data = self._store.data
+        date_timestamp = self._header.date_timestamp or 0.0
+        data['timestamp'][start:end] = (data['rawtime'][start:end] +
+                                        date_timestamp)
+        decided_fixes = self.decided_fixes
+        alt_start = self._update_alt_source(start, end)
+        for i in range(start, end):
+            self._add_fix(i)
+        self.intervals.invalidate(min(alt_start, decided_fixes))
+        return end - start
+
+    def finish(self):
+        """Decides all the states, at the end of the track."""
+        if self.finished:
+            return
+        self.finished = True
+        count = len(self._store)
+        decided_fixes = self.decided_fixes
+        if count > 1:
+            self._set_bearing_change_rate(count - 1)
+        elif count:
+            self._circling_emissions = count
+        self._decide_flying(self._flying_decoder.flush())
+        if self._downtime_start is not None:
+            # The downtime reaches the end of the log.
+            self._set_flying(range(self._downtime_start,
+                                   self._decided_outputs), False)
+            self._downtime_start = None
+        self._feed_circling(self._flying_fixes)
+        self._decide_circling(self._circling_decoder.flush())
+        self.intervals.invalidate(decided_fixes)
+
+        if self.takeoff_fix is None:
+            return
+        if (self.landing_fix is not None and
+                self._landing_checkpoint is not None):
+            # Thermals are looked for up to the (last) landing only.
+            self._finder = self._landing_checkpoint
+        elif self.landing_fix is None:
+            self.landing_fix = self.fixes[count - 1]
+        self._finder.finish()
+
+    @property
+    def duration(self):
+        """The time between takeoff and landing, or the last fix, seconds."""
+        if self.takeoff_fix is None:
+            return 0
+        landing_fix = self.landing_fix or self.fixes[len(self.fixes) - 1]
+        return int(landing_fix.rawtime - self.takeoff_fix.rawtime)
+
+    def _decode_extensions(self, start, end):
+        """Decodes the B record extensions of the fixes start to end."""
+        columns, _ = extensions.decode_extensions(
+            self._store.extras[start:end], self._extension_fields)
+        for code, values in columns.items():
+            rows = self._extension_rows.get(code, np.zeros(0))
+            if end > len(rows):
+                grown = np.full(max(end, 2 * len(rows), 1024), np.nan)
+                grown[:start] = rows[:start]
+                rows = self._extension_rows[code] = grown
+            rows[start:end] = values
+
+    def _update_alt_source(self, start, end):
+        """Fills the alt column, choosing the sensor after min_fixes.
+
+        Returns:
+            An integer, the first fix whose alt was set.
+        """
+        data = self._store.data
+        min_fixes = self._config.min_fixes
+        if start < min_fixes <= end:
+            changes = np.fabs(np.diff(data['press_alt'][:min_fixes]))
+            if changes.mean() < self._config.min_avg_abs_alt_change:
+                self.alt_source = "GNSS"
+                start = 0
+        if self.alt_source == "PRESS":
+            data['alt'][start:end] = data['press_alt'][start:end]
+        else:
+            data['alt'][start:end] = data['gnss_alt'][start:end]
+        return start
+
+    def _add_fix(self, i):
+        """Processes a new fix, all previous fixes being processed."""
+        data = self._store.data
+        if i == 0:
+            self._push_flying(0)
+            return
+        lat, lon = data['lat'].item(i), data['lon'].item(i)
+        prev_lat, prev_lon = data['lat'].item(i - 1), data['lon'].item(i - 1)
+
+        dist = geo.earth_distance(lat, lon, prev_lat, prev_lon)
+        time_change = data['rawtime'].item(i) - data['rawtime'].item(i - 1)
+        if math.fabs(time_change) < 1e-5:
+            gsp = 0.0
+        else:
+            gsp = dist/time_change*3600.0
+        data['gsp'][i] = gsp
+
+        # The bearing of the last fix is the one of the fix before it.
+        bearing = geo.bearing_to(prev_lat, prev_lon, lat, lon)
+        data['bearing'][i - 1] = bearing
+        data['bearing'][i] = bearing
+        self._set_bearing_change_rate(i - 1)
+
+        self._push_flying(int(gsp > self._config.min_gsp_flight))
+        self._feed_circling(min(self._flying_fixes, self._circling_emissions))
+
+    def _set_bearing_change_rate(self, i):
+        """Computes the bearing change rate of fix i, see Flight."""
+        data = self._store.data
+        timestamp = data['timestamp']
+        min_time = self._config.min_time_for_bearing_change - 1e-7
+        prev_fix = self._bearing_change_fix
+        if i > 0 and timestamp.item(i) < timestamp.item(i - 1):
+            # Time went back (0:00 UTC), search from the last fix before.
+            prev_fix = i - 1
+        while (prev_fix + 1 < i and
+               timestamp.item(i) - timestamp.item(prev_fix + 1) > min_time):
+            prev_fix += 1
+        self._bearing_change_fix = prev_fix
+        if (math.fabs(timestamp.item(i) - timestamp.item(prev_fix)) <=
+                min_time):
+            data['bearing_change_rate'][i] = 0.0
+        else:
+            bearing_change = (data['bearing'].item(prev_fix) -
+                              data['bearing'].item(i))
+            if math.fabs(bearing_change) > 180.0:
+                if bearing_change < 0.0:
+                    bearing_change += 360.0
+                else:
+                    bearing_change -= 360.0
+            time_change = timestamp.item(prev_fix) - timestamp.item(i)
+            data['bearing_change_rate'][i] = bearing_change/time_change
+        self._circling_emissions = i + 1
+
+    def _push_flying(self, emission):
+        self._decide_flying(self._flying_decoder.push(emission))
+
+    def _decide_flying(self, outputs):
+        """Applies min_landing_time to decided states, see Flight."""
+        rawtime = self._store.data['rawtime']
+        min_landing_time = self._config.min_landing_time
+        for output in outputs:
+            i = self._decided_outputs
+            self._decided_outputs += 1
+            if output == 1:
+                if self._downtime_start is not None:
+                    downtime = (rawtime.item(i) -
+                                rawtime.item(self._downtime_start))
+                    self._set_flying(range(self._downtime_start, i),
+                                     downtime < min_landing_time)
+                    self._downtime_start = None
+                self._downtime = None
+                self._set_flying([i], True)
+            elif self._downtime == "apply":
+                self._set_flying([i], False)
+            else:
+                if self._downtime_start is None:
+                    self._downtime_start = i
+                downtime = (rawtime.item(i) -
+                            rawtime.item(self._downtime_start))
+                if downtime >= min_landing_time:
+                    # Landed, whatever comes next.
+                    self._set_flying(range(self._downtime_start, i + 1),
+                                     False)
+                    self._downtime_start = None
+                    self._downtime = "apply"
+
+    def _set_flying(self, indices, flying):
+        """Stores final flying states, of the fixes following the last."""
+        column = self._store.data['flying']
+        for i in indices:
+            column[i] = flying
+            if flying and self.takeoff_fix is None:
+                self.takeoff_fix = self.fixes[i]
+            if (not flying and i > 0 and column[i - 1] and
+                    self._accepts_landing()):
+                self.landing_fix = self.fixes[i]
+            self._flying_fixes = i + 1
+
+    def _accepts_landing(self):
+        return (self.landing_fix is None or
+                self._config.which_flight_to_pick != "first")
+
+    def _feed_circling(self, end):
+        """Pushes the circling emissions of the fixes up to end."""
+        data = self._store.data
+        min_bearing_change = self._config.min_bearing_change_circling
+        for i in range(self._pushed_circling, end):
+            emission = int(data['flying'].item(i) and math.fabs(
+                data['bearing_change_rate'].item(i)) > min_bearing_change)
+            self._decide_circling(self._circling_decoder.push(emission))
+        self._pushed_circling = max(self._pushed_circling, end)
+
+    def _decide_circling(self, outputs):
+        """Stores decided circling states and looks for thermals."""
+        data = self._store.data
+        takeoff_index = (self.takeoff_fix.index
+                         if self.takeoff_fix is not None else None)
+        for output in outputs:
+            i = self.decided_fixes
+            data['circling'][i] = output == 1
+            self.decided_fixes += 1
+            if takeoff_index is None or i < takeoff_index:
+                continue
+            landing_index = (self.landing_fix.index
+                             if self.landing_fix is not None else None)
+            if (self._config.which_flight_to_pick == "first" and
+                    landing_index is not None and i > landing_index):
+                continue
+            self._finder.step(i, output == 1, data['lat'].item(i),
+                              data['lon'].item(i))
+            if i == landing_index:
+                self._landing_checkpoint = self._finder.checkpoint()
+
+
+class FlightCache(object):
+    """An on-disk cache of parsed and analysed flights.
+
+    Flights are stored with their fixes, derived columns, thermals, glides
+    and notes (see Flight.to_arrays()), keyed on the SHA-256 hash of the
+    IGC file content, on the fingerprint of the FlightParsingConfig and on
+    the DecimationPolicy.
+    A flight found in the cache is rebuilt without parsing the file nor
+    running any analysis stage. The least recently used flights are
+    evicted when the cache files exceed max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=1 << 30):
+        """Initializer of the FlightCache class.
+
+        Args:
+            directory: a string, the cache directory, created if needed
+            max_bytes: an integer, the maximum total size of the cache
+        """
+        self._cache = cache.NpzCache(directory, max_bytes)
+
+    def _key(self, buffer, config_class, decimation):
+        # The hidden Markov models are parameters of config_class.
+        version = repr((Flight.ARRAYS_VERSION, decimation)).encode('utf-8')
+        return "%s-%s-%s" % (cache.content_hash(buffer),
+                             config_class.fingerprint()[:16],
+                             cache.content_hash(version)[:8])
+
+    def create_from_buffer(self, buffer, config_class=FlightParsingConfig,
+                           decimation=None):
+        """Returns the Flight of the content of an IGC file.
+
+        Args:
+            buffer: a bytes-like object, the content of an IGC file
+            config_class: a class that implements FlightParsingConfig
+            decimation: a DecimationPolicy, the fixes to keep, optional
+
+        Returns:
+            An instance of Flight, from the cache if possible.
+        """
+        key = self._key(buffer, config_class, decimation)
+        arrays = self._cache.get(key)
+        if arrays is not None:
+            return Flight.from_arrays(arrays, config_class)
+        flight = Flight.create_from_buffer(buffer, config_class, decimation)
+        self._cache.put(key, flight.to_arrays())
+        return flight
+
+    def create_from_path(self, path, config_class=FlightParsingConfig,
+                         decimation=None):
+        """Returns the Flight of a local IGC file, see create_from_buffer()."""
+        with records.map_file(Path(path).expanduser().absolute()) as buffer:
+            return self.create_from_buffer(buffer, config_class, decimation)
+
+    def create_from_bytesio(self, flight_file,
+                            config_class=FlightParsingConfig,
+                            decimation=None):
+        """Returns the Flight of a BytesIO, see create_from_buffer()."""
+        return self.create_from_buffer(flight_file.getbuffer(), config_class,
+                                       decimation)
+
+
+# Default size limit of the cache returned by get_flight_cache().
+FLIGHT_CACHE_MAX_BYTES = 2 * 1024**3
+
+
+def get_flight_cache(max_bytes=FLIGHT_CACHE_MAX_BYTES):
+    """Returns the FlightCache set up by the environment, if any.
+
+    The cache is enabled by setting the FLIGHT_CACHE_DIRECTORY environment
+    variable to its directory.
+
+    Args:
+        max_bytes: an integer, the maximum total size of the cache
+
+    Returns:
+        A FlightCache, or None if FLIGHT_CACHE_DIRECTORY is not set.
+    """
+    directory = os.environ.get('FLIGHT_CACHE_DIRECTORY', '').strip()
+    if not directory:
+        return None
+    return FlightCache(directory, max_bytes)
+
+
+def _parse_to_shared_memory(task):
+    """Parses and analyses a flight in a worker process.
+
+    Returns:
+        A descriptor of the shared memory segment holding the flight, see
+        Flight.from_shared_memory().
+    """
+    source, config_class, decimation = task
+    flight = Flight.create_from_source(source, config_class, decimation)
+    return sharedmem.export_arrays(flight.to_arrays())
+
+
+def parse_in_processes(sources, config_class=FlightParsingConfig,
+                       decimation=None, processes=None):
+    """Parses and analyses IGC files in a pool of worker processes.
+
+    Workers send the fix columns, thermals and glides of each flight back
+    through shared memory, only a small descriptor is pickled. Flights
+    are rebuilt on top of the shared memory, without copying the fixes.
+
+    Args:
+        sources: an iterable of picklable IGC sources, file names or
+        bytes, see Flight.create_from_source()
+        config_class: a class that implements FlightParsingConfig, defined
+        at the top level of a module
+        decimation: a DecimationPolicy, the fixes to keep, optional
+        processes: an integer, the number of workers, by default the
+        number of CPUs
+
+    Returns:
+        A generator of Flight objects, in the order of the sources, with
+        all the analysis stages run. Closing it early frees the shared
+        memory of the flights parsed ahead.
+    """
+    # Workers must share the tracker of the segments with the parent,
+    # which unlinks them.
+    resource_tracker.ensure_running()
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    sources = iter(sources)
+    pending = collections.deque()
+    with multiprocessing.Pool(processes) as pool:
+        try:
+            while True:
+                # Keeps the workers busy, with a bounded number of parsed
+                # flights waiting in shared memory.
+                for source in itertools.islice(
+                        sources, 2 * processes - len(pending)):
+                    pending.append(pool.apply_async(
+                        _parse_to_shared_memory,
+                        ((source, config_class, decimation),)))
+                if not pending:
+                    return
+                descriptor = pending.popleft().get()
+                yield Flight.from_shared_memory(descriptor, config_class)
+        finally:
+            # Also runs when the caller stops early, or on an error: frees
+            # the segments of the flights parsed but not returned.
+            for result in pending:
+                try:
+                    sharedmem.discard(result.get())
+                except Exception:
+                    pass
+
+
+def train_config(flights, config_class=FlightParsingConfig,
+                 name='TrainedFlightParsingConfig', iterations=100,
+                 processes=None):
+    """Fits the hidden Markov models of a FlightParsingConfig to flights.
+
+    The flying and the circling models are trained with the Baum-Welch
+    algorithm on the emissions of the flights, starting from the models of
+    config_class. The circling emissions come from the flight detection
+    of the flights, they should be parsed with config_class.
+
+    Args:
+        flights: an iterable of Flight objects, e.g. from
+        parse_in_processes(); invalid flights are skipped
+        config_class: a class that implements FlightParsingConfig
+        name: a string, the name of the returned class
+        iterations: an integer, the maximum number of Baum-Welch iterations
+        processes: an integer, the number of workers, by default the
+        number of CPUs
+
+    Returns:
+        A subclass of config_class with the fitted flying_model and
+        circling_model. It is not importable, see
+        FlightParsingConfig.to_source() to deploy it.
+    """
+    flying_emissions = []
+    circling_emissions = []
+    for flight in flights:
+        if not flight.valid:
+            continue
+        flying_emissions.append(
+            np.array(flight._flying_emissions(), dtype=np.int8))
+        circling_emissions.append(
+            np.array(flight._circling_emissions(), dtype=np.int8))
+    flying_model, _ = baum_welch.train(
+        flying_emissions, config_class.flying_model, iterations=iterations,
+        processes=processes)
+    circling_model, _ = baum_welch.train(
+        circling_emissions, config_class.circling_model,
+        iterations=iterations, processes=processes)
+    return type(name, (config_class,), {
+        '__doc__': "%s fitted to %d flights." % (
+            config_class.__name__, len(flying_emissions)),
+        'flying_model': flying_model,
+        'circling_model': circling_model,
+    })
@@ -0,0 +1,958 @@
+#!/usr/bin/env python
+"""Micro-benchmarks for igc_lib.
+
+Runs on synthetic IGC files, so that no real flights are needed:
+  python igc_lib_benchmark.py [benchmark name ...]
+"""
+from __future__ import print_function
+
+import gc
+import io
+import math
+import os
+import pickle
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+
+import igc_lib
+from LocalStorageClient import LocalStorageClient
+from lib import baum_welch, extensions, geo, records, sharedmem, viterbi
+from lib.intervals import IntervalIndex
+from lib.prefetch import PrefetchingReader
+
+
+def synthetic_igc(hours=8.0, fix_rate=1, seed=0, start_rawtime=9*3600):
+    """Builds the content of an IGC file with a plausible glider flight.
+
+    The flight starts and ends with 10 minutes on the ground, in between
+    it alternates thermals (25 second circles) and straight glides.
+
+    Args:
+        hours: a float, the length of the recording
+        fix_rate: an integer, the number of fixes per second
+        seed: an integer, the seed of the random generator
+        start_rawtime: an integer, time of the first fix, UTC seconds
+
+    Returns:
+        The IGC file, as bytes.
+    """
+    rnd = random.Random(seed)
+    lines = ["AXCSABC", "HFDTE150720",
+             "HFPLTPILOTINCHARGE: John Doe",
+             "HFGTYGLIDERTYPE: LS8",
+             "HFGIDGLIDERID: D-1234",
+             "HFFTYFRTYPE: XCSoar",
+             "I033638FXA3941ENL4244TAS"]
+    lat, lon, alt = 45.0, 5.0, 300.0
+    heading = 90.0
+    mode, mode_time, climb = "glide", 0.0, 0.0
+    time_step = 1.0 / fix_rate
+    fixes_num = int(hours * 3600 * fix_rate)
+    ground_fixes = 600 * fix_rate
+    for i in range(fixes_num):
+        if i < ground_fixes or i > fixes_num - ground_fixes:
+            speed, turn, vario = 0.0, 0.0, 0.0
+        else:
+            if mode_time <= 0.0:
+                if mode == "thermal":
+                    mode, mode_time = "glide", rnd.uniform(200, 600)
+                else:
+                    mode, mode_time = "thermal", rnd.uniform(120, 400)
+                    climb = rnd.uniform(-0.5, 3.0)
+            mode_time -= time_step
+            if mode == "thermal":
+                speed, turn, vario = 90.0, 360.0 / 25.0, climb
+            else:
+                speed, turn, vario = 110.0, rnd.gauss(0, 1.0), -1.0
+        heading = (heading + turn * time_step) % 360.0
+        step = math.degrees(speed / 3.6 * time_step / 1000.0 / 6371.0)
+        lat += step * math.cos(math.radians(heading))
+        lon += (step * math.sin(math.radians(heading)) /
+                math.cos(math.radians(lat)))
+        alt = max(alt + vario * time_step + rnd.gauss(0, 0.3), 250.0)
+
+        rawtime = int(start_rawtime + i * time_step) % 86400
+        lat_min = int(round(lat * 60000))
+        lon_min = int(round(lon * 60000))
+        lines.append(
+            "B%02d%02d%02d%02d%05dN%03d%05dEA%05d%05d%03d%03d%03d" % (
+                rawtime // 3600, rawtime % 3600 // 60, rawtime % 60,
+                lat_min // 60000, lat_min % 60000,
+                lon_min // 60000, lon_min % 60000,
+                int(alt), int(alt) + 20, rnd.randint(1, 30),
+                rnd.randint(0, 999), int(speed)))
+    lines.append("GABCDEF")
+    return ("\r\n".join(lines) + "\r\n").encode(records.ENCODING)
+
+
+def _best_time(function, number=5):
+    """Returns the best time of a single call, in seconds."""
+    return min(timeit.repeat(function, number=1, repeat=number))
+
+
+def _report(name, baseline, optimized):
+    print("%-40s %10.2f ms %10.2f ms %8.1fx" % (
+        name, baseline * 1000.0, optimized * 1000.0, baseline / optimized))
+
+
+def _report_memory(name, baseline, optimized):
+    print("%-40s %10.1f MB %10.1f MB %8.1fx" % (
+        name, baseline / 1e6, optimized / 1e6, baseline / optimized))
+
+
+def _traced_memory(function):
+    """Measures the memory held by the result of a call.
+
+    Returns:
+        A (held, leaked) tuple, the bytes allocated by the call and still
+        held by its result, and the bytes still allocated once the result
+        is deleted, before any garbage collection.
+    """
+    gc.collect()
+    gc.disable()
+    tracemalloc.start()
+    try:
+        result = function()
+        held = tracemalloc.get_traced_memory()[0]
+        del result
+        leaked = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+        gc.enable()
+        gc.collect()
+    return held, leaked
+
+
+def _peak_memory(function):
+    """Returns the peak of the bytes allocated during a call."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class _OriginalFix(object):
+    """A fix as built by the original per-line B record parser."""
+
+    def __init__(self, rawtime, lat, lon, validity, press_alt, gnss_alt,
+                 index, extras):
+        self.rawtime = rawtime
+        self.lat = lat
+        self.lon = lon
+        self.validity = validity
+        self.press_alt = press_alt
+        self.gnss_alt = gnss_alt
+        self.index = index
+        self.extras = extras
+        self.flight = None
+
+
+def _original_B_record(B_record_line, index):
+    """The original GNSSFix.build_from_B_record(), before lib/records.py."""
+    match = re.match(
+        '^B' + r'(\d\d)(\d\d)(\d\d)'
+        + r'(\d\d)(\d\d)(\d\d\d)([NS])'
+        + r'(\d\d\d)(\d\d)(\d\d\d)([EW])'
+        + '([AV])' + r'([-\d]\d\d\d\d)' + r'([-\d]\d\d\d\d)'
+        + r'([0-9a-zA-Z\-]*).*$', B_record_line)
+    if match is None:
+        return None
+    (hours, minutes, seconds,
+     lat_deg, lat_min, lat_min_dec, lat_sign,
+     lon_deg, lon_min, lon_min_dec, lon_sign,
+     validity, press_alt, gnss_alt,
+     extras) = match.groups()
+
+    rawtime = (float(hours)*60.0 + float(minutes))*60.0 + float(seconds)
+
+    lat = float(lat_deg)
+    lat += float(lat_min) / 60.0
+    lat += float(lat_min_dec) / 1000.0 / 60.0
+    if lat_sign == 'S':
+        lat = -lat
+
+    lon = float(lon_deg)
+    lon += float(lon_min) / 60.0
+    lon += float(lon_min_dec) / 1000.0 / 60.0
+    if lon_sign == 'W':
+        lon = -lon
+
+    return _OriginalFix(rawtime, lat, lon, validity, float(press_alt),
+                        float(gnss_alt), index, extras)
+
+
+def benchmark_b_records():
+    """Per-line B record parsing vs whole-buffer decoding."""
+    buffer = synthetic_igc(hours=8.0)
+
+    def original():
+        fixes = []
+        for line in buffer.decode(records.ENCODING).splitlines():
+            if line and line[0] == 'B':
+                fix = _original_B_record(line, len(fixes))
+                if fix is not None:
+                    fixes.append(fix)
+
+    def compiled_regex():
+        for line in buffer.decode(records.ENCODING).splitlines():
+            if line and line[0] == 'B':
+                records.parse_B_record(line)
+
+    def whole_buffer():
+        records.read_records(buffer)
+
+    whole_buffer_time = _best_time(whole_buffer)
+    _report("B records, 1 Hz, 8 h", _best_time(original),
+            whole_buffer_time)
+    _report("B records vs compiled regex loop", _best_time(compiled_regex),
+            whole_buffer_time)
+
+
+def _dispatch_loop(lines):
+    """The per-line record dispatch loop of the former constructors."""
+    a_records, h_records, i_records, fixes = [], [], [], []
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode(records.ENCODING)
+        line = line.replace('\n', '').replace('\r', '')
+        if not line:
+            continue
+        if line[0] == 'A':
+            a_records.append(line)
+        elif line[0] == 'B':
+            fix = records.parse_B_record(line)
+            if fix is not None:
+                fixes.append(fix)
+        elif line[0] == 'I':
+            i_records.append(line)
+        elif line[0] == 'H':
+            h_records.append(line)
+    return a_records, h_records, i_records, fixes
+
+
+def benchmark_record_reader():
+    """Per-line dispatch loops vs the streaming record reader."""
+    buffer = synthetic_igc(hours=8.0)
+    lines = buffer.decode(records.ENCODING).splitlines(True)
+
+    _report("Records from BytesIO, 1 Hz, 8 h",
+            _best_time(lambda: _dispatch_loop(io.BytesIO(buffer))),
+            _best_time(lambda: records.read_records(io.BytesIO(buffer))))
+    _report("Records from lines, 1 Hz, 8 h",
+            _best_time(lambda: _dispatch_loop(lines)),
+            _best_time(lambda: records.read_records(lines)))
+
+
+def benchmark_local_files():
+    """Text I/O with per-line dispatch vs memory-mapped files."""
+    directory = tempfile.mkdtemp()
+    try:
+        filenames = []
+        for seed in range(10):
+            filename = os.path.join(directory, "%d.igc" % seed)
+            with open(filename, 'wb') as igc_file:
+                igc_file.write(synthetic_igc(hours=4.0, seed=seed))
+            filenames.append(filename)
+
+        def text_io():
+            for filename in filenames:
+                with open(filename, 'r', encoding=records.ENCODING) as lines:
+                    _dispatch_loop(lines)
+
+        def mapped():
+            for filename in filenames:
+                with records.map_file(filename) as buffer:
+                    records.read_records(buffer)
+
+        _report("Records of 10 local files, 4 h each",
+                _best_time(text_io), _best_time(mapped))
+    finally:
+        shutil.rmtree(directory)
+
+
+def benchmark_peek_header():
+    """Full parse of a local file vs reading its header only."""
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, "flight.igc")
+        with open(filename, 'wb') as igc_file:
+            igc_file.write(synthetic_igc(hours=8.0))
+
+        _report("Header of a local file, 1 Hz, 8 h",
+                _best_time(lambda: igc_lib.Flight.create_from_path(filename)),
+                _best_time(lambda: igc_lib.peek_header(filename)))
+    finally:
+        shutil.rmtree(directory)
+
+
+def benchmark_extensions():
+    """Per-fix slicing of B record extensions vs bulk decoding."""
+    buffer = synthetic_igc(hours=8.0)
+    _, _, i_records, store = records.read_records(buffer)
+    fields = extensions.parse_I_record(i_records[0])
+    extras = [value.decode(records.ENCODING) for value in store.extras]
+
+    def per_fix():
+        columns = dict((field.code, []) for field in fields)
+        for value in extras:
+            for field in fields:
+                columns[field.code].append(
+                    int(value[field.start:field.end]))
+
+    _report("B record extensions, 1 Hz, 8 h", _best_time(per_fix),
+            _best_time(lambda: extensions.decode_extensions(store.extras,
+                                                            fields)))
+
+
+def benchmark_incremental_flight():
+    """Re-parsing a growing live track vs an IncrementalFlight."""
+    lines = synthetic_igc(hours=1.0).decode(records.ENCODING).splitlines()
+    updates = range(60, len(lines) + 60, 60)
+
+    def reparse():
+        for end in updates:
+            flight = igc_lib.Flight.create_from_lines(lines[:end])
+            if flight.valid:
+                flight.thermals
+
+    def incremental():
+        flight = igc_lib.IncrementalFlight()
+        for end in updates:
+            flight.append_lines(lines[end - 60:end])
+            flight.thermals
+        flight.finish()
+
+    _report("Live track, 1 Hz, 1 h, update every 60 s",
+            _best_time(reparse, number=1), _best_time(incremental))
+
+
+class _ObjectFix(object):
+    """A fix object with per-instance attributes and a Flight reference,
+    as fixes were stored before the columnar FixStore."""
+
+    def __init__(self, rawtime, lat, lon, validity, press_alt, gnss_alt,
+                 index, extras, flight):
+        self.rawtime = rawtime
+        self.lat = lat
+        self.lon = lon
+        self.validity = validity
+        self.press_alt = press_alt
+        self.gnss_alt = gnss_alt
+        self.index = index
+        self.extras = extras
+        self.flight = flight
+        self.timestamp = rawtime + 1.5e9
+        self.alt = press_alt
+        self.gsp = 0.0
+        self.bearing = 0.0
+        self.bearing_change_rate = 0.0
+        self.flying = False
+        self.circling = False
+
+
+def benchmark_fix_memory():
+    """Per-fix objects vs fixes as views of the columnar FixStore."""
+    buffer = synthetic_igc(hours=30000 / 3600.0)
+    lines = buffer.decode(records.ENCODING).splitlines()
+
+    def object_fixes():
+        flight = type('Flight', (object,), {})()
+        flight.fixes = []
+        for line in lines:
+            if line.startswith('B'):
+                fields = records.parse_B_record(line)
+                flight.fixes.append(_ObjectFix(
+                    *fields[:6], index=len(flight.fixes), extras=fields[6],
+                    flight=flight))
+        return flight
+
+    def columnar_fixes():
+        flight = igc_lib.Flight.create_from_buffer(buffer)
+        flight.fixes[0].bearing
+        return flight
+
+    object_held, object_leaked = _traced_memory(object_fixes)
+    columnar_held, columnar_leaked = _traced_memory(columnar_fixes)
+    _report_memory("Memory of a flight, 30k fixes",
+                   object_held, columnar_held)
+    _report_memory("Memory left after del, before gc",
+                   object_leaked, max(columnar_leaked, 1))
+
+
+def benchmark_flight_cache():
+    """Parsing and analysing a flight vs rebuilding it from the cache."""
+    buffer = synthetic_igc(hours=8.0)
+    directory = tempfile.mkdtemp()
+    try:
+        flight_cache = igc_lib.FlightCache(directory)
+        flight_cache.create_from_buffer(buffer)
+
+        def parse():
+            igc_lib.Flight.create_from_buffer(buffer).thermals
+
+        _report("Analysed flight, 1 Hz, 8 h", _best_time(parse),
+                _best_time(lambda: flight_cache.create_from_buffer(buffer)))
+    finally:
+        shutil.rmtree(directory)
+
+
+def benchmark_decimation():
+    """Decimating the fixes after the analysis vs at parse time."""
+    buffer = synthetic_igc(hours=8.0)
+
+    def decimate_after():
+        flight = igc_lib.Flight.create_from_buffer(buffer)
+        return [(fix.lat, fix.lon) for fix in flight.fixes[::4]]
+
+    def decimate_at_parse():
+        flight = igc_lib.Flight.create_from_buffer(
+            buffer, decimation=igc_lib.DecimationPolicy(every=4))
+        return [(fix.lat, fix.lon) for fix in flight.fixes]
+
+    _report("Track of every 4th fix, 1 Hz, 8 h",
+            _best_time(decimate_after), _best_time(decimate_at_parse))
+
+
+class _LongFlightsConfig(igc_lib.FlightParsingConfig):
+    min_flight_duration = 3 * 3600
+
+
+def benchmark_filter_push_down():
+    """Rejecting a short flight after the analysis vs while parsing."""
+    buffer = synthetic_igc(hours=2.0)
+
+    def filter_after():
+        flight = igc_lib.Flight.create_from_buffer(buffer)
+        return flight.valid and flight.duration >= 3 * 3600
+
+    def filter_pushed_down():
+        flight = igc_lib.Flight.create_from_buffer(
+            buffer, _LongFlightsConfig)
+        return flight.valid
+
+    _report("Reject a 2 h flight, min duration 3 h",
+            _best_time(filter_after), _best_time(filter_pushed_down))
+
+
+_H_RECORDS = [
+    "HFDTE150720",
+    "HFFXA035",
+    "HFPLTPILOTINCHARGE:John Doe",
+    "HFCM2CREW2:",
+    "HFGTYGLIDERTYPE:ASW 27",
+    "HFGIDGLIDERID:D-1234",
+    "HFDTM100GPSDATUM:WGS-1984",
+    "HFRFWFIRMWAREVERSION:1.2",
+    "HFRHWHARDWAREVERSION:3.4",
+    "HFFTYFRTYPE:LXNAV,LX8000",
+    "HFGPSuBLOX LEA-4P,16,8000",
+    "HFPRSPRESSALTSENSOR:INTERSEMA,MS5534A,8000",
+    "HFCIDCOMPETITIONID:XY",
+    "HFCCLCOMPETITIONCLASS:Club",
+    "HFSITSITE:Chambley",
+    "HFTZNTIMEZONE:+2.00",
+]
+
+
+def _strip_chars(string):
+    printable = set("0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKL"
+                    "MNOPQRSTUVWXYZ!\"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~ ")
+    return ''.join([x for x in string if x in printable])
+
+
+def _chained_h_record(header, record):
+    """The H record parser before the dispatch table, for reference."""
+    if record[0:5] == 'HFDTE':
+        match = re.match('(?:HFDTE|HFDTEDATE:[ ]*)(\\d\\d)(\\d\\d)(\\d\\d)',
+                         record, flags=re.IGNORECASE)
+        if match:
+            header.date = [_strip_chars(group) for group in match.groups()]
+        return
+    patterns = (
+        ('HFGTY', 'HFGTY[ ]*GLIDER[ ]*TYPE[ ]*:[ ]*(.*)', 'glider_type'),
+        ('HFRFW', 'HFR[FH]W[ ]*FIRMWARE[ ]*VERSION[ ]*:[ ]*(.*)',
+         'fr_firmware_version'),
+        ('HFRHW', 'HFR[FH]W[ ]*HARDWARE[ ]*VERSION[ ]*:[ ]*(.*)',
+         'fr_hardware_version'),
+        ('HFFTY', 'HFFTY[ ]*FR[ ]*TYPE[ ]*:[ ]*(.*)', 'fr_recorder_type'),
+        ('HFGPS', 'HFGPS(?:[: ]|(?:GPS))*(.*)', 'fr_gps_receiver'),
+        ('HFPRS', 'HFPRS[ ]*PRESS[ ]*ALT[ ]*SENSOR[ ]*:[ ]*(.*)',
+         'fr_pressure_sensor'),
+        ('HFCCL', 'HFCCL[ ]*COMPETITION[ ]*CLASS[ ]*:[ ]*(.*)',
+         'competition_class'),
+        ('HFPLT', 'HFPLT[ ]*PILOT.*:[ ]*(.*)', 'pilot_name'),
+        ('HFGID', 'HFGID[ ]*GLIDERID[ ]*:[ ]*(.*)', 'glider_id'),
+    )
+    for prefix, pattern, attribute in patterns:
+        if record[0:5] == prefix:
+            match = re.match(pattern, record, flags=re.IGNORECASE)
+            if match:
+                setattr(header, attribute, _strip_chars(match.group(1)))
+            return
+
+
+def benchmark_h_records():
+    """Chained H record matching vs the compiled dispatch table."""
+    h_records = _H_RECORDS * 100
+
+    def chained():
+        header = igc_lib.FlightHeader()
+        for record in h_records:
+            _chained_h_record(header, record)
+
+    _report("H records, 1600 lines", _best_time(chained),
+            _best_time(lambda: igc_lib.FlightHeader.create_from_records(
+                [], h_records, [])))
+
+
+def benchmark_streaming():
+    """Downloading a blob then parsing it vs parsing while downloading."""
+    directory = tempfile.mkdtemp()
+    try:
+        # 5 ms of network latency per 256 KB read.
+        client = LocalStorageClient(directory,
+                                    read_delay=lambda: time.sleep(0.005))
+        blob = client.bucket("bucket").blob("flight.igc")
+        blob.upload_from_string(synthetic_igc(hours=8.0))
+        chunk_size = 256 * 1024
+
+        def download_then_parse():
+            flight_file = io.BytesIO()
+            with blob.open("rb") as blob_file:
+                while True:
+                    chunk = blob_file.read(chunk_size)
+                    if not chunk:
+                        break
+                    flight_file.write(chunk)
+            flight_file.seek(0)
+            igc_lib.Flight.create_from_bytesio(flight_file)
+
+        def streamed():
+            with PrefetchingReader(blob.open("rb"), chunk_size) as stream:
+                igc_lib.Flight.create_from_source(stream)
+
+        _report("Blob of a flight, 1 Hz, 8 h", _best_time(download_then_parse),
+                _best_time(streamed))
+        _report_memory("Peak memory of the parse",
+                       _peak_memory(download_then_parse),
+                       _peak_memory(streamed))
+    finally:
+        shutil.rmtree(directory)
+
+
+def benchmark_shared_memory():
+    """Pickling a flight of fix objects vs sharing its columns."""
+    flight = igc_lib.Flight.create_from_buffer(synthetic_igc(hours=8.0))
+    flight.thermals
+    fixes = [_ObjectFix(fix.rawtime, fix.lat, fix.lon, fix.validity,
+                        fix.press_alt, fix.gnss_alt, fix.index, fix.extras,
+                        None) for fix in flight.fixes]
+    arrays = flight.to_arrays()
+
+    def pickled():
+        return pickle.loads(pickle.dumps(fixes, pickle.HIGHEST_PROTOCOL))
+
+    def shared():
+        descriptor = pickle.loads(pickle.dumps(
+            sharedmem.export_arrays(arrays), pickle.HIGHEST_PROTOCOL))
+        return igc_lib.Flight.from_shared_memory(descriptor)
+
+    _report("Flight to the parent process, 1 Hz, 8 h", _best_time(pickled),
+            _best_time(shared))
+
+
+def benchmark_kinematics():
+    """Per-fix ground speeds and bearings vs a single NumPy pass."""
+    flight = igc_lib.Flight.create_from_buffer(synthetic_igc(hours=8.0))
+    data = flight._store.data
+    lat = data['lat'].tolist()
+    lon = data['lon'].tolist()
+    rawtime = data['rawtime'].tolist()
+
+    def per_fix():
+        gsp = [0.0] * len(rawtime)
+        for i in range(1, len(rawtime)):
+            dist = geo.earth_distance(lat[i], lon[i], lat[i-1], lon[i-1])
+            time_change = rawtime[i] - rawtime[i-1]
+            if math.fabs(time_change) >= 1e-5:
+                gsp[i] = dist/time_change*3600.0
+        bearing = [0.0] * len(lat)
+        for i in range(len(lat) - 1):
+            bearing[i] = geo.bearing_to(lat[i], lon[i], lat[i+1], lon[i+1])
+        bearing[-1] = bearing[-2]
+
+    _report("Ground speeds and bearings, 1 Hz, 8 h", _best_time(per_fix),
+            _best_time(flight._compute_kinematics))
+
+
+def _scanning_bearing_change_rates(timestamp, bearing, min_time):
+    """The bearing change rates, scanning back from every fix."""
+    bearing_change_rate = [0.0] * len(timestamp)
+    for curr_fix in range(len(timestamp)):
+        prev_fix = None
+        for i in range(curr_fix - 1, 0, -1):
+            if math.fabs(timestamp[curr_fix] - timestamp[i]) > min_time:
+                prev_fix = i
+                break
+        if prev_fix is not None:
+            bearing_change = bearing[prev_fix] - bearing[curr_fix]
+            if math.fabs(bearing_change) > 180.0:
+                if bearing_change < 0.0:
+                    bearing_change += 360.0
+                else:
+                    bearing_change -= 360.0
+            bearing_change_rate[curr_fix] = (
+                bearing_change / (timestamp[prev_fix] - timestamp[curr_fix]))
+    return bearing_change_rate
+
+
+def benchmark_bearing_change_rates():
+    """Backward scan per fix vs searchsorted, at growing window widths.
+
+    Fixes have a one second resolution, a wider window stands in for a
+    higher fix rate: both put more fixes within min_time_for_bearing_change.
+    """
+    for min_time_for_bearing_change in (5.0, 25.0, 50.0):
+        config = igc_lib.FlightParsingConfig()
+        config.min_time_for_bearing_change = min_time_for_bearing_change
+        flight = igc_lib.Flight.create_from_buffer(
+            synthetic_igc(hours=8.0), config_class=lambda: config)
+        timestamp = flight._store.column('timestamp').tolist()
+        bearing = flight._store.column('bearing').tolist()
+        min_time = min_time_for_bearing_change - 1e-7
+
+        def scanning():
+            _scanning_bearing_change_rates(timestamp, bearing, min_time)
+
+        _report("Bearing change rates, %d s window, 8 h" % (
+                    min_time_for_bearing_change),
+                _best_time(scanning, number=1),
+                _best_time(flight._compute_bearing_change_rates))
+
+
+def benchmark_viterbi_batch():
+    """Decoding flights one at a time vs in a single batched call."""
+    sequences = []
+    for seed in range(200):
+        flight = igc_lib.Flight.create_from_buffer(
+            synthetic_igc(hours=1.0, seed=seed))
+        sequences.append(flight._circling_emissions())
+    decoder = viterbi.SimpleViterbiDecoder(
+        **igc_lib.FlightParsingConfig.circling_model)
+
+    def one_at_a_time():
+        return [decoder.decode(sequence) for sequence in sequences]
+
+    def batched():
+        return decoder.decode_batch(sequences)
+
+    assert one_at_a_time() == batched()
+    _report("Circling states, 200 flights of 1 h", _best_time(one_at_a_time),
+            _best_time(batched))
+
+
+def benchmark_baum_welch():
+    """A Baum-Welch iteration one flight at a time vs in batches."""
+    sequences = []
+    for seed in range(100):
+        flight = igc_lib.Flight.create_from_buffer(
+            synthetic_igc(hours=1.0, seed=seed))
+        sequences.append(flight._circling_emissions())
+    model = igc_lib.FlightParsingConfig.circling_model
+
+    def one_at_a_time():
+        baum_welch.train(sequences, model, iterations=1, processes=1,
+                         max_batch_cells=1)
+
+    def batched():
+        baum_welch.train(sequences, model, iterations=1, processes=1)
+
+    _report("Baum-Welch iteration, 100 flights of 1 h",
+            _best_time(one_at_a_time, number=1),
+            _best_time(batched, number=3))
+
+
+def _looped_fix_checks(press_alt, gnss_alt, rawtime, config):
+    """The altitude and rawtime checks of Flight, one fix pair at a time."""
+    counts = [0] * 4
+    sums = [0.0] * 2
+    for i in range(len(rawtime) - 1):
+        rawtime_delta = math.fabs(rawtime[i+1] - rawtime[i])
+        for j, alt in enumerate((press_alt, gnss_alt)):
+            alt_delta = math.fabs(alt[i+1] - alt[i])
+            if rawtime_delta > 0.5:
+                if alt_delta / rawtime_delta > config.max_alt_change_rate:
+                    counts[j] += 1
+                else:
+                    sums[j] += alt_delta
+            if alt[i] > config.max_alt or alt[i] < config.min_alt:
+                counts[j + 2] += 1
+    rawtime = list(rawtime)
+    rawtime_to_add = 0.0
+    exceeded = 0
+    for i in range(1, len(rawtime)):
+        rawtime[i] += rawtime_to_add
+        if (rawtime[i-1] > rawtime[i] and
+                rawtime[i] + 86400.0 < rawtime[i-1] + 200.0):
+            rawtime_to_add += 86400.0
+            rawtime[i] += 86400.0
+        time_change = rawtime[i] - rawtime[i-1]
+        if time_change < config.min_seconds_between_fixes - 1e-5:
+            exceeded += 1
+        if time_change > config.max_seconds_between_fixes + 1e-5:
+            exceeded += 1
+    return counts, sums, rawtime, exceeded
+
+
+def benchmark_fix_checks():
+    """Altitude and 0:00 UTC checks, per fix pair vs on the columns."""
+    flight = igc_lib.Flight.create_from_buffer(synthetic_igc(
+        hours=8.0, start_rawtime=20*3600))
+    press_alt = flight._store.column('press_alt').tolist()
+    gnss_alt = flight._store.column('gnss_alt').tolist()
+    # The raw times, crossing 0:00 UTC.
+    rawtime = np.mod(flight._store.column('rawtime'), 86400.0)
+
+    def looped():
+        _looped_fix_checks(press_alt, gnss_alt, rawtime.tolist(),
+                           flight._config)
+
+    def vectorized():
+        flight._store.data['rawtime'] = rawtime
+        flight.notes = []
+        flight._check_altitudes()
+        flight._check_fix_rawtime()
+
+    _report("Fix checks, 1 Hz, 8 h over 0:00 UTC", _best_time(looped),
+            _best_time(vectorized))
+
+
+def _looped_segmentation(flight, outputs):
+    """Landing detection, takeoff/landing and thermals, fix by fix."""
+    rawtime = flight._store.column('rawtime').tolist()
+    min_landing_time = flight._config.min_landing_time
+    flying = [False] * len(outputs)
+    decided = None
+    for i, output in enumerate(outputs):
+        if output == 1:
+            flying[i] = True
+            decided = None
+            continue
+        if decided is None:
+            j = i + 1
+            while j < len(outputs) and outputs[j] != 1:
+                j += 1
+            decided = (j < len(outputs) and
+                       rawtime[j] - rawtime[i] < min_landing_time)
+        flying[i] = decided
+
+    takeoff_index = landing_index = None
+    was_flying = False
+    for i, flag in enumerate(flying):
+        if flag and takeoff_index is None:
+            takeoff_index = i
+        if not flag and was_flying:
+            landing_index = i
+        was_flying = flag
+    if landing_index is None:
+        landing_index = len(flying) - 1
+
+    circling = flight._store.column('circling').tolist()
+    lat = flight._store.column('lat').tolist()
+    lon = flight._store.column('lon').tolist()
+    finder = igc_lib._ThermalFinder(flight.fixes, flight._config,
+                                    flight.intervals)
+    glide_fixes = []
+    for i in range(takeoff_index, landing_index + 1):
+        finder.step(i, circling[i], lat[i], lon[i])
+        # The glides held a copy of their fixes.
+        glide_fixes.append(flight.fixes[i])
+    finder.finish()
+
+
+def benchmark_segmentation():
+    """Flight states, thermals and glides, fix by fix vs from their runs."""
+    flight = igc_lib.Flight.create_from_buffer(synthetic_igc(hours=8.0))
+    flight.thermals
+    outputs = flight._store.column('flying').astype(int).tolist()
+
+    def segmented():
+        flight._store.set_column('flying',
+                                 flight._apply_min_landing_time(outputs))
+        flight._compute_takeoff_landing()
+        flight._find_thermals()
+
+    _report("Flight segmentation, 1 Hz, 8 h",
+            _best_time(lambda: _looped_segmentation(flight, outputs)),
+            _best_time(segmented))
+
+
+def benchmark_cached_glides():
+    """Rebuilding a cached flight: copied vs lazy glide fixes."""
+    flight = igc_lib.Flight.create_from_buffer(synthetic_igc(hours=8.0))
+    arrays = flight.to_arrays()
+
+    def copied():
+        restored = igc_lib.Flight.from_arrays(arrays)
+        for glide in restored.glides:
+            glide.fixes = list(glide.fixes)
+
+    _report("Flight from arrays, 1 Hz, 8 h",
+            _best_time(copied),
+            _best_time(lambda: igc_lib.Flight.from_arrays(arrays)))
+
+
+def _walked_range_statistics(fixes, start, end):
+    """Distance, altitude gain and circling time of fixes start to end."""
+    distance = 0.0
+    gain = 0.0
+    circling_time = 0.0
+    for fix, next_fix in zip(fixes[start:end], fixes[start + 1:end + 1]):
+        distance += fix.distance_to(next_fix)
+        gain += max(next_fix.alt - fix.alt, 0.0)
+        if fix.circling:
+            circling_time += next_fix.timestamp - fix.timestamp
+    return distance, gain, circling_time
+
+
+def benchmark_interval_queries():
+    """Range statistics: walking the fixes vs prefix sums."""
+    flight = igc_lib.Flight.create_from_buffer(synthetic_igc(hours=8.0))
+    flight.thermals
+    rng = random.Random(0)
+    ranges = []
+    for _ in range(200):
+        start = rng.randrange(len(flight.fixes) - 1)
+        ranges.append((start, min(start + rng.randrange(1, 1800),
+                                  len(flight.fixes) - 1)))
+
+    def walked():
+        for start, end in ranges:
+            _walked_range_statistics(flight.fixes, start, end)
+
+    def indexed():
+        intervals = IntervalIndex(flight._store)
+        for start, end in ranges:
+            (intervals.distance(start, end), intervals.alt_gain(start, end),
+             intervals.circling_time(start, end))
+
+    _report("Range statistics, 200 ranges, 8 h",
+            _best_time(walked, number=1), _best_time(indexed))
+
+
+def benchmark_analysis_profiles():
+    """The full analysis vs each analysis profile, on a corpus."""
+    corpus = [synthetic_igc(hours=4.0, seed=seed) for seed in range(6)]
+
+    def analyse(profile):
+        config_class = type('ProfileConfig', (igc_lib.FlightParsingConfig,),
+                            {'analysis_profile': profile})
+        flights = [igc_lib.Flight.create_from_buffer(buffer, config_class)
+                   for buffer in corpus]
+        if profile in ('thermals', 'full'):
+            for flight in flights:
+                flight.thermals
+        return flights
+
+    full_time = _best_time(lambda: analyse('full'))
+    full_held, _ = _traced_memory(lambda: analyse('full'))
+    for profile in igc_lib.Flight.ANALYSIS_PROFILES[:-1]:
+        _report("Profile %s, 6 flights, 4 h" % profile, full_time,
+                _best_time(lambda: analyse(profile)))
+        held, _ = _traced_memory(lambda: analyse(profile))
+        _report_memory("Memory of profile %s" % profile, full_held, held)
+
+
+def _scanned_position(fixes, timestamp):
+    """The position at a time, from a linear scan over the fixes."""
+    previous = None
+    for fix in fixes:
+        if fix.timestamp >= timestamp:
+            if previous is None or fix.timestamp == timestamp:
+                return fix.lat, fix.lon, fix.alt
+            weight = ((timestamp - previous.timestamp) /
+                      (fix.timestamp - previous.timestamp))
+            return tuple(a + (b - a) * weight for a, b in zip(
+                (previous.lat, previous.lon, previous.alt),
+                (fix.lat, fix.lon, fix.alt)))
+        previous = fix
+    return math.nan, math.nan, math.nan
+
+
+def benchmark_time_lookup():
+    """Positions by time: scanning the fixes vs the time index."""
+    flight = igc_lib.Flight.create_from_buffer(synthetic_igc(hours=8.0))
+    first = flight.fixes[0].timestamp
+    last = flight.fixes[-1].timestamp
+    rng = random.Random(0)
+    timestamps = [rng.uniform(first, last) for _ in range(100)]
+
+    def scanned():
+        for timestamp in timestamps:
+            _scanned_position(flight.fixes, timestamp)
+
+    def indexed():
+        for timestamp in timestamps:
+            flight.at(timestamp)
+
+    _report("Positions at 100 times, 8 h",
+            _best_time(scanned, number=1), _best_time(indexed))
+
+    many = np.linspace(first, last, 10000)
+
+    def one_by_one():
+        for timestamp in many:
+            flight.at(timestamp)
+
+    _report("Positions at 10000 times, one call",
+            _best_time(one_by_one), _best_time(lambda: flight.at(many)))
+
+
+BENCHMARKS = [
+    benchmark_b_records,
+    benchmark_record_reader,
+    benchmark_local_files,
+    benchmark_peek_header,
+    benchmark_extensions,
+    benchmark_incremental_flight,
+    benchmark_fix_memory,
+    benchmark_flight_cache,
+    benchmark_decimation,
+    benchmark_filter_push_down,
+    benchmark_h_records,
+    benchmark_streaming,
+    benchmark_shared_memory,
+    benchmark_kinematics,
+    benchmark_bearing_change_rates,
+    benchmark_viterbi_batch,
+    benchmark_baum_welch,
+    benchmark_fix_checks,
+    benchmark_segmentation,
+    benchmark_cached_glides,
+    benchmark_interval_queries,
+    benchmark_analysis_profiles,
+    benchmark_time_lookup,
+]
+
+
+def main(names):
+    print("%-40s %13s %13s %9s" % ("benchmark", "baseline", "optimized",
+                                   "speedup"))
+    for benchmark in BENCHMARKS:
+        if not names or benchmark.__name__ in names:
+            benchmark()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
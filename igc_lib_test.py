@@ -0,0 +1,841 @@
+#!/usr/bin/env python
+"""Unit tests of igc_lib and of its helpers in lib/.
+
+  python -m unittest igc_lib_test
+"""
+import bz2
+import datetime
+import gzip
+import io
+import lzma
+import os
+import tarfile
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+import numpy as np
+
+import igc_lib
+from igc_lib_benchmark import synthetic_igc
+from lib import extensions, geo, segments, sharedmem, viterbi
+
+
+class MaxTimeViolationsTest(unittest.TestCase):
+
+    def setUp(self):
+        # One fix every 55 seconds, all over max_seconds_between_fixes.
+        lines = synthetic_igc(hours=4.0).split(b'\r\n')
+        b_records = [line for line in lines if line.startswith(b'B')]
+        self.buffer = b'\r\n'.join(
+            [line for line in lines if not line.startswith(b'B')] +
+            b_records[::55])
+
+    def test_no_limit_by_default(self):
+        self.assertIsNone(igc_lib.FlightParsingConfig.max_time_violations)
+        flight = igc_lib.Flight.create_from_buffer(self.buffer)
+        self.assertNotEqual(flight.rejected_by, 'fix_times')
+
+    def test_limit(self):
+        class LimitedConfig(igc_lib.FlightParsingConfig):
+            max_time_violations = 10
+
+        flight = igc_lib.Flight.create_from_buffer(self.buffer,
+                                                   LimitedConfig)
+        self.assertFalse(flight.valid)
+        self.assertEqual(flight.rejected_by, 'fix_times')
+
+
+class OnlineViterbiDecoderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.model = igc_lib.FlightParsingConfig.circling_model
+        self.emissions = [0, 0, 1, 1, 1, 0, 1, 1, 0, 0, 0, 1]
+
+    def test_decode_as_simple_decoder(self):
+        simple = viterbi.SimpleViterbiDecoder(**self.model)
+        online = viterbi.OnlineViterbiDecoder(max_lag=5, **self.model)
+        self.assertEqual(online.decode(self.emissions),
+                         simple.decode(self.emissions))
+
+    def test_decode_batch_as_simple_decoder(self):
+        simple = viterbi.SimpleViterbiDecoder(**self.model)
+        online = viterbi.OnlineViterbiDecoder(max_lag=5, **self.model)
+        # Enough sequences for the vectorized decoder.
+        batch = [self.emissions[i:] for i in range(10)]
+        self.assertEqual(online.decode_batch(batch),
+                         simple.decode_batch(batch))
+
+    def test_push_after_decode(self):
+        online = viterbi.OnlineViterbiDecoder(max_lag=5, **self.model)
+        online.decode(self.emissions)
+        states = []
+        for emission in self.emissions:
+            states.extend(online.push(emission))
+        states.extend(online.flush())
+        self.assertEqual(len(states), len(self.emissions))
+
+
+
+class PeekRejectedFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        class LongFlightConfig(igc_lib.FlightParsingConfig):
+            min_flight_duration = 5 * 3600
+
+        # Rejected from its header, before the fixes are parsed.
+        self.flight = igc_lib.Flight.create_from_buffer(
+            synthetic_igc(hours=1.0), LongFlightConfig)
+
+    def test_rejected_by_time_span(self):
+        self.assertFalse(self.flight.valid)
+        self.assertEqual(self.flight.rejected_by, 'time_span')
+        self.assertEqual(len(self.flight.fixes), 0)
+
+    def test_intervals(self):
+        self.assertEqual(self.flight.intervals.distance(0, 0), 0.0)
+
+
+
+class GlideLengthTest(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer = synthetic_igc(hours=3.0)
+
+    def expected_lengths(self, flight):
+        """Sums the legs of each glide, sequentially."""
+        lengths = []
+        for i, glide in enumerate(flight.glides):
+            end = glide.exit_fix.index
+            if i < len(flight.glides) - 1:
+                # Glides ending at a thermal stop at the fix before it.
+                end = max(end - 1, glide.enter_fix.index)
+            fixes = flight.fixes[glide.enter_fix.index:end + 1]
+            lengths.append(sum(
+                (geo.earth_distance(fix.lat, fix.lon, next_fix.lat,
+                                    next_fix.lon)
+                 for fix, next_fix in zip(fixes, fixes[1:])), 0.0))
+        return lengths
+
+    def test_flight(self):
+        flight = igc_lib.Flight.create_from_buffer(self.buffer)
+        self.assertGreater(len(flight.glides), 2)
+        for glide, length in zip(flight.glides,
+                                 self.expected_lengths(flight)):
+            self.assertAlmostEqual(glide.track_length, length, places=9)
+
+    def test_incremental_flight(self):
+        flight = igc_lib.Flight.create_from_buffer(self.buffer)
+        incremental = igc_lib.IncrementalFlight()
+        incremental.append_lines(self.buffer.decode('ascii').splitlines())
+        incremental.finish()
+        self.assertEqual(
+            [(glide.enter_fix.index, glide.exit_fix.index)
+             for glide in incremental.glides],
+            [(glide.enter_fix.index, glide.exit_fix.index)
+             for glide in flight.glides])
+        for glide, length in zip(incremental.glides,
+                                 self.expected_lengths(flight)):
+            self.assertAlmostEqual(glide.track_length, length, places=9)
+
+
+class TimeLookupTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.flight = igc_lib.Flight.create_from_buffer(
+            synthetic_igc(hours=1.0))
+
+    def test_at_fix_time(self):
+        fix = self.flight.fixes[100]
+        position = self.flight.at(fix.timestamp)
+        self.assertEqual(position, (fix.lat, fix.lon, fix.alt))
+        self.assertTrue(all(type(value) is float for value in position))
+
+    def test_at_between_fixes(self):
+        fix, next_fix = self.flight.fixes[1000], self.flight.fixes[1001]
+        lat, lon, alt = self.flight.at(
+            (fix.timestamp + next_fix.timestamp) / 2.0)
+        self.assertAlmostEqual(lat, (fix.lat + next_fix.lat) / 2.0)
+        self.assertAlmostEqual(lon, (fix.lon + next_fix.lon) / 2.0)
+        self.assertAlmostEqual(alt, (fix.alt + next_fix.alt) / 2.0)
+
+    def test_at_out_of_range(self):
+        for timestamp in (self.flight.fixes[0].timestamp - 1,
+                          self.flight.fixes[-1].timestamp + 1):
+            self.assertTrue(all(np.isnan(self.flight.at(timestamp))))
+
+    def test_at_array(self):
+        fixes = self.flight.fixes
+        timestamps = np.array([fixes[0].timestamp - 1, fixes[10].timestamp,
+                               fixes[-1].timestamp])
+        lat, lon, alt = self.flight.at(timestamps)
+        self.assertEqual(lat.shape, (3,))
+        self.assertTrue(np.isnan(lat[0]))
+        self.assertEqual(alt[1:].tolist(), [fixes[10].alt, fixes[-1].alt])
+
+    def test_slice_time(self):
+        fixes = self.flight.fixes
+        window = self.flight.slice_time(fixes[10].timestamp,
+                                        fixes[20].timestamp)
+        self.assertEqual([fix.index for fix in window], list(range(10, 21)))
+        self.assertEqual(len(self.flight.slice_time(
+            fixes[10].timestamp + 0.2, fixes[10].timestamp + 0.7)), 0)
+        self.assertEqual(len(self.flight.slice_time(
+            fixes[-1].timestamp + 1, fixes[-1].timestamp + 10)), 0)
+
+    def test_flight_without_fixes(self):
+        class LongFlightConfig(igc_lib.FlightParsingConfig):
+            min_flight_duration = 5 * 3600
+
+        flights = [
+            igc_lib.Flight.create_from_buffer(synthetic_igc(hours=1.0),
+                                              LongFlightConfig),
+            igc_lib.Flight.create_from_buffer(synthetic_igc(hours=0.01)),
+        ]
+        for flight in flights:
+            self.assertFalse(flight.valid)
+            self.assertIsNone(flight.at(0))
+            self.assertEqual(len(flight.slice_time(0, 2e9)), 0)
+
+
+class RejectedByTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.buffer = synthetic_igc(hours=1.0)
+
+    def create(self, buffer, **filters):
+        config_class = type('FiltersConfig', (igc_lib.FlightParsingConfig,),
+                            filters)
+        return igc_lib.Flight.create_from_buffer(buffer, config_class)
+
+    def edit_lines(self, edit):
+        lines = self.buffer.decode('ascii').splitlines()
+        return '\n'.join(edit(lines)).encode('ascii')
+
+    def test_valid(self):
+        flight = self.create(self.buffer)
+        self.assertTrue(flight.valid)
+        self.assertIsNone(flight.rejected_by)
+
+    def test_fix_count(self):
+        flight = self.create(synthetic_igc(hours=0.01))
+        self.assertEqual(flight.rejected_by, 'fix_count')
+
+    def test_date_record(self):
+        flight = self.create(self.edit_lines(
+            lambda lines: [line for line in lines
+                           if not line.startswith('HFDTE')]))
+        self.assertEqual(flight.rejected_by, 'date_record')
+        flight = self.create(self.buffer,
+                             max_date=datetime.date(2020, 7, 14))
+        self.assertEqual(flight.rejected_by, 'date_record')
+        self.assertEqual(len(flight.fixes), 0)
+        flight = self.create(self.buffer,
+                             min_date=datetime.date(2020, 7, 15),
+                             max_date=datetime.date(2020, 7, 15))
+        self.assertTrue(flight.valid)
+
+    def test_time_span_of_streams(self):
+        # Streams are parsed, then rejected before the altitude checks.
+        config_class = type('LongFlightConfig',
+                            (igc_lib.FlightParsingConfig,),
+                            dict(min_flight_duration=2 * 3600))
+        flight = igc_lib.Flight.create_from_source(
+            self.buffer.decode('ascii').splitlines(), config_class)
+        self.assertEqual(flight.rejected_by, 'time_span')
+        self.assertFalse(hasattr(flight, 'alt_source'))
+
+    def test_fix_times(self):
+        def drop_fixes(lines):
+            return [line for i, line in enumerate(lines)
+                    if not 1000 <= i < 1100]
+
+        buffer = self.edit_lines(drop_fixes)
+        self.assertTrue(self.create(buffer).valid)
+        flight = self.create(buffer, max_time_violations=0)
+        self.assertEqual(flight.rejected_by, 'fix_times')
+
+    def test_altitudes(self):
+        def flatten_altitudes(lines):
+            return [line[:25] + '0050000500' + line[35:]
+                    if line.startswith('B') else line for line in lines]
+
+        flight = self.create(self.edit_lines(flatten_altitudes))
+        self.assertEqual(flight.rejected_by, 'altitudes')
+
+    def test_duration(self):
+        # The file records an hour, the flight lasts 40 minutes.
+        flight = self.create(self.buffer, min_flight_duration=50 * 60)
+        self.assertEqual(flight.rejected_by, 'duration')
+        self.assertTrue(hasattr(flight, 'takeoff_fix'))
+
+
+class DecimationTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.buffer = synthetic_igc(hours=1.0)
+        cls.flight = igc_lib.Flight.create_from_buffer(cls.buffer)
+
+    def decimate(self, buffer=None, **policy):
+        return igc_lib.Flight.create_from_buffer(
+            buffer or self.buffer,
+            decimation=igc_lib.DecimationPolicy(**policy))
+
+    def test_every(self):
+        flight = self.decimate(every=4)
+        self.assertTrue(flight.valid)
+        rawtime = flight.fixes.column('rawtime')
+        self.assertEqual(len(flight.fixes), len(self.flight.fixes) // 4 + 1)
+        self.assertEqual(rawtime[0], self.flight.fixes[0].rawtime)
+        self.assertEqual(rawtime[-1], self.flight.fixes[-1].rawtime)
+        self.assertTrue(np.all(np.diff(rawtime[:-1]) == 4.0))
+
+    def test_min_time_step(self):
+        flight = self.decimate(min_time_step=5.0)
+        self.assertTrue(flight.valid)
+        steps = np.diff(flight.fixes.column('rawtime')[:-1])
+        self.assertTrue(np.all(steps == 5.0))
+        self.assertEqual(flight.fixes[-1].rawtime,
+                         self.flight.fixes[-1].rawtime)
+
+    def test_min_time_step_across_midnight(self):
+        flight = self.decimate(synthetic_igc(hours=1.0,
+                                             start_rawtime=23 * 3600 + 1800),
+                               min_time_step=10.0)
+        self.assertTrue(flight.valid)
+        steps = np.diff(flight.fixes.column('timestamp')[:-1])
+        self.assertTrue(np.all(steps == 10.0))
+
+    def test_min_distance(self):
+        flight = self.decimate(min_distance=0.1, max_time_step=30.0)
+        self.assertTrue(flight.valid)
+        self.assertLess(len(flight.fixes), len(self.flight.fixes) // 4)
+        # Indices of the kept fixes in the 1 Hz flight.
+        kept = (flight.fixes.column('rawtime') -
+                self.flight.fixes[0].rawtime).astype(int)
+        flown = self.flight.intervals.distance(kept[:-2], kept[1:-1])
+        # Standing still, fixes are kept every max_time_step.
+        self.assertTrue(np.all((flown >= 0.1 - 1e-6) |
+                               (np.diff(kept[:-1]) == 30)))
+        self.assertEqual(len(flight.thermals), len(self.flight.thermals))
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            igc_lib.DecimationPolicy(every=0)
+
+
+class ExtensionsTest(unittest.TestCase):
+
+    FIELDS = extensions.parse_I_record('I033638FXA3941ENL4244TAS')
+
+    def test_parse_I_record(self):
+        self.assertEqual(self.FIELDS, [('FXA', 0, 3), ('ENL', 3, 6),
+                                       ('TAS', 6, 9)])
+        # Repeated codes and fields before the extensions are ignored.
+        self.assertEqual(
+            extensions.parse_I_record('I033638FXA3941FXA3034ENL'),
+            [('FXA', 0, 3)])
+        self.assertEqual(extensions.parse_I_record('HFDTE150720'), [])
+
+    def test_decode_extensions(self):
+        extras = np.array([b'014041000', b'-09988000', b'01A988'])
+        columns, exact = extensions.decode_extensions(extras, self.FIELDS)
+        self.assertFalse(exact)
+        self.assertEqual(columns['FXA'][:2].tolist(), [14.0, -9.0])
+        self.assertEqual(columns['ENL'][:2].tolist(), [41.0, 988.0])
+        self.assertTrue(np.isnan(columns['FXA'][2]))
+        self.assertTrue(np.isnan(columns['TAS'][2]))
+        columns, exact = extensions.decode_extensions(extras[:2],
+                                                      self.FIELDS)
+        self.assertTrue(exact)
+        self.assertEqual(
+            extensions.encode_extensions(columns, self.FIELDS, 1),
+            '-09988000')
+
+    def test_flight_extensions(self):
+        flight = igc_lib.Flight.create_from_buffer(synthetic_igc(hours=0.3))
+        self.assertEqual(sorted(flight.extensions), ['ENL', 'FXA', 'TAS'])
+        fix = flight.fixes[1]
+        self.assertEqual(fix.extras, '009988000')
+        self.assertEqual(fix.extension('ENL'), 988.0)
+        self.assertIsNone(fix.extension('RPM'))
+        fix.extras = '012345999'
+        self.assertEqual(flight.extensions['ENL'][1], 345.0)
+        self.assertEqual(flight.fixes[1].extras, '012345999')
+        self.assertEqual(flight.fixes[0].extras, '014041000')
+
+
+class FlightCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.cache = igc_lib.FlightCache(self.temp_dir.name)
+
+    def cached_flight(self, buffer, *args):
+        """Returns the flight of a buffer, parsed then read from the cache."""
+        flight = self.cache.create_from_buffer(buffer, *args)
+        with mock.patch.object(igc_lib.Flight, 'create_from_buffer',
+                               side_effect=AssertionError("not cached")):
+            return flight, self.cache.create_from_buffer(buffer, *args)
+
+    def test_round_trip(self):
+        flight, cached = self.cached_flight(synthetic_igc(hours=1.0))
+        self.assertTrue(cached.valid)
+        self.assertEqual(cached.notes, flight.notes)
+        self.assertEqual(cached.glider_type, flight.glider_type)
+        self.assertEqual(cached.takeoff_fix.index, flight.takeoff_fix.index)
+        for name in ('timestamp', 'lat', 'alt', 'gsp', 'circling'):
+            self.assertEqual(cached.fixes.column(name).tolist(),
+                             flight.fixes.column(name).tolist())
+        self.assertEqual(cached.extensions['ENL'].tolist(),
+                         flight.extensions['ENL'].tolist())
+        self.assertEqual(cached.fixes[10].extras, flight.fixes[10].extras)
+        self.assertEqual(len(cached.thermals), len(flight.thermals))
+        for thermal, cached_thermal in zip(flight.thermals, cached.thermals):
+            self.assertEqual(cached_thermal.enter_fix.index,
+                             thermal.enter_fix.index)
+            self.assertEqual(cached_thermal.alt_gain(), thermal.alt_gain())
+        self.assertEqual([glide.track_length for glide in cached.glides],
+                         [glide.track_length for glide in flight.glides])
+
+    def test_invalid_flight(self):
+        flight, cached = self.cached_flight(synthetic_igc(hours=0.01))
+        self.assertFalse(cached.valid)
+        self.assertEqual(cached.rejected_by, 'fix_count')
+        self.assertEqual(cached.notes, flight.notes)
+
+    def test_keys(self):
+        buffer = synthetic_igc(hours=0.5)
+        decimation = igc_lib.DecimationPolicy(every=2)
+        flight = self.cache.create_from_buffer(buffer)
+        decimated = self.cache.create_from_buffer(buffer,
+                                                  igc_lib.FlightParsingConfig,
+                                                  decimation)
+        self.assertEqual(len(decimated.fixes), len(flight.fixes) // 2 + 1)
+        self.assertEqual(len(os.listdir(self.temp_dir.name)), 2)
+
+    def test_get_flight_cache(self):
+        with mock.patch.dict(os.environ, {'FLIGHT_CACHE_DIRECTORY': ''}):
+            self.assertIsNone(igc_lib.get_flight_cache())
+        with mock.patch.dict(os.environ, {
+                'FLIGHT_CACHE_DIRECTORY': self.temp_dir.name + '\n'}):
+            flight_cache = igc_lib.get_flight_cache()
+        self.assertIsInstance(flight_cache, igc_lib.FlightCache)
+        self.assertEqual(flight_cache._cache.directory, self.temp_dir.name)
+        self.assertEqual(flight_cache._cache.max_bytes,
+                         igc_lib.FLIGHT_CACHE_MAX_BYTES)
+
+
+class SharedMemoryTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        flight = igc_lib.Flight.create_from_buffer(synthetic_igc(hours=0.5))
+        arrays = {'fixes': flight._store.data,
+                  'empty': np.zeros(0, dtype=np.int8),
+                  'matrix': np.arange(12.0).reshape(3, 4),
+                  'state': np.array('{"a": 1}')}
+        descriptor = sharedmem.export_arrays(arrays)
+        attached = sharedmem.attach_arrays(descriptor)
+        self.assertEqual(sorted(attached), sorted(arrays))
+        for name, array in arrays.items():
+            self.assertEqual(attached[name].dtype, array.dtype)
+            self.assertTrue(np.array_equal(attached[name], array))
+        # Attaching unlinks the segment.
+        with self.assertRaises(FileNotFoundError):
+            sharedmem.attach_arrays(descriptor)
+
+    def test_discard(self):
+        descriptor = sharedmem.export_arrays({'a': np.arange(10)})
+        sharedmem.discard(descriptor)
+        with self.assertRaises(FileNotFoundError):
+            sharedmem.attach_arrays(descriptor)
+
+    def test_object_arrays(self):
+        with self.assertRaises(ValueError):
+            sharedmem.export_arrays({'a': np.array([None, 1])})
+
+    def test_flight_round_trip(self):
+        flight = igc_lib.Flight.create_from_buffer(synthetic_igc(hours=1.0))
+        shared = igc_lib.Flight.from_shared_memory(
+            sharedmem.export_arrays(flight.to_arrays()))
+        self.assertTrue(np.array_equal(shared._store.data,
+                                       flight._store.data))
+        self.assertEqual(
+            [(thermal.enter_fix.index, thermal.exit_fix.index)
+             for thermal in shared.thermals],
+            [(thermal.enter_fix.index, thermal.exit_fix.index)
+             for thermal in flight.thermals])
+
+    def test_parse_in_processes(self):
+        buffers = [synthetic_igc(hours=hours, seed=seed)
+                   for seed, hours in enumerate([0.5, 0.01, 1.0])]
+        flights = list(igc_lib.parse_in_processes(buffers, processes=2))
+        self.assertEqual([flight.valid for flight in flights],
+                         [True, False, True])
+        for buffer, flight in zip(buffers, flights):
+            expected = igc_lib.Flight.create_from_buffer(buffer)
+            self.assertEqual(flight.notes, expected.notes)
+            self.assertEqual(len(flight.fixes), len(expected.fixes))
+            if expected.valid:
+                self.assertEqual(len(flight.thermals),
+                                 len(expected.thermals))
+                self.assertEqual(flight.fixes.column('circling').tolist(),
+                                 expected.fixes.column('circling').tolist())
+
+
+class SegmentsTest(unittest.TestCase):
+
+    def assertRuns(self, flags, expected):
+        starts, ends = segments.runs(np.array(flags, dtype=bool))
+        self.assertEqual(list(zip(starts.tolist(), ends.tolist())),
+                         expected)
+
+    def test_runs(self):
+        self.assertRuns([], [])
+        self.assertRuns([False, False], [])
+        self.assertRuns([True, True, True], [(0, 3)])
+        self.assertRuns([False, True, True, False, True], [(1, 3), (4, 5)])
+        self.assertRuns([True, False, False, True], [(0, 1), (3, 4)])
+
+    def test_fill(self):
+        self.assertEqual(segments.fill(5, np.array([1, 4]),
+                                       np.array([3, 5])).tolist(),
+                         [False, True, True, False, True])
+        # Overlapping and empty runs.
+        self.assertEqual(segments.fill(6, np.array([0, 2, 5]),
+                                       np.array([3, 4, 5])).tolist(),
+                         [True, True, True, True, False, False])
+        self.assertEqual(segments.fill(3, np.arange(0), np.arange(0)).tolist(),
+                         [False, False, False])
+
+    def test_fill_inverts_runs(self):
+        flags = np.random.RandomState(0).rand(1000) < 0.3
+        starts, ends = segments.runs(flags)
+        self.assertTrue(np.array_equal(
+            segments.fill(len(flags), starts, ends), flags))
+
+
+class IntervalIndexTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.flight = igc_lib.Flight.create_from_buffer(
+            synthetic_igc(hours=1.0))
+        cls.intervals = cls.flight.intervals
+        cls.ranges = [(0, 0), (0, 1), (100, 1500), (1234, 3599),
+                      (0, len(cls.flight.fixes) - 1)]
+
+    def fixes(self, i, j):
+        return self.flight.fixes[i:j + 1]
+
+    def test_sums(self):
+        for i, j in self.ranges:
+            fixes = self.fixes(i, j)
+            legs = list(zip(fixes[:-1], fixes[1:]))
+            self.assertAlmostEqual(
+                self.intervals.distance(i, j),
+                sum(fix.distance_to(next_fix) for fix, next_fix in legs))
+            self.assertAlmostEqual(
+                self.intervals.alt_gain(i, j),
+                sum(max(next_fix.alt - fix.alt, 0.0)
+                    for fix, next_fix in legs))
+            self.assertAlmostEqual(
+                self.intervals.alt_loss(i, j),
+                sum(max(fix.alt - next_fix.alt, 0.0)
+                    for fix, next_fix in legs))
+            self.assertAlmostEqual(
+                self.intervals.circling_time(i, j),
+                sum(next_fix.timestamp - fix.timestamp
+                    for fix, next_fix in legs if fix.circling))
+            self.assertEqual(self.intervals.duration(i, j),
+                             fixes[-1].timestamp - fixes[0].timestamp)
+            self.assertEqual(self.intervals.alt_change(i, j),
+                             fixes[-1].alt - fixes[0].alt)
+
+    def test_ratios(self):
+        i, j = 100, 1500
+        duration = self.intervals.duration(i, j)
+        self.assertAlmostEqual(self.intervals.average_speed(i, j),
+                               self.intervals.distance(i, j) /
+                               duration * 3600.0)
+        self.assertAlmostEqual(self.intervals.vertical_velocity(i, j),
+                               self.intervals.alt_change(i, j) / duration)
+        # No time, no speed.
+        self.assertEqual(self.intervals.average_speed(i, i), 0.0)
+        self.assertEqual(self.intervals.vertical_velocity(i, i), 0.0)
+
+    def test_array_queries(self):
+        starts = np.array([i for i, _ in self.ranges])
+        ends = np.array([j for _, j in self.ranges])
+        distances = self.intervals.distance(starts, ends)
+        self.assertEqual(distances.shape, (len(self.ranges),))
+        for distance, (i, j) in zip(distances, self.ranges):
+            self.assertEqual(distance, self.intervals.distance(i, j))
+
+    def test_fixes_between(self):
+        fixes = self.flight.fixes
+        self.assertEqual(self.intervals.fixes_between(
+            fixes[10].timestamp, fixes[20].timestamp), (10, 20))
+        self.assertEqual(self.intervals.fixes_between(
+            fixes[10].timestamp - 0.5, fixes[20].timestamp + 0.5), (10, 20))
+        i, j = self.intervals.fixes_between(fixes[10].timestamp + 0.2,
+                                            fixes[10].timestamp + 0.7)
+        self.assertLess(j, i)
+
+    def test_segments(self):
+        for thermal in self.flight.thermals:
+            fixes = self.fixes(thermal.enter_fix.index,
+                               thermal.exit_fix.index)
+            legs = list(zip(fixes[:-1], fixes[1:]))
+            self.assertAlmostEqual(
+                thermal.alt_gain(),
+                sum(max(next_fix.alt - fix.alt, 0.0)
+                    for fix, next_fix in legs))
+            self.assertAlmostEqual(
+                thermal.track_length(),
+                sum(fix.distance_to(next_fix) for fix, next_fix in legs))
+            self.assertLessEqual(thermal.circling_time(),
+                                 thermal.time_change())
+
+
+class AnalysisProfilesTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.buffer = synthetic_igc(hours=1.0)
+        cls.full = igc_lib.Flight.create_from_buffer(cls.buffer)
+
+    def create(self, profile):
+        config_class = type('ProfileConfig', (igc_lib.FlightParsingConfig,),
+                            dict(analysis_profile=profile))
+        return igc_lib.Flight.create_from_buffer(self.buffer, config_class)
+
+    def test_track_only(self):
+        flight = self.create('track_only')
+        self.assertTrue(flight.valid)
+        self.assertEqual(flight.fixes.column('timestamp').tolist(),
+                         self.full.fixes.column('timestamp').tolist())
+        self.assertEqual(flight.fixes[5].alt, self.full.fixes[5].alt)
+        self.assertFalse(hasattr(flight, 'takeoff_fix'))
+        with self.assertRaises(AttributeError):
+            flight.fixes[5].gsp
+        with self.assertRaises(AttributeError):
+            flight.thermals
+
+    def test_flight_detection(self):
+        flight = self.create('flight_detection')
+        self.assertEqual(flight.takeoff_fix.index,
+                         self.full.takeoff_fix.index)
+        self.assertEqual(flight.duration, self.full.duration)
+        self.assertEqual(flight.fixes.column('gsp').tolist(),
+                         self.full.fixes.column('gsp').tolist())
+        with self.assertRaises(AttributeError):
+            flight.fixes[5].circling
+        with self.assertRaises(AttributeError):
+            flight.thermals
+
+    def test_thermals(self):
+        flight = self.create('thermals')
+        self.assertEqual(
+            [(thermal.enter_fix.index, thermal.exit_fix.index)
+             for thermal in flight.thermals],
+            [(thermal.enter_fix.index, thermal.exit_fix.index)
+             for thermal in self.full.thermals])
+        self.assertEqual(len(flight.glides), len(self.full.glides))
+        # Only the full profile keeps the B record extensions.
+        self.assertEqual(flight.extensions, {})
+        self.assertEqual(flight.fixes[5].extras, '')
+        self.assertEqual(sorted(self.full.extensions), ['ENL', 'FXA', 'TAS'])
+
+    def test_unknown_profile(self):
+        with self.assertRaises(ValueError):
+            self.create('everything')
+
+
+class ArchivesTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.buffers = [synthetic_igc(hours=0.5, seed=seed)
+                       for seed in range(3)]
+        cls.fix_counts = [len(igc_lib.Flight.create_from_buffer(buffer).fixes)
+                          for buffer in cls.buffers]
+
+    def assertFlights(self, named_flights, names):
+        named_flights = list(named_flights)
+        self.assertEqual([name for name, _ in named_flights], names)
+        self.assertEqual([len(flight.fixes) for _, flight in named_flights],
+                         self.fix_counts[:len(names)])
+        self.assertTrue(all(flight.valid for _, flight in named_flights))
+
+    def zip_archive(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zip_file:
+            zip_file.writestr('a.igc', self.buffers[0])
+            zip_file.writestr('readme.txt', b'not a flight')
+            zip_file.writestr('dir/b.IGC', self.buffers[1])
+            zip_file.writestr('c.igc.gz', gzip.compress(self.buffers[2]))
+        archive.seek(0)
+        return archive
+
+    def test_zip(self):
+        names = ['a.igc', 'dir/b.IGC', 'c.igc.gz']
+        self.assertFlights(igc_lib.Flight.iter_from_archive(
+            self.zip_archive()), names)
+        with zipfile.ZipFile(self.zip_archive()) as zip_file:
+            self.assertFlights(igc_lib.Flight.iter_from_archive(zip_file),
+                               names)
+            flight = igc_lib.Flight.create_from_zipfile(zip_file)
+            self.assertEqual(len(flight.fixes), self.fix_counts[0])
+
+    def test_zip_stream(self):
+        # Only has read(), the archive is read as a whole.
+        archive = io.BufferedReader(io.BytesIO(self.zip_archive().read()))
+        archive.seekable = lambda: False
+        self.assertFlights(igc_lib.Flight.iter_from_archive(archive),
+                           ['a.igc', 'dir/b.IGC', 'c.igc.gz'])
+
+    def test_compressed_tar(self):
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w:bz2') as tar_file:
+            members = [('a.igc', self.buffers[0]), ('notes.txt', b'text'),
+                       ('b.igc.xz', lzma.compress(self.buffers[1]))]
+            for name, content in members:
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                tar_file.addfile(info, io.BytesIO(content))
+        archive.seek(0)
+        self.assertFlights(igc_lib.Flight.iter_from_archive(archive),
+                           ['a.igc', 'b.igc.xz'])
+
+    def test_compressed_files(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for suffix, compress in (('.gz', gzip.compress),
+                                     ('.xz', lzma.compress),
+                                     ('.bz2', bz2.compress)):
+                path = os.path.join(temp_dir, 'flight.igc' + suffix)
+                with open(path, 'wb') as igc_file:
+                    igc_file.write(compress(self.buffers[0]))
+                flight = igc_lib.Flight.create_from_path(path)
+                self.assertEqual(len(flight.fixes), self.fix_counts[0])
+                self.assertFlights(igc_lib.Flight.iter_from_archive(path),
+                                   ['flight.igc'])
+
+    def test_plain_file(self):
+        self.assertFlights(igc_lib.Flight.iter_from_archive(
+            io.BytesIO(self.buffers[0])), [None])
+
+
+class IncrementalFlightTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        buffer = synthetic_igc(hours=1.0)
+        cls.flight = igc_lib.Flight.create_from_buffer(buffer)
+        cls.lines = buffer.decode('ascii').splitlines()
+
+    def test_segment_statistics(self):
+        incremental = igc_lib.IncrementalFlight()
+        for start in range(0, len(self.lines), 250):
+            incremental.append_lines(self.lines[start:start + 250])
+            fixes = incremental.fixes
+            alt = fixes.column('alt')
+            timestamp = fixes.column('timestamp')
+            for thermal in incremental.thermals:
+                i, j = thermal.enter_fix.index, thermal.exit_fix.index
+                self.assertAlmostEqual(
+                    thermal.alt_gain(),
+                    np.maximum(np.diff(alt[i:j + 1]), 0.0).sum())
+                # Circling states are decided after the fixes arrive.
+                self.assertAlmostEqual(
+                    thermal.circling_time(),
+                    np.dot(np.diff(timestamp[i:j + 1]),
+                           fixes.column('circling')[i:j]))
+        incremental.finish()
+        self.assertEqual(len(incremental.thermals), len(self.flight.thermals))
+        for thermal, expected in zip(incremental.thermals,
+                                     self.flight.thermals):
+            self.assertAlmostEqual(thermal.alt_gain(), expected.alt_gain())
+            self.assertAlmostEqual(thermal.alt_loss(), expected.alt_loss())
+            self.assertAlmostEqual(thermal.circling_time(),
+                                   expected.circling_time())
+            self.assertAlmostEqual(thermal.track_length(),
+                                   expected.track_length())
+        for glide, expected in zip(incremental.glides, self.flight.glides):
+            self.assertAlmostEqual(glide.alt_loss(), expected.alt_loss())
+
+    def test_extensions(self):
+        incremental = igc_lib.IncrementalFlight()
+        for start in range(0, len(self.lines), 700):
+            incremental.append_lines(self.lines[start:start + 700])
+            count = len(incremental.fixes)
+            for code, column in incremental.extensions.items():
+                self.assertEqual(
+                    column.tolist(),
+                    self.flight.extensions[code][:count].tolist())
+        # The columns are decoded once, in append.
+        self.assertTrue(np.shares_memory(incremental.extensions['ENL'],
+                                         incremental.extensions['ENL']))
+
+
+class FixViewsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.flight = igc_lib.Flight.create_from_buffer(
+            synthetic_igc(hours=0.5))
+
+    def test_views_read_store_columns(self):
+        fix = self.flight.fixes[42]
+        self.assertEqual(fix.index, 42)
+        self.assertEqual(fix.lat, self.flight.fixes.column('lat')[42])
+        self.assertEqual(fix.alt, self.flight.fixes.column('alt')[42])
+        self.assertIs(type(fix.timestamp), float)
+        self.assertEqual(fix.timestamp,
+                         fix.rawtime + self.flight.date_timestamp)
+
+    def test_views_write_store_columns(self):
+        fix = self.flight.fixes[42]
+        fix.press_alt = 1234.5
+        self.assertEqual(self.flight.fixes[42].press_alt, 1234.5)
+        self.assertEqual(self.flight.fixes.column('press_alt')[42], 1234.5)
+
+    def test_fix_list(self):
+        fixes = self.flight.fixes
+        self.assertEqual(fixes[-1], fixes[len(fixes) - 1])
+        self.assertNotEqual(fixes[0], fixes[1])
+        with self.assertRaises(IndexError):
+            fixes[len(fixes)]
+        window = fixes.slice(10, 20)
+        self.assertEqual([fix.index for fix in window], list(range(10, 20)))
+        self.assertEqual(window[-1], fixes[19])
+        self.assertEqual(window.column('lat').tolist(),
+                         fixes.column('lat')[10:20].tolist())
+
+    def test_detach(self):
+        fix = self.flight.fixes[42]
+        copy = fix.detach()
+        self.assertNotEqual(copy, fix)
+        self.assertEqual(copy.index, 42)
+        self.assertEqual((copy.lat, copy.timestamp),
+                         (fix.lat, fix.timestamp))
+        copy.lat = 0.0
+        self.assertNotEqual(fix.lat, 0.0)
+
+    def test_standalone_fix(self):
+        fix = igc_lib.GNSSFix.build_from_B_record(
+            'B1101355206343N00006198WA0058700558', index=7)
+        self.assertEqual(fix.index, 7)
+        self.assertEqual(fix.rawtime, 11 * 3600 + 1 * 60 + 35)
+        self.assertAlmostEqual(fix.lat, 52.10571666666667)
+        self.assertAlmostEqual(fix.lon, -0.1033)
+        self.assertEqual((fix.press_alt, fix.gnss_alt), (587.0, 558.0))
+        self.assertEqual(fix.validity, 'A')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+"""Reading IGC files out of archives and compressed streams.
+
+Flight archives are kept as zip or tar files, or as single IGC files
+compressed with gzip, xz or bzip2 (.igc.gz, .igc.xz, .igc.bz2). All of
+them are read as streams: members are decompressed chunk by chunk while
+they are parsed, an archive is never decompressed as a whole in memory.
+"""
+
+import bz2
+import gzip
+import io
+import lzma
+import os
+import tarfile
+import zipfile
+
+
+IGC_SUFFIX = '.igc'
+
+# Compression suffixes of file names, and the matching openers.
+COMPRESSED_SUFFIXES = {
+    '.gz': gzip.open,
+    '.xz': lzma.open,
+    '.lzma': lzma.open,
+    '.bz2': bz2.open,
+}
+
+# Magic numbers at the start of compressed streams.
+_COMPRESSED_MAGIC = (
+    (b'\x1f\x8b', gzip.open),
+    (b'\xfd7zXZ\x00', lzma.open),
+    (b'BZh', bz2.open),
+)
+
+_ZIP_MAGIC = (b'PK\x03\x04', b'PK\x05\x06')
+
+# A tar header holds b'ustar' at this offset.
+_TAR_MAGIC_OFFSET = 257
+
+
+def is_compressed_name(name):
+    """Returns whether a file name has a compression suffix."""
+    return os.path.splitext(name)[1].lower() in COMPRESSED_SUFFIXES
+
+
+def is_igc_name(name):
+    """Returns whether a file name is the one of a (compressed) IGC file."""
+    name = name.lower()
+    if is_compressed_name(name):
+        name = os.path.splitext(name)[0]
+    return name.endswith(IGC_SUFFIX)
+
+
+class _RawStream(io.RawIOBase):
+    """Adapts a file-like object with a read() method to io.RawIOBase."""
+
+    def __init__(self, source):
+        self._source = source
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._source.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _buffered(source):
+    """Returns a binary stream of a file-like object, supporting peek()."""
+    if hasattr(source, 'peek'):
+        return source
+    return io.BufferedReader(_RawStream(source))
+
+
+def _peek(stream, size):
+    """Returns up to size bytes at the head of a stream, without reading."""
+    head = stream.peek(size)
+    while len(head) < size:
+        # peek() returns what is buffered, at least one byte.
+        more = stream.peek(len(head) + 1)
+        if len(more) <= len(head):
+            break
+        head = more
+    return head[:size]
+
+
+def _decompressor(head):
+    for magic, opener in _COMPRESSED_MAGIC:
+        if head.startswith(magic):
+            return opener
+    return None
+
+
+def _is_tar(head):
+    return head[_TAR_MAGIC_OFFSET:_TAR_MAGIC_OFFSET + 5] == b'ustar'
+
+
+def open_compressed(source):
+    """Opens a possibly compressed IGC file, for streaming.
+
+    Args:
+        source: a file name, or a binary file-like object
+
+    Returns:
+        A binary file-like object, decompressing the source on the fly if
+        it starts with a gzip, xz or bzip2 magic number.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        stream = open(source, 'rb')
+        opener = _decompressor(_peek(stream, 8))
+        if opener is None:
+            return stream
+        stream.close()
+        # Given a name, the decompressor closes the file it opens.
+        return opener(source)
+    stream = _buffered(source)
+    opener = _decompressor(_peek(stream, 8))
+    if opener is None:
+        return stream
+    return opener(stream)
+
+
+def iter_members(source):
+    """Yields the IGC files of an archive, as they are read.
+
+    Args:
+        source: a file name, a binary file-like object or a
+        zipfile.ZipFile. Supported are zip and tar archives (possibly
+        compressed) of IGC files and of compressed IGC files, compressed
+        IGC files and plain IGC files, detected from their content.
+
+    Returns:
+        A generator of (name, member) tuples, name is a string (None if
+        unknown), member is a binary file-like object decompressing the
+        IGC file on the fly. A member must be read before the next one
+        is requested; tar members are not readable anymore afterwards.
+    """
+    if isinstance(source, zipfile.ZipFile):
+        for member in _iter_zip_members(source):
+            yield member
+        return
+    name = None
+    if isinstance(source, (str, os.PathLike)):
+        name = os.path.basename(os.fspath(source))
+        with open(source, 'rb') as source_file:
+            for member in _iter_stream_members(source_file, name):
+                yield member
+        return
+    name = getattr(source, 'name', None)
+    if not isinstance(name, str):
+        name = None
+    for member in _iter_stream_members(source, name):
+        yield member
+
+
+def _iter_stream_members(source, name):
+    stream = _buffered(source)
+    head = _peek(stream, 8)
+    if head.startswith(_ZIP_MAGIC):
+        if not (hasattr(source, 'seekable') and source.seekable()):
+            # The zip directory is at the end of the archive.
+            source = io.BytesIO(stream.read())
+        with zipfile.ZipFile(source) as zip_file:
+            for member in _iter_zip_members(zip_file):
+                yield member
+        return
+
+    opener = _decompressor(head)
+    if opener is not None:
+        stream = _buffered(opener(stream))
+        if name is not None and is_compressed_name(name):
+            name = os.path.splitext(name)[0]
+    if _is_tar(_peek(stream, _TAR_MAGIC_OFFSET + 5)):
+        with tarfile.open(fileobj=stream, mode='r|') as tar_file:
+            for info in tar_file:
+                if info.isfile() and is_igc_name(info.name):
+                    yield info.name, open_compressed(
+                        tar_file.extractfile(info))
+        return
+    yield name, stream
+
+
+def _iter_zip_members(zip_file):
+    for info in zip_file.infolist():
+        if not info.is_dir() and is_igc_name(info.filename):
+            yield info.filename, open_compressed(zip_file.open(info))
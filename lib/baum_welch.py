@@ -0,0 +1,221 @@
+"""Baum-Welch training of hidden Markov models.
+
+Fits the parameters of the models decoded by viterbi.SimpleViterbiDecoder
+to a corpus of emission sequences. The forward-backward passes run on
+batches of sequences of similar lengths, vectorized across each batch; the
+batches are spread over a pool of worker processes, which read the corpus
+from shared memory.
+
+Models are dicts of the arguments of SimpleViterbiDecoder: init_probs,
+transition_probs and emission_probs.
+"""
+
+import multiprocessing
+from multiprocessing import resource_tracker
+
+import numpy as np
+
+from lib import sharedmem
+
+
+# The corpus of a worker process, see _attach_corpus().
+_corpus = None
+
+
+def _model_arrays(model):
+    """Returns the probabilities of a model as NumPy arrays."""
+    return (np.array(model['init_probs'], dtype=np.float64),
+            np.array(model['transition_probs'], dtype=np.float64),
+            np.array(model['emission_probs'], dtype=np.float64))
+
+
+def expected_counts(emissions, lengths, init, transition, emission):
+    """Runs the forward-backward passes on a batch of sequences.
+
+    Args:
+        emissions: a 2D integer array, one padded sequence per row
+        lengths: a vector of integers, the length of each sequence
+        init: a vector of N floats, the initial probabilities
+        transition: a NxN array of floats, the transition probabilities
+        emission: a NxM array of floats, the emission probabilities
+
+    Returns:
+        A tuple of the expected numbers of initial states (a vector of N
+        floats), of transitions (NxN floats) and of emissions (NxM floats)
+        in the batch, and of its log-likelihood, a float.
+    """
+    batch, steps = emissions.shape
+    states, letters = emission.shape
+    valid = np.arange(steps) < lengths[:, np.newaxis]
+    emissions = np.where(valid, emissions, 0)
+    # Probabilities of the emissions from each state, per step.
+    observed = emission.T[emissions]
+
+    # Forward pass, with the probabilities normalized at every step.
+    alpha = np.empty((batch, steps, states))
+    scale = np.ones((batch, steps))
+    forward = init * observed[:, 0]
+    scale[:, 0] = np.where(valid[:, 0], forward.sum(axis=1), 1.0)
+    alpha[:, 0] = forward / scale[:, 0, np.newaxis]
+    for i in range(1, steps):
+        forward = np.dot(alpha[:, i - 1], transition) * observed[:, i]
+        scale[:, i] = np.where(valid[:, i], forward.sum(axis=1), 1.0)
+        alpha[:, i] = forward / scale[:, i, np.newaxis]
+
+    # Backward pass, accumulating the expected counts.
+    one_hot = np.eye(letters)
+    transition_counts = np.zeros((states, states))
+    emission_counts = np.zeros((states, letters))
+    beta = np.ones((batch, states))
+    for i in range(steps - 1, -1, -1):
+        gamma = alpha[:, i] * beta * valid[:, i, np.newaxis]
+        emission_counts += np.dot(gamma.T, one_hot[emissions[:, i]])
+        if i == 0:
+            break
+        weighted = np.where(valid[:, i, np.newaxis],
+                            observed[:, i] * beta / scale[:, i, np.newaxis],
+                            0.0)
+        transition_counts += transition * np.dot(alpha[:, i - 1].T,
+                                                 weighted)
+        beta = np.where(valid[:, i, np.newaxis],
+                        np.dot(weighted, transition.T), 1.0)
+    init_counts = (alpha[:, 0] * beta * valid[:, 0, np.newaxis]).sum(axis=0)
+    log_likelihood = float(np.log(scale).sum())
+    return init_counts, transition_counts, emission_counts, log_likelihood
+
+
+def _batches(lengths, max_batch_cells):
+    """Splits sequences sorted by length into batches.
+
+    Returns:
+        A list of (start, end) tuples, ranges of sequences of at most
+        max_batch_cells steps once padded, or of a single sequence.
+    """
+    batches = []
+    start = np.searchsorted(lengths, 1)
+    while start < len(lengths):
+        end = start + 1
+        while (end < len(lengths) and
+               (end + 1 - start) * lengths[end] <= max_batch_cells):
+            end += 1
+        batches.append((int(start), int(end)))
+        start = end
+    return batches
+
+
+def _batch_counts(corpus, start, end, model):
+    """expected_counts() of sequences start to end of a corpus."""
+    offsets = corpus['offsets']
+    lengths = offsets[start + 1:end + 1] - offsets[start:end]
+    emissions = np.zeros((end - start, lengths.max()), dtype=np.intp)
+    for row, offset, length in zip(emissions, offsets[start:end], lengths):
+        row[:length] = corpus['emissions'][offset:offset + length]
+    return expected_counts(emissions, lengths, *model)
+
+
+def _attach_corpus(descriptor):
+    """Initializer of the worker processes."""
+    global _corpus
+    _corpus = sharedmem.attach_arrays(descriptor, unlink=False)
+
+
+def _worker_batch_counts(task):
+    start, end, model = task
+    return _batch_counts(_corpus, start, end, model)
+
+
+def _maximize(counts, model, min_probability):
+    """Returns the model of the highest likelihood given expected counts.
+
+    Rows without any count keep their probabilities; probabilities are at
+    least min_probability, so that the model can be decoded.
+    """
+    def normalized(counts, probabilities):
+        totals = counts.sum(axis=-1, keepdims=True)
+        probabilities = np.where(totals > 0.0,
+                                 counts / np.where(totals > 0.0, totals, 1.0),
+                                 probabilities)
+        probabilities = np.maximum(probabilities, min_probability)
+        return probabilities / probabilities.sum(axis=-1, keepdims=True)
+
+    return tuple(normalized(count, probabilities)
+                 for count, probabilities in zip(counts, model))
+
+
+def train(sequences, model, iterations=100, tolerance=1e-6,
+          processes=None, max_batch_cells=1 << 21, min_probability=1e-6):
+    """Fits a hidden Markov model to emission sequences.
+
+    Args:
+        sequences: an iterable of sequences of integers, the emissions,
+        from 0 to M - 1
+        model: a dict, the initial model, see the module docstring
+        iterations: an integer, the maximum number of iterations
+        tolerance: a float, training stops once an iteration improves the
+        log-likelihood by less than this fraction of it
+        processes: an integer, the number of worker processes, by default
+        the number of CPUs; 1 trains in this process
+        max_batch_cells: an integer, the maximum number of padded steps
+        in a batch of sequences, bounds the memory of the batches
+        min_probability: a float, the minimum of the fitted probabilities
+
+    Returns:
+        A tuple of the fitted model, a dict like model, and of the list of
+        the log-likelihoods of the corpus, one per iteration.
+    """
+    sequences = [np.asarray(sequence) for sequence in sequences]
+    arrays = _model_arrays(model)
+    letters = arrays[2].shape[1]
+    lengths = np.array([len(sequence) for sequence in sequences],
+                       dtype=np.int64)
+    order = np.argsort(lengths, kind='stable')
+    offsets = np.concatenate(([0], np.cumsum(lengths[order])))
+    corpus = {
+        'emissions': np.concatenate(
+            [sequences[i] for i in order] + [np.arange(0)]).astype(
+                np.int8 if letters <= 127 else np.intp),
+        'offsets': offsets,
+    }
+    del sequences
+    batches = _batches(lengths[order], max_batch_cells)
+
+    def run(map_batches):
+        log_likelihoods = []
+        current = arrays
+        for _ in range(iterations):
+            counts = [np.zeros_like(array) for array in current]
+            log_likelihood = 0.0
+            for batch_counts in map_batches(
+                    [(start, end, current) for start, end in batches]):
+                for total, count in zip(counts, batch_counts):
+                    total += count
+                log_likelihood += batch_counts[3]
+            current = _maximize(counts, current, min_probability)
+            log_likelihoods.append(log_likelihood)
+            if (len(log_likelihoods) > 1 and
+                    log_likelihood - log_likelihoods[-2] <=
+                    tolerance * abs(log_likelihood)):
+                break
+        return current, log_likelihoods
+
+    if processes == 1:
+        fitted, log_likelihoods = run(lambda tasks: (
+            _batch_counts(corpus, *task) for task in tasks))
+    else:
+        # Workers must share the tracker of the segment with the parent,
+        # which unlinks it.
+        resource_tracker.ensure_running()
+        descriptor = sharedmem.export_arrays(corpus)
+        try:
+            with multiprocessing.Pool(processes, _attach_corpus,
+                                      (descriptor,)) as pool:
+                fitted, log_likelihoods = run(
+                    lambda tasks: pool.imap(_worker_batch_counts, tasks))
+        finally:
+            sharedmem.discard(descriptor)
+
+    init, transition, emission = fitted
+    return (dict(init_probs=init.tolist(),
+                 transition_probs=transition.tolist(),
+                 emission_probs=emission.tolist()),
+            log_likelihoods)
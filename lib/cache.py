@@ -0,0 +1,99 @@
+"""A size-bounded on-disk cache of NumPy arrays.
+
+Entries are dicts of arrays, stored as one .npz file per key in a cache
+directory. When the files exceed the size limit of the cache, the least
+recently used entries are removed.
+"""
+
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+
+_SUFFIX = '.npz'
+
+
+def content_hash(buffer):
+    """Returns the hex SHA-256 digest of a bytes-like object."""
+    return hashlib.sha256(buffer).hexdigest()
+
+
+class NpzCache(object):
+    """A directory of .npz files, keyed on strings.
+
+    Attributes:
+        directory: a string, the cache directory, created if needed
+        max_bytes: an integer, the maximum total size of the cache files
+        compress: a bool, whether entries are stored compressed
+    """
+
+    def __init__(self, directory, max_bytes=1 << 30, compress=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.compress = compress
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def get(self, key):
+        """Returns the entry stored for a key.
+
+        Returns:
+            A dict of NumPy arrays, or None if the key is not in the cache
+            or its file can not be read.
+        """
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as npz_file:
+                arrays = dict((name, npz_file[name])
+                              for name in npz_file.files)
+            # Marks the entry as recently used, for eviction.
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            return None
+        return arrays
+
+    def put(self, key, arrays):
+        """Stores an entry, then evicts entries above the size limit.
+
+        Args:
+            key: a string, usable as a file name
+            arrays: a dict of NumPy arrays, keyed on strings
+        """
+        handle, temp_path = tempfile.mkstemp(suffix='.tmp',
+                                             dir=self.directory)
+        try:
+            with os.fdopen(handle, 'wb') as npz_file:
+                if self.compress:
+                    np.savez_compressed(npz_file, **arrays)
+                else:
+                    np.savez(npz_file, **arrays)
+            # Readers never see a partially written entry.
+            os.replace(temp_path, self._path(key))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries above max_bytes."""
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(_SUFFIX) or not entry.is_file():
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total_size -= size
@@ -0,0 +1,99 @@
+"""Decimation of the fixes of a flight, at parse time.
+
+Track rendering and bulk statistics do not need every fix of a 1 Hz log.
+A DecimationPolicy selects the fixes to keep from the raw columns of a
+FixStore, before any analysis stage runs on them, so that the reduced
+flight costs proportionally less to analyse and to hold in memory.
+
+The first and the last fixes are always kept. Criteria combine: fixes
+are first taken every Nth, then spaced in time, then in distance.
+"""
+
+import numpy as np
+
+from lib import geo
+
+
+def _spaced(values, step, times=None, max_time_step=None):
+    """Greedily picks the indices of values at least `step` apart.
+
+    Args:
+        values: a non-decreasing NumPy float array
+        step: a float, the minimum difference between picked values
+        times: a non-decreasing NumPy float array, optional; an index is
+        also picked when its time is max_time_step after the last pick
+
+    Returns:
+        A list of integers, the picked indices, starting with 0.
+    """
+    indices = [0]
+    # Tolerance for steps matching the fix interval exactly.
+    step = step - 1e-6
+    index = 0
+    while True:
+        next_index = int(np.searchsorted(values, values[index] + step))
+        if times is not None:
+            next_index = min(next_index, int(np.searchsorted(
+                times, times[index] + max_time_step - 1e-6)))
+        index = max(next_index, index + 1)
+        if index >= len(values):
+            return indices
+        indices.append(index)
+
+
+class DecimationPolicy(object):
+    """Selects a subset of the fixes of a flight.
+
+    Attributes:
+        every: an integer, keep one fix out of `every`
+        min_time_step: a float, minimum time between kept fixes, seconds
+        min_distance: a float, minimum distance flown between kept fixes,
+        kilometers
+        max_time_step: a float, with min_distance, maximum time between
+        kept fixes, seconds; keeps the stationary periods visible to the
+        flight detection
+    """
+
+    def __init__(self, every=1, min_time_step=0.0, min_distance=0.0,
+                 max_time_step=30.0):
+        if every < 1:
+            raise ValueError("every must be at least 1, got %r" % every)
+        self.every = int(every)
+        self.min_time_step = float(min_time_step)
+        self.min_distance = float(min_distance)
+        self.max_time_step = float(max_time_step)
+
+    def __repr__(self):
+        return ("DecimationPolicy(every=%d, min_time_step=%r, "
+                "min_distance=%r, max_time_step=%r)" % (
+                    self.every, self.min_time_step, self.min_distance,
+                    self.max_time_step))
+
+    def select(self, store):
+        """Returns the indices of the fixes to keep.
+
+        Args:
+            store: a FixStore, only its raw columns are used; rawtime
+            continues across 0:00 UTC, see Flight._check_fix_rawtime()
+
+        Returns:
+            A NumPy integer array, increasing indices of fixes of store.
+        """
+        count = len(store)
+        if count == 0:
+            return np.arange(0)
+        indices = np.arange(0, count, self.every)
+        # Out of order fixes must not break the binary searches.
+        rawtime = np.maximum.accumulate(store.data['rawtime'])
+        if self.min_time_step > 0.0:
+            indices = indices[_spaced(rawtime[indices], self.min_time_step)]
+        if self.min_distance > 0.0:
+            lat = store.data['lat'][indices]
+            lon = store.data['lon'][indices]
+            flown = np.concatenate(([0.0], np.cumsum(geo.earth_distances(
+                lat[:-1], lon[:-1], lat[1:], lon[1:]))))
+            indices = indices[_spaced(flown, self.min_distance,
+                                      rawtime[indices], self.max_time_step)]
+        if indices[-1] != count - 1:
+            indices = np.append(indices, count - 1)
+        return indices
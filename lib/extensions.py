@@ -0,0 +1,123 @@
+"""Decoding of the B record extensions described by the I record.
+
+The I record (see the IGC specification, chapter A4.3) lists the
+extensions appended to every B record, with their byte positions:
+
+    I NN SSFFCCC SSFFCCC ...
+
+where NN is the number of extensions, SS and FF the first and last byte
+of an extension in the B record (1-based, inclusive) and CCC its
+three-letter code. For example I033638FXA3941ENL4246TAS declares the fix
+accuracy (FXA), the engine noise level (ENL) and the true airspeed (TAS).
+
+The extensions of all fixes are decoded at once, from the fixed-width
+bytes column of a FixStore, into one float column per code.
+"""
+
+import collections
+import re
+
+import numpy as np
+
+
+# Position of the first byte of the extensions in a B record, 1-based.
+_FIRST_EXTENSION_BYTE = 36
+
+# One extension of the B records, start and end are offsets in the
+# extensions string (0-based, end excluded).
+ExtensionField = collections.namedtuple('ExtensionField',
+                                        ['code', 'start', 'end'])
+
+_I_RECORD_RE = re.compile(r'^I(\d\d)')
+_I_FIELD_RE = re.compile(r'(\d\d)(\d\d)([A-Z0-9]{3})', flags=re.IGNORECASE)
+
+
+def parse_I_record(i_record):
+    """Parses the extension fields of an IGC I record line.
+
+    Fields with inconsistent byte positions are ignored, so are repeated
+    codes.
+
+    Args:
+        i_record: a string, the I record line
+
+    Returns:
+        A list of ExtensionField, empty if the line is not an I record.
+    """
+    match = _I_RECORD_RE.match(i_record)
+    if not match:
+        return []
+    fields = []
+    codes = set()
+    for i in range(int(match.group(1))):
+        offset = 3 + 7*i
+        match = _I_FIELD_RE.match(i_record, offset)
+        if not match:
+            break
+        first, last, code = match.groups()
+        start = int(first) - _FIRST_EXTENSION_BYTE
+        end = int(last) - _FIRST_EXTENSION_BYTE + 1
+        code = code.upper()
+        if start < 0 or end <= start or code in codes:
+            continue
+        codes.add(code)
+        fields.append(ExtensionField(code, start, end))
+    return fields
+
+
+def _extras_matrix(extras, width):
+    """Returns a (fixes x width) uint8 matrix of a bytes array."""
+    itemsize = extras.dtype.itemsize
+    matrix = np.zeros((len(extras), max(width, itemsize)), dtype=np.uint8)
+    matrix[:, :itemsize] = np.ascontiguousarray(extras).view(
+        np.uint8).reshape(len(extras), itemsize)
+    return matrix
+
+
+def decode_extensions(extras, fields):
+    """Decodes the extensions of all fixes into numeric columns.
+
+    Args:
+        extras: a NumPy bytes array, the B record extensions of each fix
+        fields: a list of ExtensionField, see parse_I_record()
+
+    Returns:
+        A (columns, exact) tuple. columns is a dict of float arrays keyed
+        on the extension codes, NaN where a fix lacks the extension or
+        it is not an integer. exact is a bool, whether encode_extensions()
+        gives back the extras of every fix.
+    """
+    if not fields:
+        return {}, False
+    length = max(field.end for field in fields)
+    matrix = _extras_matrix(extras, length)
+    columns = {}
+    coverage = np.zeros(length, dtype=np.intp)
+    for field in fields:
+        coverage[field.start:field.end] += 1
+    # Fields must tile the extensions, with nothing after them.
+    exact = (coverage == 1).all() and not matrix[:, length:].any()
+    for field in fields:
+        digits = matrix[:, field.start:field.end] - np.uint8(ord('0'))
+        negative = matrix[:, field.start] == ord('-')
+        digits[negative, 0] = 0
+        # Bytes below '0' wrap around to large values.
+        valid = digits.max(axis=1) <= 9
+        weights = 10.0 ** np.arange(field.end - field.start - 1, -1, -1)
+        values = np.dot(digits.astype(np.float64), weights)
+        exact = exact and valid.all() and not (
+            negative & (values == 0.0)).any()
+        values[negative] *= -1.0
+        values[~valid] = np.nan
+        columns[field.code] = values
+    return columns, bool(exact)
+
+
+def encode_extensions(columns, fields, index):
+    """Rebuilds the extensions string of fix `index` from its columns.
+
+    Only meaningful when decode_extensions() reported an exact decoding.
+    """
+    return "".join("%0*d" % (field.end - field.start,
+                             columns[field.code][index])
+                   for field in sorted(fields, key=lambda f: f.start))
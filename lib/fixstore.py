@@ -0,0 +1,268 @@
+"""Columnar storage for the GNSS fixes of a flight.
+
+All fixes of a flight are kept in a single NumPy structured array (one row
+per B record, one field per fix attribute) instead of one Python object per
+fix. Analysis stages operate directly on the columns, GNSSFix objects are
+only thin views created on demand.
+"""
+
+import weakref
+
+import numpy as np
+
+from lib import extensions
+
+
+# Fields read directly from the B records.
+RAW_FIELDS = ('rawtime', 'lat', 'lon', 'validity', 'press_alt', 'gnss_alt')
+
+# Fields computed by the analysis stages of a Flight.
+DERIVED_FIELDS = ('timestamp', 'alt', 'gsp', 'bearing', 'bearing_change_rate',
+                  'flying', 'circling')
+
+FIX_DTYPE = np.dtype([
+    ('rawtime', np.float64),
+    ('lat', np.float64),
+    ('lon', np.float64),
+    ('validity', 'S1'),
+    ('press_alt', np.float64),
+    ('gnss_alt', np.float64),
+    ('timestamp', np.float64),
+    ('alt', np.float64),
+    ('gsp', np.float64),
+    ('bearing', np.float64),
+    ('bearing_change_rate', np.float64),
+    ('flying', np.bool_),
+    ('circling', np.bool_),
+])
+
+
+class FixStore(object):
+    """Stores the fixes of a flight as columns.
+
+    Attributes:
+        data: a NumPy structured array of FIX_DTYPE, one row per fix
+        extras: a NumPy bytes array, the B record extensions of each fix,
+        None once they are fully held by the extension columns
+        extension_fields: a list of ExtensionField, the decoded extensions
+        extensions: a dict of NumPy float arrays, the values of the B record
+        extensions keyed on their three-letter code, see lib/extensions.py
+    """
+
+    def __init__(self, data, extras=None):
+        self.data = data
+        if extras is None:
+            extras = np.zeros(len(data), dtype='S1')
+        self.extras = extras
+        # Allocated rows, see append().
+        self._rows = data
+        self._extras_rows = extras
+        self.extension_fields = []
+        self.extensions = {}
+        self._computed = set()
+        self._provider = None
+
+    @staticmethod
+    def from_columns(rawtime, lat, lon, validity, press_alt, gnss_alt,
+                     extras=None):
+        """Creates a FixStore from raw B record columns.
+
+        Args:
+            rawtime, lat, lon, press_alt, gnss_alt: sequences of floats
+            validity: a sequence of one-letter validity flags
+            extras: a sequence of B record extensions, optional
+
+        Returns:
+            The created FixStore, with no derived fields computed.
+        """
+        data = np.zeros(len(rawtime), dtype=FIX_DTYPE)
+        data['rawtime'] = rawtime
+        data['lat'] = lat
+        data['lon'] = lon
+        data['validity'] = validity
+        data['press_alt'] = press_alt
+        data['gnss_alt'] = gnss_alt
+        if extras is not None:
+            extras = np.array(extras, dtype='S')
+        return FixStore(data, extras)
+
+    @staticmethod
+    def from_fixes(fixes):
+        """Creates a FixStore holding copies of a list of GNSSFix objects."""
+        return FixStore.from_columns(
+            [fix.rawtime for fix in fixes],
+            [fix.lat for fix in fixes],
+            [fix.lon for fix in fixes],
+            [fix.validity for fix in fixes],
+            [fix.press_alt for fix in fixes],
+            [fix.gnss_alt for fix in fixes],
+            [fix.extras for fix in fixes])
+
+    def __len__(self):
+        return len(self.data)
+
+    def append(self, rawtime, lat, lon, validity, press_alt, gnss_alt,
+               extras):
+        """Appends fixes, from raw B record columns.
+
+        Rows are allocated in blocks of growing size, so that appending
+        fixes one at a time takes amortized constant time.
+
+        Returns:
+            The index of the first appended fix.
+        """
+        self._materialize_extras()
+        if not np.may_share_memory(self.extras, self._extras_rows):
+            # The extras were replaced, see set_extras().
+            self._extras_rows = self.extras
+        start = len(self.data)
+        end = start + len(rawtime)
+        if end > len(self._rows):
+            capacity = max(end, 2 * len(self._rows), 1024)
+            rows = np.zeros(capacity, dtype=FIX_DTYPE)
+            rows[:start] = self.data
+            self._rows = rows
+            extras_rows = np.zeros(capacity, dtype=self.extras.dtype)
+            extras_rows[:start] = self.extras
+            self._extras_rows = extras_rows
+        self.data = self._rows[:end]
+        data = self.data[start:end]
+        data['rawtime'] = rawtime
+        data['lat'] = lat
+        data['lon'] = lon
+        data['validity'] = validity
+        data['press_alt'] = press_alt
+        data['gnss_alt'] = gnss_alt
+        extras = np.asarray(extras, dtype='S')
+        if extras.dtype.itemsize > self._extras_rows.dtype.itemsize:
+            self._extras_rows = self._extras_rows.astype(extras.dtype)
+        self._extras_rows[start:end] = extras
+        self.extras = self._extras_rows[:end]
+        return start
+
+    def take(self, indices):
+        """Returns a new FixStore holding copies of some fixes.
+
+        Args:
+            indices: a sequence of integers, the rows to copy
+
+        Returns:
+            The new FixStore, with the same derived fields computed.
+        """
+        store = FixStore(self.data[indices])
+        if self.extras is None:
+            store.extras = None
+        else:
+            store.extras = self.extras[indices]
+        store._computed = set(self._computed)
+        store.extension_fields = self.extension_fields
+        store.extensions = dict((code, column[indices])
+                                for code, column in self.extensions.items())
+        return store
+
+    def has(self, name):
+        """Returns whether the field `name` holds meaningful values."""
+        return name in RAW_FIELDS or name in self._computed
+
+    def set_column(self, name, values):
+        """Stores the values of a derived field for all fixes."""
+        self.data[name] = values
+        self._computed.add(name)
+
+    def set_provider(self, provider):
+        """Sets the callback computing derived fields on first access.
+
+        Args:
+            provider: a bound method, called with the name of a field
+            that is not computed yet. Only a weak reference is kept, so
+            that the store does not keep its owner alive.
+        """
+        self._provider = weakref.WeakMethod(provider)
+
+    def column(self, name):
+        """Returns the NumPy column of field `name`.
+
+        Raises:
+            AttributeError: the derived field has not been computed yet
+            and it can not be computed by the provider.
+        """
+        if not self.has(name) and self._provider is not None:
+            provider = self._provider()
+            if provider is not None:
+                provider(name)
+        if not self.has(name):
+            raise AttributeError(name)
+        return self.data[name]
+
+    def get(self, name, index):
+        """Returns field `name` of fix `index` as a Python scalar."""
+        value = self.column(name).item(index)
+        if name == 'validity':
+            value = value.decode('ISO-8859-1')
+        return value
+
+    def set(self, name, index, value):
+        """Sets field `name` of fix `index`."""
+        if name not in RAW_FIELDS and name not in self._computed:
+            # First value of a derived field set from outside of
+            # the analysis stages; the rest of the column is undefined.
+            self._computed.add(name)
+        self.data[name][index] = value
+
+    def decode_extensions(self, fields):
+        """Decodes the B record extensions into typed columns.
+
+        The bytes column of the extensions is released if the extension
+        columns hold all of its information.
+
+        Args:
+            fields: a list of ExtensionField, see extensions.parse_I_record()
+        """
+        columns, exact = extensions.decode_extensions(self.extras, fields)
+        self.extension_fields = fields
+        self.extensions = columns
+        if exact:
+            self.extras = self._extras_rows = None
+
+    def drop_extensions(self):
+        """Releases the B record extensions, the fixes get empty ones."""
+        self.extras = self._extras_rows = None
+        self.extension_fields = []
+        self.extensions = {}
+
+    def get_extension(self, code, index):
+        """Returns extension `code` of fix `index`.
+
+        Returns:
+            A float, or None if the fix lacks a numeric value for `code`.
+        """
+        column = self.extensions.get(code)
+        if column is None or np.isnan(column[index]):
+            return None
+        return column.item(index)
+
+    def get_extras(self, index):
+        """Returns the B record extensions of fix `index` as a string."""
+        if self.extras is None:
+            return extensions.encode_extensions(
+                self.extensions, self.extension_fields, index)
+        return self.extras[index].decode('ISO-8859-1')
+
+    def _materialize_extras(self):
+        """Rebuilds the bytes column of the extensions, if released."""
+        if self.extras is None:
+            self.extras = np.array(
+                [self.get_extras(i) for i in range(len(self))], dtype='S')
+
+    def set_extras(self, index, value):
+        """Sets the B record extensions of fix `index`."""
+        self._materialize_extras()
+        value = value.encode('ISO-8859-1')
+        if len(value) > self.extras.dtype.itemsize:
+            self.extras = self.extras.astype('S%d' % len(value))
+        self.extras[index] = value
+        if self.extension_fields:
+            columns, _ = extensions.decode_extensions(
+                self.extras[index:index + 1], self.extension_fields)
+            for code, column in columns.items():
+                self.extensions[code][index] = column[0]
@@ -1,5 +1,7 @@
 import math
 
+import numpy as np
+
 EARTH_RADIUS_KM = 6371.0
 
 
@@ -42,6 +44,21 @@ def earth_distance(lat1, lon1, lat2, lon2):
     return EARTH_RADIUS_KM * sphere_distance(lat1, lon1, lat2, lon2)
 
 
+def earth_distances(lat1, lon1, lat2, lon2):
+    """Computes Earth distances between arrays of points, in kilometers.
+
+    The array version of earth_distance(), arguments are NumPy arrays
+    (or floats) of angles in degrees, WGS-84.
+
+    Returns:
+        A NumPy float array, the computed Earth distances.
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
+    a = (np.sin((lat2 - lat1)/2)**2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1)/2)**2)
+    return EARTH_RADIUS_KM * 2.0 * np.arcsin(np.sqrt(a))
+
+
 def bearing_to(lat1, lon1, lat2, lon2):
     """Computes bearing between the current point and the heading point.
 
@@ -66,6 +83,36 @@ def bearing_to(lat1, lon1, lat2, lon2):
     return math.degrees(math.atan2(y, x))
 
 
+def track_legs(lat, lon):
+    """Computes the distance and bearing of each leg of a track.
+
+    The array version of earth_distance() and bearing_to() for
+    consecutive points, sharing the trigonometry of both.
+
+    Args:
+        lat: a NumPy float array, latitudes of the points, degrees
+        lon: a NumPy float array, longitudes of the points, degrees
+
+    Returns:
+        A (distances, bearings) tuple of NumPy float arrays, one value
+        less than points: the Earth distance in kilometers and the
+        bearing in degrees (north = 0.0) from each point to the next.
+    """
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    cos_lat = np.cos(lat)
+    sin_lat = np.sin(lat)
+    dlat = lat[1:] - lat[:-1]
+    dlon = lon[1:] - lon[:-1]
+    a = (np.sin(dlat/2)**2 +
+         cos_lat[:-1] * cos_lat[1:] * np.sin(dlon/2)**2)
+    distances = EARTH_RADIUS_KM * 2.0 * np.arcsin(np.sqrt(a))
+    y = np.sin(dlon) * cos_lat[1:]
+    x = (cos_lat[:-1] * sin_lat[1:] -
+         sin_lat[:-1] * cos_lat[1:] * np.cos(dlon))
+    return distances, np.degrees(np.arctan2(y, x))
+
+
 def sphere_angle(lat1, lon1, lat, lon, lat2, lon2):
     """Computes the angle on a sphere given three points.
 
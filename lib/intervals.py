@@ -0,0 +1,170 @@
+"""Constant time statistics over ranges of fixes.
+
+An IntervalIndex holds cumulative sums over the fixes of a FixStore:
+distance flown, altitude gained and lost, and time spent circling. The
+statistics of the fixes i to j are then differences of two sums, whatever
+the number of fixes in between. Indices may be integers or NumPy integer
+arrays, to query many ranges at once.
+
+Times are found by binary search on the timestamps of the fixes, which
+the validation of a Flight keeps in order.
+
+The sums are computed on first use of each statistic. When the store
+grows or its columns change, invalidate() drops the sums from the first
+changed fix on, they are then extended from there.
+"""
+
+import numpy as np
+
+from lib import geo
+
+
+def _ratio(numerator, denominator, scale=1.0):
+    """Returns scale * numerator / denominator, 0.0 where it is 0."""
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    nonzero = np.fabs(denominator) >= 1e-7
+    ratio = np.zeros(np.broadcast(numerator, denominator).shape)
+    np.divide(numerator * scale, denominator, out=ratio, where=nonzero)
+    return ratio[()]
+
+
+class IntervalIndex(object):
+    """Statistics of ranges of fixes of a FixStore, in constant time.
+
+    Ranges go from fix i to fix j, both included, i <= j. Distances are
+    in kilometers, times in seconds, altitudes in meters.
+    """
+
+    def __init__(self, store):
+        """Initializer of the IntervalIndex class.
+
+        Args:
+            store: a FixStore, with its timestamp and alt columns set
+        """
+        self._store = store
+        self._sums = {}
+
+    def invalidate(self, start=0):
+        """Drops the sums from a fix on, see IncrementalFlight.
+
+        Args:
+            start: an integer, the first fix appended to the store or
+            whose columns changed
+        """
+        for name, sums in self._sums.items():
+            self._sums[name] = sums[:max(start, 1)]
+
+    def _sum(self, name):
+        """Returns the sums of a statistic before each fix, from 0."""
+        sums = self._sums.get(name)
+        if sums is None or len(sums) < len(self._store):
+            if sums is None:
+                sums = np.zeros(1)
+            steps = getattr(self, '_' + name + '_steps')(len(sums) - 1)
+            sums = np.concatenate((sums, sums[-1] + np.cumsum(steps)))
+            self._sums[name] = sums
+        return sums
+
+    # Steps of each statistic from fix start on, between consecutive fixes.
+
+    def _distance_steps(self, start):
+        lat = self._store.column('lat')[start:]
+        lon = self._store.column('lon')[start:]
+        return geo.earth_distances(lat[1:], lon[1:], lat[:-1], lon[:-1])
+
+    def _gain_steps(self, start):
+        return np.maximum(np.diff(self._store.column('alt')[start:]), 0.0)
+
+    def _loss_steps(self, start):
+        return np.maximum(-np.diff(self._store.column('alt')[start:]), 0.0)
+
+    def _circling_steps(self, start):
+        # The time from a circling fix to the next one is spent circling.
+        circling = self._store.column('circling')[start:-1]
+        return np.diff(self._store.column('timestamp')[start:]) * circling
+
+    def fixes_between(self, start, end):
+        """Returns the range of the fixes recorded between two times.
+
+        Args:
+            start, end: POSIX timestamps, seconds
+
+        Returns:
+            A (i, j) tuple, the first and the last fixes recorded from start
+            to end, inclusive; j < i if there is none.
+        """
+        timestamp = self._store.column('timestamp')
+        return (np.searchsorted(timestamp, start, side='left'),
+                np.searchsorted(timestamp, end, side='right') - 1)
+
+    def interpolate(self, timestamps, names=('lat', 'lon', 'alt')):
+        """Returns fields of the fixes, linearly interpolated at times.
+
+        Args:
+            timestamps: a POSIX timestamp, or a NumPy array of them
+            names: a sequence of strings, the numeric fields to return
+
+        Returns:
+            A tuple of the values of each field, floats or NumPy arrays like
+            timestamps; NaN at times out of the recording.
+        """
+        timestamp = self._store.column('timestamp')
+        times = np.asarray(timestamps, dtype=np.float64)
+        # The fixes around each time, the last two after the recording.
+        right = np.minimum(np.searchsorted(timestamp, times, side='right'),
+                           len(timestamp) - 1)
+        left = np.maximum(right - 1, 0)
+        span = (timestamp[right] - timestamp[left]).astype(np.float64)
+        weight = np.zeros(np.shape(times))
+        np.divide(times - timestamp[left], span, out=weight, where=span > 0)
+        recorded = ((times >= timestamp[0]) & (times <= timestamp[-1]))
+        values = []
+        for name in names:
+            column = self._store.column(name)
+            value = column[left] + (column[right] - column[left]) * weight
+            value = np.where(recorded, value, np.nan)
+            values.append(value.item() if value.ndim == 0 else value)
+        return tuple(values)
+
+    def distance(self, i, j):
+        """Returns the length of the track from fix i to fix j."""
+        distance = self._sum('distance')
+        return distance[j] - distance[i]
+
+    def duration(self, i, j):
+        """Returns the time from fix i to fix j."""
+        timestamp = self._store.column('timestamp')
+        return (timestamp[j] - timestamp[i]).astype(np.float64)
+
+    def alt_change(self, i, j):
+        """Returns the altitude of fix j less the one of fix i."""
+        alt = self._store.column('alt')
+        return alt[j] - alt[i]
+
+    def alt_gain(self, i, j):
+        """Returns the sum of the altitude gains from fix i to fix j."""
+        gain = self._sum('gain')
+        return gain[j] - gain[i]
+
+    def alt_loss(self, i, j):
+        """Returns the sum of the altitude losses from fix i to fix j."""
+        loss = self._sum('loss')
+        return loss[j] - loss[i]
+
+    def circling_time(self, i, j):
+        """Returns the time spent circling from fix i to fix j."""
+        circling = self._sum('circling')
+        return circling[j] - circling[i]
+
+    def average_speed(self, i, j):
+        """Returns the average speed along the track, km/h, 0.0 if no time."""
+        return _ratio(self.distance(i, j), self.duration(i, j), 3600.0)
+
+    def vertical_velocity(self, i, j):
+        """Returns the average vertical velocity, m/s, 0.0 if no time."""
+        return _ratio(self.alt_change(i, j), self.duration(i, j))
+
+    def glide_ratio(self, i, j):
+        """Returns the track length over the altitude change, see Glide."""
+        return _ratio(self.distance(i, j), self.alt_change(i, j), 1000.0)
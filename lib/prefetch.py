@@ -0,0 +1,98 @@
+"""Reading a slow stream ahead, in a background thread.
+
+Downloads from cloud storage deliver an IGC file in chunks, each one
+waiting on the network. A PrefetchingReader keeps reading the next chunks
+while the previous ones are parsed, so that the transfer and the parsing
+overlap, with at most `depth` chunks held in memory.
+"""
+
+import queue
+import threading
+
+
+_END = object()
+
+
+class PrefetchingReader(object):
+    """A binary file-like object reading its source ahead.
+
+    read() returns the chunks of the source as soon as they arrive,
+    possibly shorter than requested; b'' at the end of the source.
+    Exceptions raised while reading the source are raised by read().
+    """
+
+    def __init__(self, source, chunk_size=1 << 18, depth=4):
+        """Initializer of the PrefetchingReader class.
+
+        Args:
+            source: a binary file-like object, closed with the reader
+            chunk_size: an integer, the size of the reads from the source
+            depth: an integer, the maximum number of chunks read ahead
+        """
+        self._source = source
+        self._chunk_size = chunk_size
+        self._chunks = queue.Queue(maxsize=depth)
+        self._pending = b''
+        self._done = False
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._read_ahead,
+                                        daemon=True)
+        self._thread.start()
+
+    def _read_ahead(self):
+        try:
+            while not self._closed.is_set():
+                chunk = self._source.read(self._chunk_size)
+                if not chunk:
+                    break
+                self._put(chunk)
+        except Exception as error:
+            self._put(error)
+            return
+        self._put(_END)
+
+    def _put(self, item):
+        while not self._closed.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        """Returns the next bytes of the source, at most size if positive."""
+        if not self._pending and not self._done:
+            item = self._chunks.get()
+            if item is _END:
+                self._done = True
+            elif isinstance(item, Exception):
+                self._done = True
+                raise item
+            else:
+                self._pending = item
+        if size is None or size < 0:
+            chunks = [self._pending]
+            self._pending = b''
+            while not self._done:
+                chunks.append(self.read(self._chunk_size))
+            return b''.join(chunks)
+        chunk = self._pending[:size]
+        self._pending = self._pending[size:]
+        return chunk
+
+    def close(self):
+        """Stops the reads ahead and closes the source."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._thread.join()
+        self._source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,624 @@
+"""Decoding of IGC records from raw bytes.
+
+B records have a fixed layout (see the IGC specification, chapter A4.1):
+
+    B HHMMSS DDMMmmm[NS] DDDMMmmm[EW] [AV] PPPPP GGGGG extensions
+    0 1      7           15           24   25    30    35
+
+which allows decoding all B records of a buffer at once, as NumPy
+operations over a (records x 35) byte matrix, instead of running a regular
+expression and a dozen float() conversions per line. Lines which do not
+pass the fixed-offset validation are handed to the regular expression
+based parser, so that the semantics of both paths are the same.
+
+IGC sources of any kind (file names, buffers, file objects, iterables of
+lines) are read in chunks by a single generator, iter_records(), which
+all the Flight.create_from_* constructors are built upon. peek_records()
+reads the header records and the first and last B records only.
+"""
+
+import collections
+import contextlib
+import mmap
+import os
+import re
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from lib.fixstore import FixStore
+
+
+ENCODING = "ISO-8859-1"
+
+# Length of the fixed part of a B record, extensions start at this offset.
+B_RECORD_LENGTH = 35
+
+# B records with longer extensions are decoded by the regular expression.
+MAX_EXTRAS_LENGTH = 128
+
+# Size of the chunks in which IGC sources are read, bytes.
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+# Initial size of the head and tail windows read by peek_records(), bytes.
+PEEK_SIZE = 4096
+
+_B_RECORD_RE = re.compile(
+    r'^B' + r'(\d\d)(\d\d)(\d\d)'
+    + r'(\d\d)(\d\d)(\d\d\d)([NS])'
+    + r'(\d\d\d)(\d\d)(\d\d\d)([EW])'
+    + r'([AV])' + r'([-\d]\d\d\d\d)' + r'([-\d]\d\d\d\d)'
+    + r'([0-9a-zA-Z\-]*).*$')
+
+_DIGIT_COLUMNS = np.r_[1:14, 15:23, 26:30, 31:35]
+_EXTRAS_CHARS = np.zeros(256, dtype=np.bool_)
+for _char in b"0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ-":
+    _EXTRAS_CHARS[_char] = True
+
+_CR, _LF = ord('\r'), ord('\n')
+
+# Decimal fields of the fixed part of a B record, as (start, end) offsets.
+# All of them are decoded at once, by multiplying the matrix of digits
+# by a matrix of decimal weights.
+_NUMBER_FIELDS = [
+    (1, 3), (3, 5), (5, 7),  # hours, minutes, seconds
+    (7, 9), (9, 11), (11, 14),  # latitude degrees, minutes, 1/1000 minutes
+    (15, 18), (18, 20), (20, 23),  # longitude
+    (25, 26), (26, 30),  # pressure altitude, first character and the rest
+    (30, 31), (31, 35),  # gnss altitude
+]
+_NUMBER_WEIGHTS = np.zeros((B_RECORD_LENGTH, len(_NUMBER_FIELDS)))
+for _field, (_start, _end) in enumerate(_NUMBER_FIELDS):
+    _NUMBER_WEIGHTS[_start:_end, _field] = 10.0 ** np.arange(
+        _end - _start - 1, -1, -1)
+
+
+def parse_B_record(B_record_line):
+    """Decodes the raw fields of an IGC B-record line.
+
+    Args:
+        B_record_line: a string, B record line from an IGC file
+
+    Returns:
+        A (rawtime, lat, lon, validity, press_alt, gnss_alt, extras)
+        tuple, or None if the line is not a valid B record.
+    """
+    match = _B_RECORD_RE.match(B_record_line)
+    if match is None:
+        return None
+    (hours, minutes, seconds,
+     lat_deg, lat_min, lat_min_dec, lat_sign,
+     lon_deg, lon_min, lon_min_dec, lon_sign,
+     validity, press_alt, gnss_alt,
+     extras) = match.groups()
+
+    rawtime = (float(hours)*60.0 + float(minutes))*60.0 + float(seconds)
+
+    lat = float(lat_deg)
+    lat += float(lat_min) / 60.0
+    lat += float(lat_min_dec) / 1000.0 / 60.0
+    if lat_sign == 'S':
+        lat = -lat
+
+    lon = float(lon_deg)
+    lon += float(lon_min) / 60.0
+    lon += float(lon_min_dec) / 1000.0 / 60.0
+    if lon_sign == 'W':
+        lon = -lon
+
+    press_alt = float(press_alt)
+    gnss_alt = float(gnss_alt)
+
+    return rawtime, lat, lon, validity, press_alt, gnss_alt, extras
+
+
+def line_bounds(data):
+    """Finds the non-empty lines of a buffer.
+
+    Lines can be terminated by '\\n', '\\r\\n' or '\\r'.
+
+    Args:
+        data: a 1-D uint8 NumPy array
+
+    Returns:
+        A (starts, ends) tuple of int arrays, offsets of the first byte
+        and one past the last byte of each non-empty line.
+    """
+    eol = np.flatnonzero((data == _LF) | (data == _CR))
+    starts = np.empty(len(eol) + 1, dtype=np.intp)
+    starts[0] = 0
+    starts[1:] = eol + 1
+    ends = np.empty(len(eol) + 1, dtype=np.intp)
+    ends[:-1] = eol
+    ends[-1] = len(data)
+    non_empty = ends > starts
+    return starts[non_empty], ends[non_empty]
+
+
+def decode_B_records(data, starts, ends):
+    """Decodes B record lines of a buffer, in bulk.
+
+    Args:
+        data: a 1-D uint8 NumPy array, the buffer
+        starts: an int array, offsets of the B record lines in data
+        ends: an int array, offsets one past the end of these lines
+
+    Returns:
+        A (columns, valid) tuple. columns is a (rawtime, lat, lon, validity,
+        press_alt, gnss_alt, extras) tuple of arrays with one element per
+        line, valid is a bool array, False for lines that are not proper
+        B records (their elements in the columns are undefined).
+    """
+    n = len(starts)
+    lengths = ends - starts
+    fast = (lengths >= B_RECORD_LENGTH) & (
+        lengths <= B_RECORD_LENGTH + MAX_EXTRAS_LENGTH)
+
+    # Fixed-width rows are copied out of a strided, zero-copy view of the
+    # buffer, one row per line.
+    width = max(int(lengths[fast].max()) if fast.any() else 0,
+                B_RECORD_LENGTH)
+    last_window = len(data) - width
+    if last_window >= 0:
+        rec = sliding_window_view(data, width)[np.minimum(starts, last_window)]
+    else:
+        rec = np.empty((n, width), dtype=np.uint8)
+    near_end = starts > last_window
+    if near_end.any():
+        # Lines too close to the end of the buffer for a full row.
+        base = max(last_window, 0)
+        end_data = np.zeros(2 * width, dtype=np.uint8)
+        end_data[:len(data) - base] = data[base:]
+        rec[near_end] = sliding_window_view(end_data, width)[
+            starts[near_end] - base]
+    digits = rec[:, :B_RECORD_LENGTH] - np.uint8(ord('0'))
+
+    # Bytes below '0' wrap around to large values.
+    fast &= digits[:, _DIGIT_COLUMNS].max(axis=1) <= 9
+    fast &= (rec[:, 14] == ord('N')) | (rec[:, 14] == ord('S'))
+    fast &= (rec[:, 23] == ord('E')) | (rec[:, 23] == ord('W'))
+    fast &= (rec[:, 24] == ord('A')) | (rec[:, 24] == ord('V'))
+    for sign_column in (25, 30):
+        fast &= ((rec[:, sign_column] == ord('-')) |
+                 (digits[:, sign_column] <= 9))
+
+    negative_press_alt = rec[:, 25] == ord('-')
+    negative_gnss_alt = rec[:, 30] == ord('-')
+    digits[negative_press_alt, 25] = 0
+    digits[negative_gnss_alt, 30] = 0
+    (hours, minutes, seconds,
+     lat_deg, lat_min, lat_min_dec,
+     lon_deg, lon_min, lon_min_dec,
+     press_alt_first, press_alt, gnss_alt_first, gnss_alt) = np.dot(
+         digits.astype(np.float64), _NUMBER_WEIGHTS).T
+
+    rawtime = (hours*60.0 + minutes)*60.0 + seconds
+
+    lat = lat_deg + lat_min / 60.0
+    lat += lat_min_dec / 1000.0 / 60.0
+    lat[rec[:, 14] == ord('S')] *= -1.0
+
+    lon = lon_deg + lon_min / 60.0
+    lon += lon_min_dec / 1000.0 / 60.0
+    lon[rec[:, 23] == ord('W')] *= -1.0
+
+    validity = rec[:, 24].copy().view('S1')
+    press_alt += press_alt_first * 10000.0
+    press_alt[negative_press_alt] *= -1.0
+    gnss_alt += gnss_alt_first * 10000.0
+    gnss_alt[negative_gnss_alt] *= -1.0
+
+    # Extensions: the longest prefix of [0-9a-zA-Z-] characters after
+    # the fixed part of the record.
+    if width > B_RECORD_LENGTH:
+        extras_lengths = np.where(fast, lengths - B_RECORD_LENGTH, 0)
+        offsets = np.arange(width - B_RECORD_LENGTH)
+        tail = rec[:, B_RECORD_LENGTH:]
+        in_extras = np.take(_EXTRAS_CHARS, tail) & (
+            offsets < extras_lengths[:, np.newaxis])
+        in_extras = np.logical_and.accumulate(in_extras, axis=1)
+        tail[~in_extras] = 0
+        extras = np.ascontiguousarray(tail).view(
+            'S%d' % len(offsets)).reshape(n)
+    else:
+        extras = np.zeros(n, dtype='S1')
+
+    valid = fast.copy()
+    for i in np.flatnonzero(~fast):
+        line = data[starts[i]:ends[i]].tobytes().decode(ENCODING)
+        fields = parse_B_record(line)
+        if fields is None:
+            continue
+        valid[i] = True
+        (rawtime[i], lat[i], lon[i], validity[i],
+         press_alt[i], gnss_alt[i], fix_extras) = fields
+        fix_extras = fix_extras.encode(ENCODING)
+        if len(fix_extras) > extras.dtype.itemsize:
+            extras = extras.astype('S%d' % len(fix_extras))
+        extras[i] = fix_extras
+
+    return (rawtime, lat, lon, validity, press_alt, gnss_alt, extras), valid
+
+
+# One block of decoded B records, see iter_records().
+FixColumns = collections.namedtuple(
+    'FixColumns',
+    ['rawtime', 'lat', 'lon', 'validity', 'press_alt', 'gnss_alt', 'extras'])
+
+
+def iter_chunks(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields the content of an IGC source as bytes-like chunks.
+
+    Args:
+        source: one of:
+            - a bytes-like object, the content of an IGC file, for
+              example a memory-mapped file (see map_file()),
+            - a string or a path-like object, the name of an IGC file,
+            - a file-like object with a read() method (a binary or text
+              file, a BytesIO, a zip archive member, ...),
+            - an iterable of lines (strings or bytes).
+        chunk_size: an integer, the approximate size of the chunks
+
+    Returns:
+        A generator of bytes-like objects. Chunk boundaries can fall
+        anywhere, including inside a line.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview, np.ndarray,
+                           mmap.mmap)):
+        # Zero-copy slices of the buffer.
+        view = memoryview(source).cast('B')
+        for offset in range(0, len(view), chunk_size):
+            yield view[offset:offset + chunk_size]
+    elif isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as source_file:
+            for chunk in iter_chunks(source_file, chunk_size):
+                yield chunk
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            if isinstance(chunk, str):
+                chunk = chunk.encode(ENCODING, 'replace')
+            yield chunk
+    else:
+        lines = []
+        size = 0
+        for line in source:
+            if isinstance(line, str):
+                line = line.encode(ENCODING, 'replace')
+            lines.append(line)
+            size += len(line)
+            if size >= chunk_size:
+                lines.append(b'')
+                yield b'\n'.join(lines)
+                lines = []
+                size = 0
+        if lines:
+            yield b'\n'.join(lines)
+
+
+@contextlib.contextmanager
+def map_file(filename):
+    """Memory-maps a file for reading.
+
+    The pages of the file are read from the page cache on demand, without
+    copying the file into a Python object.
+
+    Args:
+        filename: a string or a path-like object, the name of the file
+
+    Returns:
+        A context manager, yielding a read-only bytes-like object.
+    """
+    with open(filename, 'rb') as mapped_file:
+        if os.fstat(mapped_file.fileno()).st_size == 0:
+            # Empty files can not be mapped.
+            yield b''
+            return
+        mapped = mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(mapped, 'madvise'):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        try:
+            yield mapped
+        finally:
+            try:
+                mapped.close()
+            except BufferError:
+                # Views of the mapping are still referenced somewhere,
+                # the file is unmapped when they are released.
+                pass
+
+
+def _iter_buffer_records(data):
+    """Yields the records of a buffer holding complete lines only."""
+    starts, ends = line_bounds(data)
+    kinds = data[starts]
+    for i in np.flatnonzero((kinds == ord('A')) | (kinds == ord('H')) |
+                            (kinds == ord('I'))):
+        yield (chr(kinds[i]),
+               data[starts[i]:ends[i]].tobytes().decode(ENCODING))
+
+    is_b = kinds == ord('B')
+    if is_b.any():
+        columns, valid = decode_B_records(data, starts[is_b], ends[is_b])
+        if not valid.all():
+            columns = [column[valid] for column in columns]
+        yield 'B', FixColumns(*columns)
+
+
+def iter_records(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Reads an IGC source in a single pass, yielding typed records.
+
+    Lines are never copied one by one: each chunk of the source is split
+    into lines with NumPy and its B records are decoded in bulk. Only a
+    line cut by a chunk boundary is copied, to be joined with the start
+    of the next chunk.
+
+    Args:
+        source: an IGC source, see iter_chunks()
+        chunk_size: an integer, the approximate size of the chunks
+
+    Returns:
+        A generator of (kind, record) tuples. kind is 'A', 'H' or 'I' and
+        record is the line, as a string, or kind is 'B' and record is a
+        FixColumns with the valid B records of a chunk. Records of each
+        kind come in the order of the file; other records are ignored.
+    """
+    for data in _iter_line_blocks(source, chunk_size):
+        for record in _iter_buffer_records(data):
+            yield record
+
+
+def _iter_line_blocks(source, chunk_size):
+    """Yields uint8 arrays of complete lines, read from an IGC source.
+
+    A line cut by a chunk boundary is yielded alone, as a small block
+    joining both parts.
+    """
+    partial_line = b''
+    for chunk in iter_chunks(source, chunk_size):
+        data = np.frombuffer(chunk, dtype=np.uint8)
+        eol = np.flatnonzero((data == _LF) | (data == _CR))
+        if not len(eol):
+            partial_line += data.tobytes()
+            continue
+        if partial_line:
+            partial_line += data[:eol[0]].tobytes()
+            yield np.frombuffer(partial_line, dtype=np.uint8)
+            data = data[eol[0]:]
+            eol = eol - eol[0]
+        yield data[:eol[-1]]
+        partial_line = data[eol[-1] + 1:].tobytes()
+    if partial_line:
+        yield np.frombuffer(partial_line, dtype=np.uint8)
+
+
+def read_records(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Reads all records of an IGC source.
+
+    Args:
+        source: an IGC source, see iter_chunks()
+        chunk_size: an integer, the approximate size of the chunks
+
+    Returns:
+        An (a_records, h_records, i_records, fixes) tuple. The first three
+        are lists of strings, fixes is a FixStore with the valid B records;
+        a fix is ignored if its time did not change since the previous fix.
+    """
+    records = {'A': [], 'H': [], 'I': [], 'B': []}
+    for kind, record in iter_records(source, chunk_size):
+        records[kind].append(record)
+    return (records['A'], records['H'], records['I'],
+            build_fix_store(records['B']))
+
+
+def build_fix_store(blocks):
+    """Builds a FixStore from FixColumns blocks, in order.
+
+    A fix is ignored if its time did not change since the previous fix.
+    """
+    if len(blocks) == 1:
+        columns = blocks[0]
+    elif blocks:
+        columns = [np.concatenate(column) for column in zip(*blocks)]
+    else:
+        return FixStore.from_columns([], [], [], [], [], [], [])
+    rawtime = columns[0]
+    keep = np.empty(len(rawtime), dtype=np.bool_)
+    keep[:1] = True
+    np.greater_equal(np.fabs(np.diff(rawtime)), 1e-5, out=keep[1:])
+    if not keep.all():
+        columns = [column[keep] for column in columns]
+    return FixStore.from_columns(*columns)
+
+
+def _first_fix(data, starts, ends, lines):
+    """Parses the first valid B record among some lines of a buffer.
+
+    Only a handful of lines are parsed here, for which the regular
+    expression is cheaper than the setup of decode_B_records().
+
+    Args:
+        data: a 1-D uint8 NumPy array, the buffer
+        starts, ends: int arrays, the bounds of the lines of the buffer
+        lines: an int array, indices of the candidate lines, in order
+
+    Returns:
+        A (line, fix) tuple, the index of the line and a FixColumns of
+        single values, or (None, None) if no candidate line is valid.
+    """
+    for line in lines:
+        fields = parse_B_record(
+            data[starts[line]:ends[line]].tobytes().decode(ENCODING))
+        if fields is not None:
+            return line, FixColumns(*fields)
+    return None, None
+
+
+def _peek_head(data, headers):
+    """Collects the header records of a buffer up to its first B record.
+
+    Args:
+        data: a 1-D uint8 NumPy array of complete lines
+        headers: a dict of lists of strings, keyed on 'A', 'H' and 'I',
+        to which the header records are appended
+
+    Returns:
+        The first valid B record, a FixColumns, or None.
+    """
+    starts, ends = line_bounds(data)
+    kinds = data[starts]
+    line, fix = _first_fix(data, starts, ends,
+                           np.flatnonzero(kinds == ord('B')))
+    for i in np.flatnonzero((kinds[:line] == ord('A')) |
+                            (kinds[:line] == ord('H')) |
+                            (kinds[:line] == ord('I'))):
+        headers[chr(kinds[i])].append(
+            data[starts[i]:ends[i]].tobytes().decode(ENCODING))
+    return fix
+
+
+def _peek_tail(data):
+    """Returns the last valid B record of a buffer, or None."""
+    starts, ends = line_bounds(data)
+    b_lines = np.flatnonzero(data[starts] == ord('B'))
+    return _first_fix(data, starts, ends, b_lines[::-1])[1]
+
+
+def _trim_lines(data, at_start, at_end):
+    """Drops the lines cut by the edges of a window of a file.
+
+    Args:
+        data: a 1-D uint8 NumPy array, a window of a file
+        at_start: a bool, whether the window starts at the file start
+        at_end: a bool, whether the window ends at the file end
+
+    Returns:
+        A view of data, holding complete lines only.
+    """
+    eol = np.flatnonzero((data == _LF) | (data == _CR))
+    if not len(eol):
+        return data if at_start and at_end else data[:0]
+    start = 0 if at_start else eol[0]
+    end = len(data) if at_end else eol[-1]
+    return data[start:max(start, end)]
+
+
+_BUFFER_TYPES = (bytes, bytearray, memoryview, mmap.mmap, np.ndarray)
+
+
+class _RandomAccessFile(object):
+    """Reads windows of a file name, a buffer or a seekable file object.
+
+    The position of a file object is restored on close(), so that it can
+    still be read through afterwards.
+    """
+
+    def __init__(self, source):
+        self._file = None
+        self._buffer = None
+        self._position = None
+        if isinstance(source, _BUFFER_TYPES):
+            self._buffer = np.frombuffer(source, dtype=np.uint8)
+            self.size = len(self._buffer)
+            return
+        if isinstance(source, (str, os.PathLike)):
+            source = self._file = open(source, 'rb')
+        else:
+            self._position = source.tell()
+        self._source = source
+        self.size = source.seek(0, os.SEEK_END)
+
+    def read(self, offset, size):
+        """Returns size bytes at offset, as a 1-D uint8 NumPy array."""
+        if self._buffer is not None:
+            return self._buffer[offset:offset + size]
+        self._source.seek(offset)
+        chunk = self._source.read(size)
+        return np.frombuffer(chunk, dtype=np.uint8)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        if self._position is not None:
+            self._source.seek(self._position)
+
+
+def is_random_access(source):
+    """Returns whether the windows of an IGC source can be read directly."""
+    if isinstance(source, _BUFFER_TYPES + (str, os.PathLike)):
+        return True
+    if not hasattr(source, 'seekable') or not hasattr(source, 'read'):
+        return False
+    try:
+        # Text files can not be seeked to arbitrary offsets.
+        return source.seekable() and not isinstance(source.read(0), str)
+    except ValueError:
+        return False
+
+
+def peek_records(source):
+    """Reads the header records and the first and last B records.
+
+    Random access sources (file names, buffers and seekable binary file
+    objects) are only read at their head, up to the first valid B record,
+    and at their tail, back to the last valid B record, through windows
+    starting at PEEK_SIZE bytes. Other sources are read through, but only
+    the first and last B records are decoded.
+
+    Args:
+        source: an IGC source, see iter_chunks()
+
+    Returns:
+        An (a_records, h_records, i_records, first_fix, last_fix) tuple.
+        The first three are lists of strings, the A, H and I records which
+        precede the first valid B record. first_fix and last_fix are
+        FixColumns of single values, None if there are no valid B records.
+    """
+    headers = {'A': [], 'H': [], 'I': []}
+    if is_random_access(source):
+        first_fix, last_fix = _peek_random_access(source, headers)
+    else:
+        first_fix, last_fix = _peek_stream(source, headers)
+    return headers['A'], headers['H'], headers['I'], first_fix, last_fix
+
+
+def _peek_random_access(source, headers):
+    igc_file = _RandomAccessFile(source)
+    try:
+        size = PEEK_SIZE
+        while True:
+            size = min(size, igc_file.size)
+            window = _trim_lines(igc_file.read(0, size), True,
+                                 size == igc_file.size)
+            for records in headers.values():
+                del records[:]
+            first_fix = _peek_head(window, headers)
+            if first_fix is not None or size == igc_file.size:
+                break
+            size *= 4
+
+        last_fix = None
+        size = PEEK_SIZE
+        while first_fix is not None:
+            size = min(size, igc_file.size)
+            window = _trim_lines(igc_file.read(igc_file.size - size, size),
+                                 size == igc_file.size, True)
+            last_fix = _peek_tail(window)
+            if last_fix is not None or size == igc_file.size:
+                break
+            size *= 4
+        return first_fix, last_fix
+    finally:
+        igc_file.close()
+
+
+def _peek_stream(source, headers):
+    first_fix = last_fix = None
+    for data in _iter_line_blocks(source, DEFAULT_CHUNK_SIZE):
+        if first_fix is None:
+            first_fix = _peek_head(data, headers)
+        if first_fix is not None:
+            last_fix = _peek_tail(data) or last_fix
+    return first_fix, last_fix
@@ -0,0 +1,39 @@
+"""Run-length segmentation of per-fix state arrays.
+
+The flying and circling states of a flight come as one flag per fix. The
+analysis works on their runs (takeoffs and landings, thermals, glides),
+found here as index ranges in a few NumPy passes instead of walking the
+fixes one by one.
+"""
+
+import numpy as np
+
+
+def runs(flags):
+    """Returns the runs of True values of a boolean array.
+
+    Args:
+        flags: a NumPy boolean array
+
+    Returns:
+        A (starts, ends) tuple of NumPy integer arrays: the index of the
+        first flag of each run and the index following its last flag.
+    """
+    flags = np.asarray(flags, dtype=np.bool_)
+    edges = np.flatnonzero(np.diff(flags.view(np.int8),
+                                   prepend=0, append=0))
+    return edges[0::2], edges[1::2]
+
+
+def fill(length, starts, ends):
+    """Returns a boolean array of a length, True over the given runs.
+
+    Args:
+        length: an integer, the length of the array
+        starts, ends: NumPy integer arrays, the ranges of the runs, see
+        runs(); runs may overlap
+    """
+    marks = np.zeros(length + 1, dtype=np.intp)
+    np.add.at(marks, starts, 1)
+    np.add.at(marks, ends, -1)
+    return np.cumsum(marks[:-1]) > 0
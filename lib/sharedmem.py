@@ -0,0 +1,99 @@
+"""Transfer of NumPy arrays between processes through shared memory.
+
+A worker process copies its result arrays into a single shared memory
+segment and sends back only a small descriptor (the name of the segment
+and the dtype, shape and offset of each array). The parent attaches the
+segment and gets views of the arrays, without copying nor unpickling
+them.
+
+A segment is owned by the worker until attached: attach_arrays() unlinks
+its name right away, the memory is freed once the last view is deleted.
+Descriptors that will never be attached must be passed to discard().
+A segment attached by several processes is not unlinked by them, its
+creator passes it to discard() once they all attached it.
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+# Alignment of the arrays in a segment, bytes.
+_ALIGNMENT = 64
+
+
+class _AttachedSegment(shared_memory.SharedMemory):
+    """A shared memory segment mapped as long as views of it exist.
+
+    SharedMemory.close() fails while NumPy arrays still use its buffer;
+    instead the mapping is released with the last of them.
+    """
+
+    def __del__(self):
+        pass
+
+
+def export_arrays(arrays):
+    """Copies arrays into a new shared memory segment.
+
+    Args:
+        arrays: a dict of NumPy arrays keyed on strings, of any dtype
+        but object
+
+    Returns:
+        A descriptor of the segment, a small picklable dict, to be passed
+        to attach_arrays() or discard().
+    """
+    arrays = dict((name, np.asarray(array)) for name, array in arrays.items())
+    layout = {}
+    size = 0
+    for name, array in arrays.items():
+        if array.dtype.hasobject:
+            raise ValueError("can not share the object array %r" % name)
+        size = -(-size // _ALIGNMENT) * _ALIGNMENT
+        layout[name] = (np.lib.format.dtype_to_descr(array.dtype),
+                        array.shape, size)
+        size += array.nbytes
+    segment = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        for name, array in arrays.items():
+            _, shape, offset = layout[name]
+            view = np.ndarray(shape, dtype=array.dtype, buffer=segment.buf,
+                              offset=offset)
+            view[...] = array
+            del view
+    except BaseException:
+        segment.close()
+        segment.unlink()
+        raise
+    segment.close()
+    return {'segment': segment.name, 'arrays': layout}
+
+
+def attach_arrays(descriptor, unlink=True):
+    """Returns the arrays of a segment created by export_arrays().
+
+    Args:
+        descriptor: a dict, returned by export_arrays()
+        unlink: a bool, whether to unlink the segment; False when other
+        processes attach it too
+
+    Returns:
+        A dict of writable NumPy arrays, views of the shared memory.
+    """
+    segment = _AttachedSegment(name=descriptor['segment'])
+    if unlink:
+        segment.unlink()
+    arrays = {}
+    for name, (descr, shape, offset) in descriptor['arrays'].items():
+        arrays[name] = np.ndarray(
+            tuple(shape), dtype=np.lib.format.descr_to_dtype(descr),
+            buffer=segment.buf, offset=offset)
+    return arrays
+
+
+def discard(descriptor):
+    """Frees a segment created by export_arrays(), without attaching it."""
+    segment = shared_memory.SharedMemory(name=descriptor['segment'])
+    segment.close()
+    segment.unlink()
@@ -1,84 +1,333 @@
+import collections
 import math
 
+import numpy as np
+
+
+def _read_only(values):
+    """Returns values as a read-only NumPy float array."""
+    array = np.array(values, dtype=np.float64)
+    array.flags.writeable = False
+    return array
+
+
+def _last_argmax(values):
+    """Returns the index of the last maximum of a list."""
+    best = 0
+    for i in range(1, len(values)):
+        if values[i] >= values[best]:
+            best = i
+    return best
+
 
 class SimpleViterbiDecoder(object):
     """A simple Viterbi algorightm implementation.
 
-    For Markov models with two hidden states and two emission letters. The
-    states and the emissions are represented by 0 and 1.
+    For Markov models with N hidden states and M emission letters. The
+    states are represented by 0 to N - 1, the emissions by 0 to M - 1.
+    The decoder does not change its parameters while decoding, an instance
+    can be reused and shared between threads.
     """
 
+    # Number of sequences from which decode_batch() runs the vectorized
+    # decoder, below it runs decode() on each sequence.
+    _MIN_BATCH = 8
+
     def __init__(self, init_probs, transition_probs, emission_probs):
         """Initializer for the class.
 
         Args:
-            init_probs: a vector of 2 floats, the initial probabilities
+            init_probs: a vector of N floats, the initial probabilities
             for the hidden states
-            transition_probs: a 2x2 matrix of floats, the transition
+            transition_probs: a NxN matrix of floats, the transition
             probabilities, from current hidden state to next hidden states
-            emission_probs: a 2x2 matrix of floats, the emission
+            emission_probs: a NxM matrix of floats, the emission
             probabilities, from current hidden state to emissions
         """
-        assert len(init_probs) == 2
-        assert len(transition_probs) == 2
-        assert list(map(len, transition_probs)) == [2, 2]
-        assert len(emission_probs) == 2
-        assert list(map(len, emission_probs)) == [2, 2]
+        states = len(init_probs)
+        assert states >= 1
+        assert len(transition_probs) == states
+        assert all(len(xs) == states for xs in transition_probs)
+        assert len(emission_probs) == states
+        letters = len(emission_probs[0])
+        assert all(len(xs) == letters for xs in emission_probs)
 
-        self._init_log = list(map(math.log, init_probs))
-        self._transition_log = [list(map(math.log, xs)) for xs in transition_probs]
-        self._emission_log = [list(map(math.log, xs)) for xs in emission_probs]
+        # math.log() rather than np.log(), so that the decoded states do
+        # not depend on the NumPy build.
+        self._init_log = _read_only(list(map(math.log, init_probs)))
+        self._transition_log = _read_only(
+            [list(map(math.log, xs)) for xs in transition_probs])
+        self._emission_log = _read_only(
+            [list(map(math.log, xs)) for xs in emission_probs])
+
+    @property
+    def states(self):
+        """The number of hidden states."""
+        return len(self._init_log)
 
     def decode(self, emissions):
         """Run the Viterbi decoder.
 
         Args:
-            emissions: a list of {0, 1} - the observed emissions
+            emissions: a list of integers - the observed emissions
 
         Returns:
-            a list of {0, 1} - the most likely sequence of hidden states
+            a list of integers - the most likely sequence of hidden states
         """
-        if not emissions:
+        if not len(emissions):
             # Edge case, handle empty list here, to simplify the algorithm
             return []
 
         N = len(emissions)
-        state_log = [[None, None] for i in range(N)]
-        backtrack_info = [[None, None] for i in range(N)]
+        states = range(self.states)
+        # Log-probabilities of the transitions to each state, and of each
+        # emission from every state.
+        transition_log = self._transition_log.T.tolist()
+        emission_log = self._emission_log.T.tolist()
+        backtrack_info = [0] * (N * self.states)
 
         # Forward pass, calculate the probabilities of states and the
         # back-tracking information.
 
         # The initial state probability estimates are treated separately
         # because these come from the initial distribution.
-        state_log[0] = self._init_log
-        state_log[0][0] += self._emission_log[0][emissions[0]]
-        state_log[0][1] += self._emission_log[1][emissions[0]]
+        state_log = [init_log + emission
+                     for init_log, emission in zip(
+                         self._init_log.tolist(),
+                         emission_log[int(emissions[0])])]
 
         # Successive state probability estimates are calculated using
-        # the log-probabilities in the transition matrix.
+        # the log-probabilities in the transition matrix. On ties, the
+        # path from the last state wins.
+        position = self.states
         for i in range(1, N):
+            emission = emission_log[int(emissions[i])]
+            next_state_log = []
+            for target in states:
+                from_log = transition_log[target]
+                best_state = 0
+                best_log = state_log[0] + from_log[0]
+                for source in states[1:]:
+                    log = state_log[source] + from_log[source]
+                    if log >= best_log:
+                        best_state = source
+                        best_log = log
+                backtrack_info[position] = best_state
+                position += 1
+                next_state_log.append(best_log + emission[target])
+            state_log = next_state_log
+
+        # Backward pass, find the most likely sequence of states.
+        state = _last_argmax(state_log)
+        states = [state]
+        for i in range(N - 1, 0, -1):
+            state = backtrack_info[i * self.states + state]
+            states.append(state)
+        states.reverse()
+
+        return states
+
+    def decode_batch(self, emissions, lengths=None):
+        """Run the Viterbi decoder on many sequences at once.
+
+        The forward and backward passes are vectorized across the
+        sequences, which pays off for batches of many sequences. The states
+        are the ones decode() returns for each sequence.
+
+        Args:
+            emissions: a list of sequences of integers, possibly of
+            different lengths, or a 2D integer array with one padded
+            sequence per row
+            lengths: with a 2D array, a vector of integers, the length of
+            each sequence; all the rows are decoded if None
+
+        Returns:
+            a list, per sequence, of lists of integers - the most likely
+            sequences of hidden states
+        """
+        if lengths is None and not isinstance(emissions, np.ndarray):
+            lengths = [len(sequence) for sequence in emissions]
+            padded = np.zeros((len(emissions), max(lengths, default=0)),
+                              dtype=np.intp)
+            for row, sequence in zip(padded, emissions):
+                row[:len(sequence)] = sequence
+            emissions = padded
+        emissions = np.asarray(emissions, dtype=np.intp)
+        assert emissions.ndim == 2
+        if lengths is None:
+            lengths = np.full(len(emissions), emissions.shape[1])
+        lengths = np.asarray(lengths, dtype=np.intp)
+        assert lengths.shape == (len(emissions),)
+        assert np.all(lengths <= emissions.shape[1])
+
+        if len(emissions) < self._MIN_BATCH:
+            return [self.decode(sequence[:length])
+                    for sequence, length in zip(emissions, lengths)]
+        return self._decode_vectorized(emissions, lengths)
+
+    def _decode_vectorized(self, emissions, lengths):
+        """decode_batch() on padded emissions, vectorized across them."""
+        batch, steps = emissions.shape
+        if steps == 0:
+            return [[] for _ in range(batch)]
+        rows = np.arange(batch)
+        # Reversed states, so that argmax() finds the last maximum.
+        reversed_transition_log = self._transition_log[::-1]
+        # Emission log-probabilities, per sequence, step and state.
+        padding = np.arange(steps) >= lengths[:, np.newaxis]
+        emission_log = self._emission_log.T[
+            np.where(padding, 0, emissions)]
+        backtrack_info = np.zeros((batch, steps, self.states), dtype=np.intp)
+
+        state_log = self._init_log + emission_log[:, 0]
+        for i in range(1, steps):
+            from_log = (state_log[:, ::-1, np.newaxis] +
+                        reversed_transition_log)
+            best_state = from_log.argmax(axis=1)
+            next_state_log = (
+                np.take_along_axis(from_log, best_state[:, np.newaxis],
+                                   axis=1)[:, 0] + emission_log[:, i])
+            backtrack_info[:, i] = self.states - 1 - best_state
+            # Sequences that ended keep their last state log-probabilities.
+            ongoing = i < lengths
+            state_log = np.where(ongoing[:, np.newaxis], next_state_log,
+                                 state_log)
+
+        state = self.states - 1 - state_log[:, ::-1].argmax(axis=1)
+        decoded = np.zeros((batch, steps), dtype=np.intp)
+        for i in range(steps - 1, -1, -1):
+            ongoing = i < lengths
+            decoded[ongoing, i] = state[ongoing]
+            state = np.where(ongoing, backtrack_info[rows, i, state], state)
+        return [states[:length].tolist()
+                for states, length in zip(decoded, lengths)]
+
+
+class OnlineViterbiDecoder(SimpleViterbiDecoder):
+    """A Viterbi decoder for emissions that arrive one at a time.
+
+    For Markov models with two hidden states. Only the back-tracking
+    information of the undecided states is kept.
+    A state is decided as soon as the most likely paths ending in both
+    current states agree on it, in which case it is the state the full
+    decoder would return. A state still undecided max_lag emissions later
+    is taken from the currently most likely path.
+    """
+
+    def __init__(self, init_probs, transition_probs, emission_probs,
+                 max_lag):
+        """Initializer for the class.
+
+        Args:
+            init_probs, transition_probs, emission_probs: the parameters
+            of the model, see SimpleViterbiDecoder
+            max_lag: an integer, the maximum number of emissions between
+            an emission and the decision of its hidden state
+        """
+        super(OnlineViterbiDecoder, self).__init__(
+            init_probs, transition_probs, emission_probs)
+        assert self.states == 2
+        assert max_lag >= 1
+        # Python floats are faster than NumPy scalars, one emission at
+        # a time; decode() and decode_batch() still use the arrays.
+        self._online_init_log = self._init_log.tolist()
+        self._online_transition_log = self._transition_log.tolist()
+        self._online_emission_log = self._emission_log.tolist()
+        self._max_lag = max_lag
+        self._state_log = None
+        # Back-tracking information of the undecided states; the first
+        # entry is not used, its state only depends on later ones.
+        self._backtrack = collections.deque()
+
+    def push(self, emission):
+        """Adds an emission.
+
+        Args:
+            emission: 0 or 1, the next observed emission
+
+        Returns:
+            a list of {0, 1} - the hidden states decided by this emission,
+            following the states decided before
+        """
+        if self._state_log is None:
+            self._state_log = [
+                self._online_init_log[0] +
+                self._online_emission_log[0][emission],
+                self._online_init_log[1] +
+                self._online_emission_log[1][emission]]
+            self._backtrack.append(None)
+        else:
+            state_log = [None, None]
+            backtrack_info = [None, None]
+            transition_log = self._online_transition_log
             for target in [0, 1]:
-                from_0 = state_log[i - 1][0] + self._transition_log[0][target]
-                from_1 = state_log[i - 1][1] + self._transition_log[1][target]
-                emission_log = self._emission_log[target][emissions[i]]
+                from_0 = self._state_log[0] + transition_log[0][target]
+                from_1 = self._state_log[1] + transition_log[1][target]
+                emission_log = self._online_emission_log[target][emission]
                 if from_0 > from_1:
-                    backtrack_info[i][target] = 0
-                    state_log[i][target] = from_0 + emission_log
+                    backtrack_info[target] = 0
+                    state_log[target] = from_0 + emission_log
                 else:
-                    backtrack_info[i][target] = 1
-                    state_log[i][target] = from_1 + emission_log
+                    backtrack_info[target] = 1
+                    state_log[target] = from_1 + emission_log
+            self._state_log = state_log
+            self._backtrack.append(backtrack_info)
 
-        # Backward pass, find the most likely sequence of states.
-        if state_log[N - 1][0] > state_log[N - 1][1]:
+        # Trace the paths ending in both states back until they merge,
+        # all states before the merge are decided.
+        backtrack = self._backtrack
+        path_0, path_1 = 0, 1
+        for i in range(len(backtrack) - 1, 0, -1):
+            path_0 = backtrack[i][path_0]
+            path_1 = backtrack[i][path_1]
+            if path_0 == path_1:
+                return self._pop_states(i, path_0)
+
+        if len(backtrack) > self._max_lag:
+            return self._pop_states(len(backtrack) - self._max_lag,
+                                    self._best_path_state(
+                                        len(backtrack) - self._max_lag - 1))
+        return []
+
+    def flush(self):
+        """Decides all the remaining states, at the end of the emissions.
+
+        Returns:
+            a list of {0, 1} - the hidden states decided, following the
+            states decided before
+        """
+        if not self._backtrack:
+            return []
+        states = self._pop_states(len(self._backtrack),
+                                  self._best_path_state(
+                                      len(self._backtrack) - 1))
+        self._state_log = None
+        return states
+
+    def _best_path_state(self, position):
+        """Returns the state at an undecided position of the best path."""
+        if self._state_log[0] > self._state_log[1]:
             state = 0
         else:
             state = 1
+        for i in range(len(self._backtrack) - 1, position, -1):
+            state = self._backtrack[i][state]
+        return state
 
-        states = [state]
-        for i in range(N - 1, 0, -1):
-            state = backtrack_info[i][state]
-            states.append(state)
-        states.reverse()
+    def _pop_states(self, count, last_state):
+        """Decides the first `count` undecided states.
 
+        Args:
+            count: an integer, the number of states to decide
+            last_state: 0 or 1, the state of the last of them
+        """
+        states = [last_state]
+        for i in range(count - 1, 0, -1):
+            states.append(self._backtrack[i][states[-1]])
+        states.reverse()
+        for i in range(count):
+            self._backtrack.popleft()
+        if self._backtrack and count:
+            # Keep the first entry unused, see __init__().
+            self._backtrack[0] = None
         return states
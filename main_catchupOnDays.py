@@ -5,11 +5,14 @@ from datetime import date, timedelta
 
 import  main_heatmap 
 import  main_tracemap
+import igc_lib
 
 
 start_date = date(2020, 11, 1)
 end_date = date(2020, 11, 30)
 delta = timedelta(days=1)
+# The runs of consecutive days parse many files again
+flightCache = igc_lib.get_flight_cache()
 
 while start_date <= end_date:
     targetDate = start_date.strftime("%Y_%m_%d")
@@ -19,8 +22,8 @@ while start_date <= end_date:
     request = Request()
     request.args = {"targetDate": targetDate}
 
-    #main_tracemap.main(request)
-    main_heatmap.main(request)
+    #main_tracemap.main(request, flightCache)
+    main_heatmap.main(request, flightCache)
 
     start_date += delta
 
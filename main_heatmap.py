@@ -31,6 +31,8 @@ def main_catchup(request):
     end_date = datetime.datetime.now(tz)
     start_date = end_date - timedelta(days=PAST_DAYS_TO_CATCHUP)
 
+    # The runs of consecutive days parse many files again
+    flightCache = igc_lib.get_flight_cache()
     for dt in rrule(DAILY, dtstart=start_date, until=end_date):
         targetDate = dt.strftime("%Y_%m_%d")
         print(f"[HeatmapkBuilder] Catching up for targetDate={targetDate}")
@@ -39,9 +41,9 @@ def main_catchup(request):
         request = Request()
         request.args = {"targetDate": targetDate}
 
-        main(request)
+        main(request, flightCache)
 
-def main(request):
+def main(request, flightCache=None):
     '''
     Args:
         day=yyyy_mm_dd: The yyyy_mm_dd for which to do the processing
@@ -49,6 +51,7 @@ def main(request):
             This is used to consolidate the processing on day d+1 with files that were submitted after day d.
             Example: When executed with -1 on Tuesday this will get the flights from Monday, and also the fligths from Tuesday and look up
             inside the IGC to see if the flight was done on monday. Will then take it into account
+        flightCache: Optional igc_lib.FlightCache, igc_lib.get_flight_cache() by default
     '''
 
     # Get current time in the right time-zone
@@ -116,7 +119,7 @@ def main(request):
     if isUpdateNeeded:
         # --- Start the process
         ftp_client_credentials = ServerCredentials(ftp_server_name, ftp_login, ftp_password)
-        heatmapBuilder = HeatmapBuilder(ftp_client_credentials, target_date, currentFilesList)
+        heatmapBuilder = HeatmapBuilder(ftp_client_credentials, target_date, currentFilesList, flightCache=flightCache or igc_lib.get_flight_cache())
 
         # Run !
         heatmapBuilder.run()